@@ -0,0 +1,160 @@
+# aggregates.py
+"""Recompute the aggregate tables the dashboards read, from results.
+
+quiz_submit keeps question_stats, test_stats and the trainee progress
+rollups current one attempt at a time. The functions here rebuild them in
+bulk: the schema migrations call them to count attempts recorded before
+the tables existed, and app.rebuild_stats (`flask rebuild-stats`) uses
+them to repair the aggregates after manual edits. The SQL runs on either repository backend.
+"""
+import math
+
+# Score distribution bands shown on the results dashboard, in display order.
+SCORE_BUCKETS = ("100", "75plus", "50to75", "below50")
+
+
+def score_bucket(score, total):
+    pct = (score / (total or 1)) * 100.0
+    if math.isclose(pct, 100.0, rel_tol=1e-9):
+        return "100"
+    if pct >= 75.0:
+        return "75plus"
+    if pct >= 50.0:
+        return "50to75"
+    return "below50"
+
+
+def rebuild_dashboard_stats(cur, test_id=None):
+    """Recompute question_stats/test_stats for one test or all of them. Returns the results rows counted."""
+    where, params = ("test_id = ?", (test_id,)) if test_id is not None else ("1 = 1", ())
+    cur.execute(f"DELETE FROM test_stats WHERE {where}", params)
+    cur.execute(f"DELETE FROM question_stats WHERE {where}", params)
+
+    cur.execute(f"""
+        INSERT INTO question_stats (question_id, test_id, attempts, correct)
+        SELECT q.id, q.test_id, COUNT(*), SUM(ra.is_correct)
+        FROM questions q
+        JOIN result_answers ra ON ra.question_id = q.id
+        WHERE {"q." + where if test_id is not None else where} AND ra.selected_mask <> 0
+        GROUP BY q.id
+    """, params)
+
+    # one row per distinct (score, total) pair, so this stays small
+    cur.execute(f"""
+        SELECT test_id, score, total, COUNT(*) AS cnt
+        FROM results WHERE {where}
+        GROUP BY test_id, score, total
+    """, params)
+    per_test = {}
+    for row_test_id, score, total, cnt in cur.fetchall():
+        counts = per_test.setdefault(row_test_id, dict.fromkeys(SCORE_BUCKETS, 0))
+        counts[score_bucket(score, total)] += cnt
+    cur.executemany("""
+        INSERT INTO test_stats (test_id, participants, bucket_100, bucket_75plus, bucket_50to75, bucket_below50)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [(tid, sum(c.values()), *(c[b] for b in SCORE_BUCKETS)) for tid, c in per_test.items()])
+    return sum(sum(c.values()) for c in per_test.values())
+
+
+def rebuild_enrolment_stats(cur, test_id=None):
+    """Recompute test_stats.enrolled/enrolled_participants from test_enrolments; one results seek per enrolment."""
+    where, params = ("test_id = ?", (test_id,)) if test_id is not None else ("1 = 1", ())
+    cur.execute(f"UPDATE test_stats SET enrolled = 0, enrolled_participants = 0 WHERE {where}", params)
+    cur.execute(f"""
+        INSERT INTO test_stats (test_id, enrolled, enrolled_participants)
+        SELECT e.test_id, COUNT(*),
+               SUM(CASE WHEN EXISTS (SELECT 1 FROM results r
+                                     WHERE r.test_id = e.test_id AND r.trainee_id = e.trainee_id)
+                        THEN 1 ELSE 0 END)
+        FROM test_enrolments e
+        WHERE {"e." + where if test_id is not None else where}
+        GROUP BY e.test_id
+        ON CONFLICT(test_id) DO UPDATE SET
+            enrolled = excluded.enrolled,
+            enrolled_participants = excluded.enrolled_participants
+    """, params)
+
+
+# ---------------- Trainee progress (trainee_test_stats / trainee_stats)
+PROGRESS_COLUMNS = ("trainee_id", "test_id", "attempts", "best_score", "best_total", "best_pct", "best_at",
+                    "latest_score", "latest_total", "latest_pct", "latest_at", "score_sum", "total_sum")
+# the trainee_test_stats column that counts towards points, by tests.score_policy
+COUNTED_SCORE = {"best": "best_score", "latest": "latest_score"}
+
+
+def score_pct(score, total):
+    return score * 100.0 / total if total else 0.0
+
+
+def progress_row(trainee_id, test_id, attempts):
+    """A trainee_test_stats row from (score, total, attempted_at) tuples."""
+    attempts = sorted(attempts, key=lambda a: a[2])
+    best = max(attempts, key=lambda a: score_pct(a[0], a[1]))  # max keeps the earliest of equals
+    latest = attempts[-1]
+    return {
+        "trainee_id": trainee_id, "test_id": test_id, "attempts": len(attempts),
+        "best_score": best[0], "best_total": best[1], "best_pct": score_pct(best[0], best[1]), "best_at": best[2],
+        "latest_score": latest[0], "latest_total": latest[1], "latest_pct": score_pct(latest[0], latest[1]),
+        "latest_at": latest[2],
+        "score_sum": sum(a[0] for a in attempts), "total_sum": sum(a[1] for a in attempts),
+    }
+
+
+def write_progress_rows(cur, rows):
+    """Upsert progress_row() dicts into trainee_test_stats."""
+    columns = ", ".join(PROGRESS_COLUMNS)
+    cur.executemany(f"""
+        INSERT INTO trainee_test_stats ({columns}) VALUES ({", ".join("?" for _ in PROGRESS_COLUMNS)})
+        ON CONFLICT(trainee_id, test_id) DO UPDATE SET
+            {", ".join(f"{c} = excluded.{c}" for c in PROGRESS_COLUMNS[2:])}
+    """, [tuple(r[c] for c in PROGRESS_COLUMNS) for r in rows])
+
+
+def refresh_trainee_totals(cur, trainee_ids=None):
+    """Recompute trainee_stats from trainee_test_stats for trainee_ids (all trainees if None)."""
+    select = """
+        INSERT INTO trainee_stats (trainee_id, tests_taken, attempts, points, score_sum, total_sum, last_attempt_at)
+        SELECT s.trainee_id, COUNT(*), SUM(s.attempts),
+               SUM(CASE WHEN t.score_policy = 'latest' THEN s.latest_score ELSE s.best_score END),
+               SUM(s.score_sum), SUM(s.total_sum), MAX(s.latest_at)
+        FROM trainee_test_stats s
+        JOIN tests t ON t.id = s.test_id
+    """
+    if trainee_ids is None:
+        cur.execute("DELETE FROM trainee_stats")
+        cur.execute(select + " GROUP BY s.trainee_id")
+        return
+    trainee_ids = sorted(set(trainee_ids))
+    for i in range(0, len(trainee_ids), 500):
+        chunk = trainee_ids[i:i + 500]
+        placeholders = ",".join("?" for _ in chunk)
+        cur.execute(f"DELETE FROM trainee_stats WHERE trainee_id IN ({placeholders})", chunk)
+        cur.execute(select + f" WHERE s.trainee_id IN ({placeholders}) GROUP BY s.trainee_id", chunk)
+
+
+def rebuild_trainee_progress(cur, test_id=None):
+    """Recompute the rollups from results, for one test or all of them. Returns the pairs written."""
+    where, params = ("WHERE test_id = ?", (test_id,)) if test_id is not None else ("", ())
+    affected = {r[0] for r in cur.execute(f"SELECT trainee_id FROM trainee_test_stats {where}", params).fetchall()}
+    cur.execute(f"DELETE FROM trainee_test_stats {where}", params)
+    cur.execute(f"""
+        SELECT trainee_id, test_id, score, total, attempted_at FROM results
+        {where + " AND" if where else "WHERE"} trainee_id IS NOT NULL
+        ORDER BY trainee_id, test_id
+    """, params)
+    rows, group, key = [], [], None
+    while True:
+        batch = cur.fetchmany(10000)
+        for trainee_id, row_test_id, score, total, attempted_at in batch:
+            if (trainee_id, row_test_id) != key:
+                if group:
+                    rows.append(progress_row(*key, group))
+                key, group = (trainee_id, row_test_id), []
+            group.append((score, total, attempted_at))
+        if not batch:
+            break
+    if group:
+        rows.append(progress_row(*key, group))
+    write_progress_rows(cur, rows)
+    refresh_trainee_totals(cur, None if test_id is None else affected | {r["trainee_id"] for r in rows})
+    return len(rows)
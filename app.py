@@ -1,55 +1,463 @@
 import os
 import re
-import csv
-import io
-import math
 import json
+import base64
 import random
+import secrets
 import sqlite3
 from datetime import datetime, timedelta
 import string
+import click
 from flask import (
-    Flask, g, render_template, request, redirect, url_for, flash, session, abort
+    Flask, g, render_template, request, redirect, url_for, flash, session, abort, jsonify,
+    Response, stream_with_context
+)
+from init_db import answer_mask
+from question_cache import QuestionBankCache
+from aggregates import SCORE_BUCKETS, score_bucket, rebuild_dashboard_stats, rebuild_enrolment_stats
+from repository import open_repository, DuplicateError
+import metrics
+from submission_writer import GroupCommitWriter, SubmissionError
+from quiz_sessions import MemorySessionStore, SQLiteSessionStore
+from sampling import (
+    STRATIFY_FIELDS, SamplingConfig, draw_rng, draw_positions, option_orders, present, remap_mask
+)
+from attempt_policy import SCORE_POLICIES, AttemptPolicy
+from question_import import import_questions, parse_question_row
+from regrade import regrade_test, regrade_question
+from jobs import JobRunner, JobFailed
+from roster import ROSTER_FORMATS, roster_format, import_roster, export_roster
+from enrolment import enrol_trainees, iter_pasted_ids, iter_file_ids
+from dashboard_cache import DashboardCache, dashboard_etag
+from live_updates import LivePublisher, sse_frame
+from item_analysis import ItemAnalysisCache
+from result_export import (
+    EXPORT_FORMATS, EXPORT_LAYOUTS, export_rows, stream_csv, stream_xlsx, xlsxwriter
 )
 
 # Configuration
-DB_PATH = "quiz.db"
+DB_PATH = os.environ.get("QUIZ_DB_PATH", "quiz.db")
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET", "replace-with-secure-secret")
 TRAINER_PASSWORD = os.environ.get("TRAINER_PASSWORD", "trainer123")  # change in env for production
 
-# ---------------- Database helper (per-request connection, WAL, timeout)
+# Per-test question bank snapshots used by quiz_start/quiz_submit
+question_banks = QuestionBankCache(
+    max_entries=int(os.environ.get("QBANK_CACHE_ENTRIES", "64")),
+    max_bytes=int(os.environ.get("QBANK_CACHE_MB", "64")) * 1024 * 1024,
+)
+
+# Results dashboard payloads, keyed by tests.dashboard_version
+dashboard_cache = DashboardCache(
+    max_entries=int(os.environ.get("DASHBOARD_CACHE_ENTRIES", "256")),
+    ttl=int(os.environ.get("DASHBOARD_CACHE_TTL", "300")),
+)
+
+# Item analysis (difficulty, discrimination, distractors, alpha) per test,
+# rebuilt on a version gap and otherwise advanced by committed submissions
+item_analysis = ItemAnalysisCache(max_entries=int(os.environ.get("ITEM_ANALYSIS_CACHE_ENTRIES", "64")))
+
+# Server-sent events for open results dashboards, fed by the submission writer
+live_updates = LivePublisher(max_pending=int(os.environ.get("LIVE_QUEUE_SIZE", "256")))
+LIVE_HEARTBEAT_SECONDS = int(os.environ.get("LIVE_HEARTBEAT_SECONDS", "15"))
+
+# Opt-in request/SQL/template timing exposed at /metrics (QUIZ_METRICS=1)
+METRICS_ENABLED = os.environ.get("QUIZ_METRICS", "0") == "1"
+request_metrics = None
+if METRICS_ENABLED:
+    request_metrics = metrics.enable(
+        app,
+        slow_query_ms=float(os.environ.get("SLOW_QUERY_MS", "100")),
+        slow_request_ms=float(os.environ.get("SLOW_REQUEST_MS", "1000")),
+    )
+
+# ---------------- Database helper (pooled connections, checked out per request)
+# SQL for tests, questions, trainees and results lives in repository.py;
+# QUIZ_DB_BACKEND picks SQLite (default) or PostgreSQL at QUIZ_DATABASE_URL.
+# Connections are configured once by the pools; requests borrow one via g and
+# teardown returns it. Reads that never write use the read-only pool.
+# Each worker process has its own pools, so DB_CACHE_MB is per connection per worker.
+repo = open_repository(
+    backend=os.environ.get("QUIZ_DB_BACKEND", "sqlite"),
+    db_path=DB_PATH,
+    database_url=os.environ.get("QUIZ_DATABASE_URL", ""),
+    writers=int(os.environ.get("DB_POOL_WRITERS", "2")),
+    readers=int(os.environ.get("DB_POOL_READERS", "8")),
+    factory=metrics.TimedConnection if METRICS_ENABLED else sqlite3.Connection,
+    cache_size_kib=int(os.environ.get("DB_CACHE_MB", "16")) * 1024,
+)
+db_writer_pool, db_reader_pool = repo.writer_pool, repo.reader_pool
+
 def get_db_connection():
     if "db_conn" not in g:
-        # timeout allows SQLite to wait for locks rather than immediate failure
-        conn = sqlite3.connect(DB_PATH, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES)
-        conn.row_factory = sqlite3.Row
-        # improve concurrency for small deployments
-        conn.execute("PRAGMA journal_mode=WAL;")
-        conn.execute("PRAGMA synchronous=NORMAL;")
-        g.db_conn = conn
+        g.db_conn = db_writer_pool.acquire()
     return g.db_conn
 
+def get_read_connection():
+    if "db_read_conn" not in g:
+        g.db_read_conn = db_reader_pool.acquire()
+    return g.db_read_conn
+
 @app.teardown_appcontext
 def close_db_connection(exception):
     conn = g.pop("db_conn", None)
     if conn is not None:
-        conn.close()
+        db_writer_pool.release(conn)
+    conn = g.pop("db_read_conn", None)
+    if conn is not None:
+        db_reader_pool.release(conn)
+
+# Graded submissions are group-committed by one background writer thread;
+# SUBMIT_QUEUE=0 writes them inline on the request connection instead.
+submission_writer = GroupCommitWriter(
+    db_writer_pool.open_connection,
+    repo.record_submission,
+    batch_size=int(os.environ.get("SUBMIT_BATCH_SIZE", "64")),
+    max_wait=int(os.environ.get("SUBMIT_BATCH_WAIT_MS", "0")) / 1000.0,
+    max_queue=int(os.environ.get("SUBMIT_QUEUE_MAX", "5000")),
+    enabled=os.environ.get("SUBMIT_QUEUE", "1") != "0",
+    on_commit=lambda sub, result_id: submission_committed(sub, result_id),
+)
+
+# In-progress quizzes live server-side; the cookie only carries quiz_sid.
+# "sqlite" survives restarts and works across worker processes, "memory"
+# is a per-process LRU. Sessions expire SUBMIT_GRACE_SECONDS after the
+# quiz deadline, which is what enforces the timer on submit.
+SUBMIT_GRACE_SECONDS = int(os.environ.get("SUBMIT_GRACE_SECONDS", "30"))
+if os.environ.get("QUIZ_SESSION_STORE", "sqlite") == "memory":
+    quiz_sessions = MemorySessionStore(
+        max_entries=int(os.environ.get("QUIZ_SESSION_CACHE", "10000")),
+        sweep_interval=int(os.environ.get("QUIZ_SESSION_SWEEP_SECONDS", "60")),
+    )
+else:
+    quiz_sessions = SQLiteSessionStore(
+        db_writer_pool, db_reader_pool,
+        max_entries=int(os.environ.get("QUIZ_SESSION_CACHE", "10000")),
+        sweep_interval=int(os.environ.get("QUIZ_SESSION_SWEEP_SECONDS", "60")),
+    )
+
+# Heavy trainer actions (question imports, test deletes, answer-key regrades)
+# are queued in the jobs table and run by QUIZ_JOB_WORKERS threads per process.
+# Between transactions they wait while trainee submissions are queued.
+job_runner = JobRunner(
+    db_writer_pool.open_connection,
+    workers=int(os.environ.get("QUIZ_JOB_WORKERS", "1")),
+    poll_interval=float(os.environ.get("JOB_POLL_SECONDS", "1")),
+    max_attempts=int(os.environ.get("JOB_MAX_ATTEMPTS", "3")),
+    stale_seconds=int(os.environ.get("JOB_STALE_SECONDS", "900")),
+    busy=lambda: submission_writer.stats()["queue_depth"] > 0,
+    lock=repo.lock_job_queue,
+)
+# uploads wait here for their import job
+JOB_SPOOL_DIR = os.environ.get("QUIZ_JOB_SPOOL") or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)),
+                                                                 "job_spool")
+REGRADE_CHUNK_SIZE = int(os.environ.get("REGRADE_CHUNK_SIZE", "500"))
+DELETE_CHUNK_SIZE = int(os.environ.get("DELETE_CHUNK_SIZE", "1000"))
 
 # ---------------- Utilities
 def is_valid_test_code(code):
     return bool(re.fullmatch(r"[A-Za-z0-9]{6}", code))
 
 def generate_unique_code(conn):
-    cur = conn.cursor()
     chars = string.ascii_uppercase + string.digits  # A-Z, 0-9
     for _ in range(2000):
         cand = ''.join(random.choices(chars, k=6))
-        cur.execute("SELECT 1 FROM tests WHERE test_code = ?", (cand,))
-        if not cur.fetchone():
+        if not repo.test_code_exists(conn, cand):
             return cand
     raise RuntimeError("Unable to generate unique test code")
 
+# ---------------- Keyset pagination helpers
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+def decode_cursor(token):
+    """Inverse of encode_cursor; None for a missing or malformed token."""
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except ValueError:
+        return None
+    return values if isinstance(values, list) and len(values) == 2 else None
+
+def page_args():
+    """(cursor values, search text, limit) from the query string."""
+    try:
+        limit = min(max(int(request.args.get("limit", PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        limit = PAGE_SIZE
+    return decode_cursor(request.args.get("cursor")), (request.args.get("q") or "").strip(), limit
+
+def like_pattern(text):
+    escaped = text.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+def fetch_attempts_page(conn, test_id, cursor=None, q="", limit=PAGE_SIZE):
+    """One page of attempts, newest first (see Repository.attempts_page)."""
+    rows = repo.attempts_page(conn, test_id, cursor, like_pattern(q) if q else None, limit + 1)
+    items = [dict(r) for r in rows[:limit]]
+    next_cursor = encode_cursor(items[-1]["attempted_at"], items[-1]["id"]) if len(rows) > limit else None
+    return items, next_cursor
+
+def fetch_trainees_page(conn, cursor=None, q="", limit=PAGE_SIZE):
+    """One page of trainees, newest first, keyed on (created_at, id)."""
+    rows = repo.trainees_page(conn, cursor, like_pattern(q) if q else None, limit + 1)
+    items = [dict(r) for r in rows[:limit]]
+    next_cursor = encode_cursor(items[-1]["created_at"] or "", items[-1]["id"]) if len(rows) > limit else None
+    return items, next_cursor
+
+def fetch_enrolment_page(conn, test_id, cursor=None, q="", limit=PAGE_SIZE, missing_only=False):
+    """One page of a test's enrolled trainees, newest enrolment first, keyed on (enrolled_at, trainee_id)."""
+    rows = repo.enrolment_page(conn, test_id, cursor, like_pattern(q) if q else None, limit + 1, missing_only)
+    items = [dict(r, attempted=bool(r["attempted"])) for r in rows[:limit]]
+    next_cursor = encode_cursor(items[-1]["enrolled_at"], items[-1]["id"]) if len(rows) > limit else None
+    return items, next_cursor
+
+# ---------------- Analytics aggregates (question_stats / test_stats)
+# SCORE_BUCKETS and score_bucket live in aggregates.py, the per-attempt upserts in repository.py.
+def apply_regrade_chunk(cur, test_id, question_id, changes):
+    """Apply regraded answers [(result_id, is_correct)] for one question.
+
+    Only answers whose outcome flips are touched; their attempts' scores and
+    score buckets and the question's correct count move by the same deltas in
+    the caller's transaction, and the trainees' progress rollups are recomputed.
+    Returns how many attempts changed.
+    """
+    bucket_deltas = dict.fromkeys(SCORE_BUCKETS, 0)
+    correct_delta = changed = 0
+    trainees = set()
+    for result_id, ok in changes:
+        cur.execute("""
+            UPDATE result_answers SET is_correct = ?
+            WHERE result_id = ? AND question_id = ? AND is_correct <> ?
+        """, (ok, result_id, question_id, ok))
+        if not cur.rowcount:
+            continue
+        delta = 1 if ok else -1
+        correct_delta += delta
+        changed += 1
+        new_score, total, trainee_id = cur.execute(
+            "UPDATE results SET score = score + ? WHERE id = ? RETURNING score, total, trainee_id",
+            (delta, result_id)).fetchone()
+        trainees.add(trainee_id)
+        old_bucket, new_bucket = score_bucket(new_score - delta, total), score_bucket(new_score, total)
+        if old_bucket != new_bucket:
+            bucket_deltas[old_bucket] -= 1
+            bucket_deltas[new_bucket] += 1
+    if changed:
+        cur.execute(f"""
+            UPDATE test_stats SET {", ".join(f"bucket_{b} = bucket_{b} + ?" for b in SCORE_BUCKETS)}
+            WHERE test_id = ?
+        """, (*bucket_deltas.values(), test_id))
+        cur.execute("UPDATE question_stats SET correct = correct + ? WHERE question_id = ?", (correct_delta, question_id))
+        repo.refresh_trainee_progress(cur, [(trainee_id, test_id) for trainee_id in trainees])
+        repo.bump_dashboard_version(cur, test_id)
+    return changed
+
+def rebuild_stats(conn, test_id=None):
+    """Recompute question_stats/test_stats (enrolment counters included) and the trainee progress rollups.
+
+    The schema migrations backfill existing databases; this repairs the
+    aggregates after manual edits. Pass test_id to rebuild a single test.
+    Returns the number of results rows processed.
+    """
+    cur = conn.cursor()
+    processed = rebuild_dashboard_stats(cur, test_id)
+    rebuild_enrolment_stats(cur, test_id)
+    repo.rebuild_trainee_progress(cur, test_id)
+    where, params = ("id = ?", (test_id,)) if test_id is not None else ("1 = 1", ())
+    cur.execute(f"UPDATE tests SET dashboard_version = dashboard_version + 1 WHERE {where}", params)
+    conn.commit()
+    return processed
+
+def submission_committed(sub, result_id):
+    """Called by the submission writer once an attempt is durable."""
+    if result_id is None:
+        # a replayed submission of an attempt that was already recorded; nothing changed
+        return
+    item_analysis.apply(sub)
+    publish_submission(sub, result_id)
+
+def publish_submission(sub, result_id):
+    """Push a committed attempt to the open results dashboards of its test.
+
+    The event is the attempt's increment to the chart data, so viewers apply
+    it in place instead of refetching.
+    """
+    live_updates.publish(sub["test_id"], "attempt", {
+        "version": sub["dashboard_version"],
+        "bucket": SCORE_BUCKETS.index(score_bucket(sub["score"], sub["total"])),
+        "questions": [[qid, 1 if ok else 0] for qid, ok in sub["question_results"]],
+        "attempt": {
+            "id": result_id,
+            "emp_id": sub["trainee_emp_id"],
+            "trainee_name": sub["trainee_name"],
+            "score": sub["score"],
+            "total": sub["total"],
+            "attempted_at": sub["attempted_at"],
+        },
+        # an enrolled trainee's first attempt moves them from non-participant to participant
+        "new_participant": sub.get("new_participant", False),
+    }, event_id=sub["dashboard_version"])
+
+# ---------------- Background job handlers (see jobs.py)
+def job_lane(test_id):
+    # one lane per test: its imports, regrades and delete run in the order they were queued
+    return f"test:{test_id}"
+
+def run_question_import(ctx):
+    """Import a spooled question CSV; all-or-nothing, so it can stop at any chunk."""
+    params = ctx.params
+    test_id = params["test_id"]
+    conn = db_writer_pool.open_connection()
+    try:
+        if not repo.get_test(conn, test_id):
+            raise JobFailed("Test not found.")
+        if not os.path.exists(params["path"]):
+            # removed when the job last finished; a retry needs a fresh upload
+            raise JobFailed("The uploaded file is no longer available; upload it again.")
+        with open(params["path"], "rb") as fh:
+            size = os.fstat(fh.fileno()).st_size
+
+            def chunk_done():
+                # the import's write transaction is open; keep progress in memory (the
+                # runner's heartbeat thread keeps the job from looking stale meanwhile)
+                ctx.progress(fh.tell(), size, persist=False)
+                ctx.check_cancelled()
+
+            report = import_questions(conn, test_id, fh, dry_run=params["dry_run"],
+                                      skip_duplicates=params["skip_duplicates"], insert=repo.insert_questions,
+                                      on_chunk=chunk_done)
+        result = {"filename": params.get("filename"), "dry_run": params["dry_run"], "rows": report.rows,
+                  "inserted": report.inserted, "skipped": report.skipped,
+                  "rows_per_sec": round(report.rows_per_sec), "errors": report.error_messages()}
+        if not report.ok:
+            raise JobFailed("Error importing CSV; nothing was imported.", result)
+        if not params["dry_run"]:
+            question_banks.invalidate(test_id)
+            repo.bump_dashboard_version(conn.cursor(), test_id)
+            conn.commit()
+        ctx.progress(size, size)
+        return result
+    finally:
+        conn.close()
+
+def remove_spooled_upload(params):
+    try:
+        os.remove(params["path"])
+    except FileNotFoundError:
+        pass
+
+def run_test_delete(ctx):
+    """Delete a test, its attempts first in DELETE_CHUNK_SIZE transactions."""
+    test_id = ctx.params["test_id"]
+    conn = db_writer_pool.open_connection()
+    try:
+        total = repo.count_test_results(conn, test_id)
+        deleted = 0
+        while True:
+            n = repo.delete_test_results(conn, test_id, DELETE_CHUNK_SIZE)
+            if not n:
+                break
+            deleted += n
+            ctx.progress(deleted, total)
+            ctx.pause()
+        repo.delete_test(conn, test_id)
+        question_banks.invalidate(test_id)
+        ctx.progress(total, total)
+        return {"attempts_deleted": deleted}
+    finally:
+        conn.close()
+
+def run_regrade(ctx):
+    """Regrade one question's answers after its key changed (see regrade.regrade_question)."""
+    params = ctx.params
+    read_conn, write_conn = db_reader_pool.open_connection(), db_writer_pool.open_connection()
+    # explicit BEGIN/COMMIT per chunk
+    write_conn.isolation_level = None
+
+    def chunk_done(processed, total):
+        ctx.progress(processed, total)
+        ctx.pause()
+
+    try:
+        processed, changed = regrade_question(read_conn, write_conn, params["test_id"], params["question_id"],
+                                              params["new_mask"], apply_regrade_chunk, REGRADE_CHUNK_SIZE,
+                                              progress=chunk_done)
+        return {"question_id": params["question_id"], "answers": processed, "changed": changed}
+    finally:
+        read_conn.close()
+        write_conn.close()
+
+job_runner.register("import_questions", run_question_import, cancellable=True, cleanup=remove_spooled_upload)
+job_runner.register("delete_test", run_test_delete)
+job_runner.register("regrade_question", run_regrade)
+
+@app.before_request
+def start_job_workers():
+    # per process: after a fork, the first request starts this worker's job threads
+    job_runner.ensure_started()
+
+@app.cli.command("rebuild-stats")
+@click.option("--test-id", type=int, default=None, help="Only rebuild this test.")
+def rebuild_stats_command(test_id):
+    """Backfill the dashboard aggregates from existing results."""
+    ensure_schema()
+    conn = db_writer_pool.open_connection()
+    try:
+        processed = rebuild_stats(conn, test_id)
+    finally:
+        conn.close()
+    click.echo(f"Rebuilt stats from {processed} result(s).")
+
+@app.cli.command("regrade")
+@click.option("--test-id", type=int, required=True, help="Test whose attempts are rescored.")
+def regrade_command(test_id):
+    """Rescore all attempts of a test against its current answer keys."""
+    ensure_schema()
+    conn = db_writer_pool.open_connection()
+    try:
+        report = regrade_test(conn, test_id)
+        rebuild_stats(conn, test_id)
+    finally:
+        conn.close()
+    click.echo(f"Regraded {report.attempts} attempt(s), {report.answers} answer(s) with {report.engine} in "
+               f"{report.elapsed:.2f}s: {report.changed_answers} answer(s) and {report.changed_scores} score(s) changed.")
+
+
+@app.cli.command("import-roster")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(ROSTER_FORMATS), default=None,
+              help="Defaults to the file extension (.jsonl/.ndjson, otherwise CSV).")
+def import_roster_command(path, fmt):
+    """Upsert trainees from a CSV (emp_id,name) or JSONL roster file."""
+    ensure_schema()
+    conn = db_writer_pool.open_connection()
+    try:
+        with open(path, "rb") as fh:
+            report = import_roster(conn, fh, roster_format(path, fmt), upsert=repo.upsert_trainees)
+    finally:
+        conn.close()
+    click.echo(f"Processed {report.rows} rows: {report.inserted} added, {report.updated} updated, "
+               f"{len(report.errors)} rejected.")
+    for line, msg in report.errors:
+        click.echo(f"  line {line}: {msg}", err=True)
+
+@app.cli.command("export-roster")
+@click.option("--format", "fmt", type=click.Choice(ROSTER_FORMATS), default="csv")
+@click.option("--output", "-o", type=click.File("w", encoding="utf-8"), default="-")
+def export_roster_command(fmt, output):
+    """Write the trainee roster to stdout or a file."""
+    ensure_schema()
+    conn = db_reader_pool.open_connection()
+    try:
+        for chunk in export_roster(conn, fmt):
+            output.write(chunk)
+    finally:
+        conn.close()
 
 
 # ---------------- Routes: Trainee login + exam landing
@@ -65,11 +473,7 @@ def login():
         elif not is_valid_test_code(code):
             error = "Invalid Test ID format."
         else:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute("SELECT * FROM tests WHERE test_code = ?", (code,))
-            row = cur.fetchone()
-            if row:
+            if repo.get_test_by_code(get_read_connection(), code):
                 return redirect(url_for("exam_landing", test_code=code))
             else:
                 error = "This Test ID does not exist. Please check with your trainer."
@@ -79,10 +483,8 @@ def login():
 
 @app.route("/exam/<test_code>", methods=["GET", "POST"])
 def exam_landing(test_code):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT id, name, duration_minutes FROM tests WHERE test_code = ?", (test_code,))
-    test = cur.fetchone()
+    conn = get_read_connection()
+    test = repo.get_test_by_code(conn, test_code)
     if not test:
         flash("Test not found.", "danger")
         return redirect(url_for("login"))
@@ -95,8 +497,7 @@ def exam_landing(test_code):
             return redirect(url_for("exam_landing", test_code=test_code))
 
         # Case-insensitive lookup; change to strict match if needed
-        cur.execute("SELECT id, emp_id, name FROM trainees WHERE LOWER(emp_id) = LOWER(?)", (emp_id,))
-        trainee = cur.fetchone()
+        trainee = repo.find_trainee(conn, emp_id)
         if not trainee:
             flash("Employee ID not registered", "danger")
             # re-render landing so trainee can try again
@@ -105,6 +506,14 @@ def exam_landing(test_code):
                                    test_name=test["name"],
                                    duration_minutes=test["duration_minutes"],
                                    emp_id=emp_id)
+        refusal = enrolment_refusal(conn, test["id"], trainee["id"])
+        if refusal:
+            flash(refusal, "danger")
+            return render_template("exam_landing.html",
+                                   test_code=test_code,
+                                   test_name=test["name"],
+                                   duration_minutes=test["duration_minutes"],
+                                   emp_id=emp_id)
 
         # Trainee found — store in session and proceed to quiz start
         session['trainee'] = {"id": trainee["id"], "emp_id": trainee["emp_id"], "name": trainee["name"]}
@@ -114,7 +523,8 @@ def exam_landing(test_code):
     return render_template("exam_landing.html",
                            test_code=test_code,
                            test_name=test["name"],
-                           duration_minutes=test["duration_minutes"])
+                           duration_minutes=test["duration_minutes"],
+                           attempt_policy=AttemptPolicy.from_test(test).describe())
 
 
 # ---------------- Trainer auth inline (from login page)
@@ -140,20 +550,47 @@ def trainer_login_required():
         return redirect(url_for("login"))
     return None
 
+@app.route("/trainer/pool-stats")
+def trainer_pool_stats():
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    return jsonify({
+        "backend": repo.backend,
+        "writer": db_writer_pool.stats(),
+        "reader": db_reader_pool.stats(),
+        "submissions": submission_writer.stats(),
+        "quiz_sessions": quiz_sessions.stats(),
+        "dashboard_cache": dashboard_cache.stats(),
+        "item_analysis": item_analysis.stats(),
+        "live_updates": live_updates.stats(),
+        "jobs": job_runner.stats(),
+    })
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus text exposition of the request/SQL/template histograms."""
+    if request_metrics is None:
+        abort(404)
+    body = request_metrics.render()
+    gauges = []
+    for name, pool in (("writer", db_writer_pool), ("reader", db_reader_pool)):
+        stats = pool.stats()
+        gauges += [f'quiz_db_pool_in_use{{pool="{name}"}} {stats["in_use"]}',
+                   f'quiz_db_pool_waits_total{{pool="{name}"}} {stats["waits"]}',
+                   f'quiz_db_pool_wait_seconds_total{{pool="{name}"}} {stats["wait_seconds_total"]}']
+    subs = submission_writer.stats()
+    gauges += [f"quiz_submission_queue_depth {subs['queue_depth']}",
+               f"quiz_submission_batches_total {subs['batches']}"]
+    return Response(body + "\n".join(gauges) + "\n", mimetype="text/plain; version=0.0.4")
+
 # ---------------- Trainer Portal: list, create, edit, delete, upload questions
 @app.route("/trainer")
 def trainer_index():
     redirect_resp = trainer_login_required()
     if redirect_resp:
         return redirect_resp
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, test_code, name, duration_minutes, created_at, updated_at
-        FROM tests
-        ORDER BY created_at DESC
-    """)
-    tests = cur.fetchall()
+    tests = repo.list_tests(get_read_connection())
     return render_template("trainer_list.html", tests=tests)
 
 @app.route("/trainer/create", methods=["GET", "POST"])
@@ -179,7 +616,6 @@ def trainer_create():
             return redirect(url_for("trainer_create"))
 
         conn = get_db_connection()
-        cur = conn.cursor()
 
         if code_mode == "manual":
             if not manual_code or not is_valid_test_code(manual_code):
@@ -193,18 +629,13 @@ def trainer_create():
                 flash("Unable to generate unique code. Try again.", "danger")
                 return redirect(url_for("trainer_create"))
 
-        now = datetime.utcnow().isoformat()
         try:
-            cur.execute("""
-                INSERT INTO tests (test_code, name, description, duration_minutes, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (code, name, description, duration_int, now, now))
-            conn.commit()
+            repo.create_test(conn, code, name, description, duration_int)
             flash(f"Test created with code {code}.", "success")
             return redirect(url_for("trainer_index"))
-        except sqlite3.IntegrityError:
+        except DuplicateError:
             flash("Test code already exists. Please try again.", "danger")
-        # no explicit conn.close() here: teardown will close per-request connection
+        # no explicit conn.close() here: teardown returns the connection to the pool
     return render_template("trainer_create.html")
 
 @app.route("/trainer/edit/<int:test_id>", methods=["GET", "POST"])
@@ -213,13 +644,11 @@ def trainer_edit(test_id):
     if redirect_resp:
         return redirect_resp
     conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM tests WHERE id = ?", (test_id,))
-    row = cur.fetchone()
+    row = repo.get_test(conn, test_id)
     if not row:
         flash("Test not found.", "danger")
         return redirect(url_for("trainer_index"))
-    # convert sqlite3.Row to plain dict so templates can use .get() safely
+    # convert the row to a plain dict so templates can use .get() safely
     test = dict(row)
 
     if request.method == "POST":
@@ -241,14 +670,41 @@ def trainer_edit(test_id):
         except ValueError:
             flash("Total trainees must be a non-negative integer.", "danger")
             return redirect(url_for("trainer_edit", test_id=test_id))
-        now = datetime.utcnow().isoformat()
+        # sampling settings (see sampling.py); a blank question count means the default
+        question_count = request.form.get("question_count", "").strip()
         try:
-            cur.execute("""
-                UPDATE tests
-                SET name = ?, description = ?, duration_minutes = ?, total_trainees = ?, updated_at = ?
-                WHERE id = ?
-            """, (name, description, duration_int, total_trainees_int, now, test_id))
-            conn.commit()
+            question_count_int = int(question_count) if question_count else None
+            if question_count_int is not None and question_count_int < 1:
+                raise ValueError
+        except ValueError:
+            flash("Questions per attempt must be a positive integer.", "danger")
+            return redirect(url_for("trainer_edit", test_id=test_id))
+        stratify_by = request.form.get("stratify_by") or None
+        if stratify_by is not None and stratify_by not in STRATIFY_FIELDS:
+            flash("Stratify by must be topic or difficulty.", "danger")
+            return redirect(url_for("trainer_edit", test_id=test_id))
+        shuffle_options = 1 if request.form.get("shuffle_options") else 0
+        seeded_draw = 1 if request.form.get("seeded_draw") else 0
+        # attempt policy (see attempt_policy.py); blank means unlimited / no cooldown
+        try:
+            max_attempts_int = int(request.form.get("max_attempts", "").strip() or 0)
+            cooldown_int = int(request.form.get("cooldown_minutes", "").strip() or 0)
+            if max_attempts_int < 0 or cooldown_int < 0:
+                raise ValueError
+        except ValueError:
+            flash("Max attempts and cooldown must be non-negative integers.", "danger")
+            return redirect(url_for("trainer_edit", test_id=test_id))
+        score_policy = request.form.get("score_policy") or "best"
+        if score_policy not in SCORE_POLICIES:
+            flash("Scoring must be best or latest attempt.", "danger")
+            return redirect(url_for("trainer_edit", test_id=test_id))
+        try:
+            repo.update_test(conn, test_id, {
+                "name": name, "description": description, "duration_minutes": duration_int,
+                "total_trainees": total_trainees_int, "question_count": question_count_int,
+                "stratify_by": stratify_by, "shuffle_options": shuffle_options, "seeded_draw": seeded_draw,
+                "max_attempts": max_attempts_int, "cooldown_minutes": cooldown_int, "score_policy": score_policy,
+            })
             flash("Test updated successfully.", "success")
             return redirect(url_for("trainer_index"))
         except Exception:
@@ -262,11 +718,9 @@ def trainer_delete(test_id):
     redirect_resp = trainer_login_required()
     if redirect_resp:
         return redirect_resp
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM tests WHERE id = ?", (test_id,))
-    conn.commit()
-    flash("Test deleted.", "success")
+    job_id = job_runner.submit(get_db_connection(), "delete_test", {"test_id": test_id},
+                               test_id=test_id, lane=job_lane(test_id))
+    flash(f"Test deletion queued (job {job_id}).", "success")
     return redirect(url_for("trainer_index"))
 
 @app.route("/trainer/upload/<int:test_id>", methods=["GET", "POST"])
@@ -275,9 +729,7 @@ def trainer_upload(test_id):
     if redirect_resp:
         return redirect_resp
     conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT id, test_code, name FROM tests WHERE id = ?", (test_id,))
-    test = cur.fetchone()
+    test = repo.get_test(conn, test_id)
     if not test:
         flash("Test not found.", "danger")
         return redirect(url_for("trainer_index"))
@@ -286,47 +738,19 @@ def trainer_upload(test_id):
         if not file or file.filename == "":
             flash("Please select a CSV file.", "danger")
             return redirect(url_for("trainer_upload", test_id=test_id))
-        try:
-            content = file.read().decode("utf-8")
-            reader = csv.reader(io.StringIO(content))
-            rows = list(reader)
-            if not rows:
-                raise ValueError("CSV is empty")
-            # skip header row if present
-            if rows and rows[0] and rows[0][0].strip().lower() == "question":
-                rows = rows[1:]
-            inserted = 0
-            parsed_rows = []
-            for r in rows:
-                if len(r) < 6:
-                    raise ValueError("Each row must have 6 columns: Question,Option1..4,Correct")
-                q_text = r[0].strip()
-                opts = [r[1].strip(), r[2].strip(), r[3].strip(), r[4].strip()]
-                correct_raw = r[5].strip()
-                if not q_text or not all(opts):
-                    raise ValueError("Question text and all four options are required")
-                if not correct_raw:
-                    raise ValueError("Correct column is required")
-                parts = [p.strip() for p in correct_raw.replace(",", ";").split(";") if p.strip()]
-                for p in parts:
-                    if p not in ("1", "2", "3", "4"):
-                        raise ValueError(f"Invalid correct index '{p}' for question '{q_text}'")
-                correct_norm = ";".join(sorted(set(parts), key=lambda x: int(x)))
-                is_multiple = 1 if len(parts) > 1 else 0
-                parsed_rows.append((test_id, q_text, opts[0], opts[1], opts[2], opts[3], correct_norm, is_multiple))
-                inserted += 1
-            # perform batch insert in a short transaction
-            if parsed_rows:
-                cur.executemany("""
-                    INSERT INTO questions (test_id, question_text, option1, option2, option3, option4, correct, is_multiple)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, parsed_rows)
-                conn.commit()
-            flash(f"Imported {inserted} questions into test {test['test_code']}.", "success")
-            return redirect(url_for("trainer_index"))
-        except Exception as e:
-            flash(f"Error importing CSV: {e}", "danger")
-            return redirect(url_for("trainer_upload", test_id=test_id))
+        dry_run = bool(request.form.get("dry_run"))
+        skip_duplicates = bool(request.form.get("skip_duplicates"))
+        # the file is streamed to disk and imported by a background job
+        os.makedirs(JOB_SPOOL_DIR, exist_ok=True)
+        path = os.path.join(JOB_SPOOL_DIR, f"questions-{secrets.token_hex(8)}.csv")
+        file.save(path)
+        job_id = job_runner.submit(conn, "import_questions", {
+            "test_id": test_id, "path": path, "filename": file.filename,
+            "dry_run": dry_run, "skip_duplicates": skip_duplicates,
+        }, test_id=test_id, lane=job_lane(test_id))
+        action = "Validation" if dry_run else "Import"
+        flash(f"{action} of {file.filename} into test {test['test_code']} queued (job {job_id}).", "success")
+        return redirect(url_for("trainer_jobs", test_id=test_id))
     return render_template("trainer_upload.html", test=test)
 
 # Trainer: list and add trainees for entire system (or extend to be test-specific later)
@@ -335,12 +759,19 @@ def trainer_trainees():
     redirect_resp = trainer_login_required()
     if redirect_resp:
         return redirect_resp
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT id, emp_id, name, created_at FROM trainees ORDER BY created_at DESC")
-    rows = cur.fetchall()
-    trainees = [dict(r) for r in rows]
-    return render_template("trainer_trainees.html", trainees=trainees)
+    cursor, q, limit = page_args()
+    trainees, next_cursor = fetch_trainees_page(get_read_connection(), cursor, q, limit)
+    return render_template("trainer_trainees.html", trainees=trainees, next_cursor=next_cursor,
+                           q=q, paged=cursor is not None)
+
+@app.route("/trainer/trainees.json")
+def trainer_trainees_json():
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    cursor, q, limit = page_args()
+    items, next_cursor = fetch_trainees_page(get_read_connection(), cursor, q, limit)
+    return jsonify({"items": items, "next_cursor": next_cursor})
 
 @app.route("/trainer/trainees/add", methods=["GET", "POST"])
 def trainer_trainees_add():
@@ -357,53 +788,307 @@ def trainer_trainees_add():
         if not re.fullmatch(r"[A-Za-z0-9]+", emp_id):
             flash("Employee ID must be alphanumeric.", "danger")
             return redirect(url_for("trainer_trainees_add"))
-        conn = get_db_connection()
-        cur = conn.cursor()
         try:
-            cur.execute("INSERT INTO trainees (emp_id, name, created_at) VALUES (?, ?, ?)",
-                        (emp_id, name, datetime.utcnow().isoformat()))
-            conn.commit()
+            repo.add_trainee(get_db_connection(), emp_id, name)
             flash("Trainee added.", "success")
             return redirect(url_for("trainer_trainees"))
-        except sqlite3.IntegrityError:
+        except DuplicateError:
             flash("Employee ID already exists.", "danger")
             return redirect(url_for("trainer_trainees_add"))
     return render_template("trainer_trainees_add.html")
 
+@app.route("/trainer/trainees/import", methods=["GET", "POST"])
+def trainer_trainees_import():
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    if request.method == "POST":
+        file = request.files.get("roster_file")
+        if not file or file.filename == "":
+            flash("Please select a roster file.", "danger")
+            return redirect(url_for("trainer_trainees_import"))
+        fmt = roster_format(file.filename, request.form.get("format"))
+        report = import_roster(get_db_connection(), file.stream, fmt, upsert=repo.upsert_trainees)
+        flash(f"Processed {report.rows} rows: {report.inserted} added, {report.updated} updated, "
+              f"{len(report.errors)} rejected.", "success" if not report.errors else "warning")
+        for msg in report.error_messages():
+            flash(msg, "danger")
+        return redirect(url_for("trainer_trainees"))
+    return render_template("trainer_trainees_import.html")
+
+@app.route("/trainer/trainees/export")
+def trainer_trainees_export():
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    fmt = request.args.get("format", "csv")
+    if fmt not in ROSTER_FORMATS:
+        abort(400)
+
+    @stream_with_context
+    def generate():
+        yield from export_roster(get_read_connection(), fmt)
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return Response(generate(), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename=trainees.{fmt}"})
+
 @app.route("/trainer/trainees/delete/<int:trainee_id>", methods=["POST"])
 def trainer_trainees_delete(trainee_id):
     redirect_resp = trainer_login_required()
     if redirect_resp:
         return redirect_resp
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM trainees WHERE id = ?", (trainee_id,))
-    conn.commit()
+    repo.delete_trainee(get_db_connection(), trainee_id)
     flash("Trainee removed.", "success")
     return redirect(url_for("trainer_trainees"))
 
 
+# ---------------- Test enrolment (test_enrolments; see enrolment.py)
+@app.route("/trainer/enrolments/<int:test_id>")
+def trainer_enrolments(test_id):
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    conn = get_read_connection()
+    test = repo.get_test(conn, test_id)
+    if not test:
+        flash("Test not found.", "danger")
+        return redirect(url_for("trainer_index"))
+    cursor, q, limit = page_args()
+    missing = request.args.get("show") == "missing"
+    enrolled, participated = repo.enrolment_counts(conn, test_id)
+    items, next_cursor = fetch_enrolment_page(conn, test_id, cursor, q, limit, missing_only=missing)
+    return render_template("trainer_enrolments.html", test=test, items=items, next_cursor=next_cursor, q=q,
+                           missing=missing, paged=cursor is not None, enrolled=enrolled,
+                           participated=participated)
+
+@app.route("/trainer/enrolments/<int:test_id>.json")
+def trainer_enrolments_json(test_id):
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    cursor, q, limit = page_args()
+    items, next_cursor = fetch_enrolment_page(get_read_connection(), test_id, cursor, q, limit,
+                                              missing_only=request.args.get("show") == "missing")
+    return jsonify({"items": items, "next_cursor": next_cursor})
+
+@app.route("/trainer/enrolments/<int:test_id>/add", methods=["POST"])
+def trainer_enrolments_add(test_id):
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    conn = get_db_connection()
+    if not repo.get_test(conn, test_id):
+        flash("Test not found.", "danger")
+        return redirect(url_for("trainer_index"))
+    file = request.files.get("roster_file")
+    if file and file.filename:
+        records = iter_file_ids(file.stream, roster_format(file.filename))
+    else:
+        records = iter_pasted_ids(request.form.get("emp_ids") or "")
+    report = enrol_trainees(conn, test_id, records, enrol=repo.enrol_trainees)
+    if not report.rows:
+        flash("Paste Employee IDs or choose a roster file.", "danger")
+        return redirect(url_for("trainer_enrolments", test_id=test_id))
+    flash(f"Processed {report.rows} Employee ID(s): {report.enrolled} enrolled, {report.already} already enrolled, "
+          f"{report.rejected} rejected.",
+          "success" if not report.rejected else "warning")
+    for msg in report.error_messages():
+        flash(msg, "danger")
+    return redirect(url_for("trainer_enrolments", test_id=test_id))
+
+@app.route("/trainer/enrolments/<int:test_id>/remove", methods=["POST"])
+def trainer_enrolments_remove(test_id):
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    if request.form.get("all"):
+        removed = repo.unenrol_trainees(get_db_connection(), test_id)
+        flash(f"Removed all {removed} enrolment(s); the test is open to every registered trainee.", "success")
+        return redirect(url_for("trainer_enrolments", test_id=test_id))
+    try:
+        ids = [int(x) for x in request.form.getlist("selected")]
+    except ValueError:
+        flash("Invalid selection.", "danger")
+        return redirect(url_for("trainer_enrolments", test_id=test_id))
+    if not ids:
+        flash("No trainees selected.", "warning")
+        return redirect(url_for("trainer_enrolments", test_id=test_id))
+    removed = repo.unenrol_trainees(get_db_connection(), test_id, ids)
+    flash(f"Removed {removed} enrolment(s).", "success")
+    return redirect(url_for("trainer_enrolments", test_id=test_id))
+
+
+# ---------------- Trainee progress and leaderboards (trainee_stats / trainee_test_stats rollups)
+LEADERBOARD_SIZE = 50
+
+def leaderboard_args():
+    """(test_id or None for overall, limit) from the query string."""
+    test_id = request.args.get("test_id", type=int)
+    try:
+        limit = min(max(int(request.args.get("limit", LEADERBOARD_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        limit = LEADERBOARD_SIZE
+    return test_id, limit
+
+def leaderboard_rows(conn, test, limit):
+    """Ranked rows, overall when test is None, else by the test's score policy."""
+    if test is None:
+        rows = [dict(r) for r in repo.leaderboard(conn, limit)]
+    else:
+        rows = [dict(r) for r in repo.leaderboard(conn, limit, test["id"], test["score_policy"])]
+    for rank, row in enumerate(rows, start=1):
+        row["rank"] = rank
+        row["average_pct"] = round(row["score_sum"] * 100.0 / row["total_sum"], 1) if row["total_sum"] else None
+        for column in ("best_pct", "latest_pct"):
+            if column in row:
+                row[column] = round(row[column], 1)
+    return rows
+
+@app.route("/trainer/leaderboard")
+def trainer_leaderboard():
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    test_id, limit = leaderboard_args()
+    conn = get_read_connection()
+    test = None
+    if test_id is not None:
+        test = repo.get_test(conn, test_id)
+        if not test:
+            flash("Test not found.", "danger")
+            return redirect(url_for("trainer_leaderboard"))
+    return render_template("trainer_leaderboard.html", rows=leaderboard_rows(conn, test, limit),
+                           tests=repo.list_tests(conn), test=test, limit=limit)
+
+@app.route("/trainer/leaderboard.json")
+def trainer_leaderboard_json():
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    test_id, limit = leaderboard_args()
+    conn = get_read_connection()
+    test = repo.get_test(conn, test_id) if test_id is not None else None
+    if test_id is not None and not test:
+        abort(404)
+    return jsonify({"test_id": test_id, "score_policy": test["score_policy"] if test else None,
+                    "items": leaderboard_rows(conn, test, limit)})
+
+@app.route("/trainer/trainees/<int:trainee_id>")
+def trainer_trainee_profile(trainee_id):
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    conn = get_read_connection()
+    trainee = repo.get_trainee(conn, trainee_id)
+    if not trainee:
+        flash("Trainee not found.", "danger")
+        return redirect(url_for("trainer_trainees"))
+    totals, rank, tests = repo.trainee_progress(conn, trainee_id)
+    return render_template("trainer_trainee.html", trainee=trainee, totals=totals, rank=rank, tests=tests)
+
+
 # View questions for a test
 @app.route("/trainer/questions/<int:test_id>")
 def trainer_questions(test_id):
     redirect_resp = trainer_login_required()
     if redirect_resp:
         return redirect_resp
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT id, test_code, name FROM tests WHERE id = ?", (test_id,))
-    test = cur.fetchone()
+    conn = get_read_connection()
+    test = repo.get_test(conn, test_id)
     if not test:
         flash("Test not found.", "danger")
         return redirect(url_for("trainer_index"))
-    cur.execute("""
-        SELECT id, question_text, option1, option2, option3, option4, correct, is_multiple
-        FROM questions
-        WHERE test_id = ?
-        ORDER BY id ASC
-    """, (test_id,))
-    questions = cur.fetchall()
-    return render_template("trainer_questions.html", test=test, questions=questions)
+    questions = repo.list_questions(conn, test_id)
+    jobs = job_runner.recent(conn, test_id, kind="regrade_question", limit=5)
+    return render_template("trainer_questions.html", test=test, questions=questions, regrade_jobs=jobs)
+
+# Edit a question; changing its answer key regrades past attempts in the background
+@app.route("/trainer/question/edit/<int:question_id>", methods=["GET", "POST"])
+def trainer_question_edit(question_id):
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    conn = get_db_connection()
+    row = repo.get_question(conn, question_id)
+    if not row:
+        flash("Question not found.", "danger")
+        return redirect(url_for("trainer_index"))
+    question = dict(row)
+
+    if request.method == "POST":
+        fields = ["question_text", "option1", "option2", "option3", "option4", "correct", "topic", "difficulty"]
+        try:
+            q_text, opts, correct_norm, is_multiple, topic, difficulty = parse_question_row(
+                [request.form.get(f, "") for f in fields])
+        except ValueError as e:
+            flash(str(e), "danger")
+            question.update({f: request.form.get(f, "") for f in fields})
+            return render_template("trainer_question_edit.html", question=question)
+        new_mask = answer_mask(correct_norm)
+        repo.update_question(conn, question_id, question["test_id"], {
+            "question_text": q_text, "option1": opts[0], "option2": opts[1], "option3": opts[2],
+            "option4": opts[3], "correct": correct_norm, "correct_mask": new_mask,
+            "is_multiple": is_multiple, "topic": topic, "difficulty": difficulty,
+        })
+        question_banks.invalidate(question["test_id"])
+        if new_mask != question["correct_mask"]:
+            job_id = job_runner.submit(conn, "regrade_question", {
+                "test_id": question["test_id"], "question_id": question_id, "new_mask": new_mask,
+            }, test_id=question["test_id"], lane=job_lane(question["test_id"]))
+            flash(f"Question updated. Answer key changed; regrading past attempts (job {job_id}).", "success")
+        else:
+            flash("Question updated.", "success")
+        return redirect(url_for("trainer_questions", test_id=question["test_id"]))
+    return render_template("trainer_question_edit.html", question=question)
+
+# ---------------- Background jobs: status, progress, cancel, retry
+@app.route("/trainer/jobs")
+def trainer_jobs():
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    test_id = request.args.get("test_id", type=int)
+    conn = get_read_connection()
+    test = repo.get_test(conn, test_id) if test_id is not None else None
+    return render_template("trainer_jobs.html", jobs=job_runner.recent(conn, test_id), test=test, test_id=test_id)
+
+@app.route("/trainer/jobs.json")
+def trainer_jobs_json():
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    test_id = request.args.get("test_id", type=int)
+    return jsonify({"items": job_runner.recent(get_read_connection(), test_id)})
+
+@app.route("/trainer/jobs/<int:job_id>")
+def trainer_job_status(job_id):
+    """One job's status and progress as JSON."""
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    job = job_runner.get(get_read_connection(), job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job)
+
+@app.route("/trainer/jobs/<int:job_id>/cancel", methods=["POST"])
+def trainer_job_cancel(job_id):
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    ok, message = job_runner.cancel(get_db_connection(), job_id)
+    flash(message, "success" if ok else "warning")
+    return redirect(url_for("trainer_jobs", test_id=request.form.get("test_id", type=int)))
+
+@app.route("/trainer/jobs/<int:job_id>/retry", methods=["POST"])
+def trainer_job_retry(job_id):
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    ok, message = job_runner.retry(get_db_connection(), job_id)
+    flash(message, "success" if ok else "warning")
+    return redirect(url_for("trainer_jobs", test_id=request.form.get("test_id", type=int)))
 
 # Delete a single question (POST)
 @app.route("/trainer/question/delete/<int:question_id>", methods=["POST"])
@@ -411,17 +1096,13 @@ def trainer_question_delete(question_id):
     redirect_resp = trainer_login_required()
     if redirect_resp:
         return redirect_resp
-    conn = get_db_connection()
-    cur = conn.cursor()
-    # find test_id to return back to questions list
-    cur.execute("SELECT test_id FROM questions WHERE id = ?", (question_id,))
-    row = cur.fetchone()
-    if not row:
+    # the owning test is where we return to the questions list
+    affected_tests, _ = repo.delete_questions(get_db_connection(), [question_id])
+    if not affected_tests:
         flash("Question not found.", "danger")
         return redirect(url_for("trainer_index"))
-    test_id = row["test_id"]
-    cur.execute("DELETE FROM questions WHERE id = ?", (question_id,))
-    conn.commit()
+    test_id = affected_tests[0]
+    question_banks.invalidate(test_id)
     flash("Question deleted.", "success")
     return redirect(url_for("trainer_questions", test_id=test_id))
 
@@ -445,133 +1126,257 @@ def trainer_questions_delete_bulk():
     except ValueError:
         flash("Invalid question selection.", "danger")
         return redirect(url_for("trainer_questions", test_id=test_id))
-    conn = get_db_connection()
-    cur = conn.cursor()
-    placeholders = ",".join("?" for _ in ids)
-    cur.execute(f"DELETE FROM questions WHERE id IN ({placeholders})", tuple(ids))
-    conn.commit()
-    flash(f"Deleted {cur.rowcount} question(s).", "success")
+    # owning tests are resolved from the ids so a tampered test_id can't leave a stale bank
+    affected_tests, deleted = repo.delete_questions(get_db_connection(), ids)
+    for affected in affected_tests:
+        question_banks.invalidate(affected)
+    flash(f"Deleted {deleted} question(s).", "success")
     return redirect(url_for("trainer_questions", test_id=test_id))
 
 
-@app.route("/trainer/results/<int:test_id>")
-def trainer_results(test_id):
-    redirect_resp = trainer_login_required()
-    if redirect_resp:
-        return redirect_resp
-
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # Load test
-    cur.execute("SELECT id, test_code, name, total_trainees FROM tests WHERE id = ?", (test_id,))
-    test = cur.fetchone()
-    if not test:
-        flash("Test not found.", "danger")
-        return redirect(url_for("trainer_index"))
-
-    # Participation counts
-    cur.execute("""
-    SELECT COUNT(1) as cnt
-    FROM results
-    WHERE test_id = ? AND COALESCE(raw_answers,'') <> ''
-    """, (test_id,))
-    participants_row = cur.fetchone()
-    participants = participants_row["cnt"] if participants_row else 0
-    total_trainees = test["total_trainees"] or 0
-    non_participants = max(total_trainees - participants, 0)
+def dashboard_payload(conn, test_id, version=None):
+    """Cached chart data for the results dashboard (see dashboard_cache.py).
+
+    The score distribution comes from the aggregates maintained by
+    quiz_submit, so even a cache miss never scans the attempts. For a test
+    with enrolments, participants are the enrolled trainees with an attempt
+    (test_stats keeps both counts); otherwise they are counted against the
+    test's typed-in total_trainees. Returns None if the test does not
+    exist, including when it was deleted after the caller read its version.
+    """
+    if version is None:
+        version = repo.dashboard_version(conn, test_id)
+        if version is None:
+            return None
+    cached = dashboard_cache.get(test_id, version)
+    if cached is not None:
+        return cached
+    test = repo.get_test(conn, test_id)
+    if test is None:
+        return None
+    stats = repo.test_stats(conn, test_id)
+    enrolled = stats["enrolled"] if stats else 0
+    if enrolled:
+        participants = stats["enrolled_participants"]
+        total_trainees = enrolled
+        non_participants = enrolled - participants
+    else:
+        participants = stats["participants"] if stats else 0
+        total_trainees = test["total_trainees"] or 0
+        non_participants = max(total_trainees - participants, 0)
 
     # Questionwise analysis
-    cur.execute("SELECT id, question_text, correct FROM questions WHERE test_id = ? ORDER BY id ASC", (test_id,))
-    qrows = cur.fetchall()
-    q_ids = [q["id"] for q in qrows]
-    q_texts = [q["question_text"] for q in qrows]
-    correct_map = {q["id"]: q["correct"] for q in qrows}
-
-    q_total_attempts = {qid: 0 for qid in q_ids}
-    q_correct_counts = {qid: 0 for qid in q_ids}
-
-    cur.execute("SELECT raw_answers FROM results WHERE test_id = ?", (test_id,))
-    result_rows = cur.fetchall()
-    for r in result_rows:
-        raw = r["raw_answers"]
-        try:
-            answers = json.loads(raw)
-        except Exception:
-            answers = {}
-        for qid in q_ids:
-            s_qid = str(qid)
-            ans = answers.get(s_qid, "")
-            if ans:
-                q_total_attempts[qid] += 1
-                correct = correct_map.get(qid, "")
-                if correct and set(ans.split(";")) == set(correct.split(";")):
-                    q_correct_counts[qid] += 1
-
-    question_labels = q_texts
-    correct_counts = [q_correct_counts[qid] for qid in q_ids]
-    wrong_counts = [q_total_attempts[qid] - q_correct_counts[qid] for qid in q_ids]
+    qrows = repo.question_stats(conn, test_id)
 
     # Result distribution buckets
-    cur.execute("SELECT score, total FROM results WHERE test_id = ?", (test_id,))
-    score_rows = cur.fetchall()
-    bins = {"100": 0, "75plus": 0, "50to75": 0, "below50": 0}
-    for sr in score_rows:
-        score = sr["score"]
-        total = sr["total"] or 1
-        pct = (score / total) * 100.0
-        if math.isclose(pct, 100.0, rel_tol=1e-9):
-            bins["100"] += 1
-        elif pct >= 75.0:
-            bins["75plus"] += 1
-        elif pct >= 50.0:
-            bins["50to75"] += 1
-        else:
-            bins["below50"] += 1
-
-    # Fetch individual attempts with trainee info where possible
-    # Prefer joining trainees on trainee_id; fall back to trainee_emp_id stored in results.
-    # This query uses LEFT JOIN; if columns don't exist it will still work (SQLite will ignore missing columns)
-    cur.execute("""
-    SELECT r.id, r.attempted_at, r.score, r.total,
-           COALESCE(t.emp_id, r.trainee_emp_id) AS emp_id,
-           COALESCE(t.name, r.trainee_name) AS trainee_name
-    FROM results r
-    LEFT JOIN trainees t ON r.trainee_id = t.id
-    WHERE r.test_id = ? AND COALESCE(r.raw_answers,'') <> ''
-    ORDER BY r.attempted_at DESC
-    """, (test_id,))
-    attempts = [dict(a) for a in cur.fetchall()]
-
-    # Prepare chart_data as before
+    bins = {b: (stats[f"bucket_{b}"] if stats else 0) for b in SCORE_BUCKETS}
     chart_data = {
         "participation": {
             "labels": ["Participants", "Non Participants"],
             "values": [participants, non_participants]
         },
         "question_analysis": {
-            "labels": question_labels,
-            "correct": correct_counts,
-            "wrong": wrong_counts
+            "ids": [q["id"] for q in qrows],
+            "labels": [q["question_text"] for q in qrows],
+            "correct": [q["correct"] for q in qrows],
+            "wrong": [q["attempts"] - q["correct"] for q in qrows]
         },
         "result_dist": {
             "labels": ["100%", ">=75%", "50-75%", "<50%"],
             "values": [bins["100"], bins["75plus"], bins["50to75"], bins["below50"]]
         },
-        "test": {"id": test["id"], "code": test["test_code"], "name": test["name"], "total_trainees": total_trainees}
+        "test": {"id": test["id"], "code": test["test_code"], "name": test["name"], "total_trainees": total_trainees,
+                 "enrolled": enrolled},
+        "version": version,
     }
+    return dashboard_cache.put(test_id, version, chart_data)
 
-    conn.close()
-    return render_template("trainer_results.html", chart_data=json.dumps(chart_data), attempts=attempts)
+@app.route("/trainer/results/<int:test_id>")
+def trainer_results(test_id):
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+
+    conn = get_read_connection()
+
+    # Load test and its chart data
+    payload = dashboard_payload(conn, test_id)
+    if payload is None:
+        flash("Test not found.", "danger")
+        return redirect(url_for("trainer_index"))
+
+    # First page of attempts; further pages come from the cursor links or attempts.json
+    cursor, q, limit = page_args()
+    attempts, next_cursor = fetch_attempts_page(conn, test_id, cursor, q, limit)
+
+    return render_template("trainer_results.html", chart_data=payload.body.decode(), attempts=attempts,
+                           test_id=test_id, next_cursor=next_cursor, q=q, paged=cursor is not None)
+
+@app.route("/trainer/results/<int:test_id>/dashboard.json")
+def trainer_results_dashboard(test_id):
+    """The chart payload, revalidated by ETag so unchanged polls cost a 304."""
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    conn = get_read_connection()
+    version = repo.dashboard_version(conn, test_id)
+    if version is None:
+        abort(404)
+    etag = dashboard_etag(test_id, version)
+    headers = {"ETag": f'W/"{etag}"', "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=headers)
+    payload = dashboard_payload(conn, test_id, version)
+    if payload is None:
+        abort(404)
+    body = payload.body
+    if len(body) > 512 and "gzip" in request.accept_encodings:
+        body = payload.gzipped
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, mimetype="application/json", headers=headers)
+
+@app.route("/trainer/results/<int:test_id>/items.json")
+def trainer_results_items(test_id):
+    """Item analysis for the results page, revalidated by ETag like dashboard.json."""
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    conn = get_read_connection()
+    version = repo.dashboard_version(conn, test_id)
+    if version is None:
+        abort(404)
+    headers = {"Cache-Control": "private, no-cache"}
+    if request.if_none_match.contains_weak(f"items-{test_id}-{version}"):
+        return Response(status=304, headers={**headers, "ETag": f'W/"items-{test_id}-{version}"'})
+    analysis = item_analysis.get(conn, test_id, version)
+    if analysis is None:
+        abort(404)
+    headers["ETag"] = f'W/"items-{test_id}-{analysis["version"]}"'
+    return Response(json.dumps(analysis, separators=(",", ":")), mimetype="application/json", headers=headers)
+
+@app.route("/trainer/results/<int:test_id>/live")
+def trainer_results_live(test_id):
+    """Server-sent events: one "attempt" event per committed submission.
+
+    Between events a "sync" heartbeat carries the current dashboard version,
+    which also catches changes this process did not publish (other workers,
+    regrades, question edits); the page then refetches dashboard.json.
+    """
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+
+    def current_version():
+        # borrowed per heartbeat; a stream must not pin a pooled connection
+        conn = db_reader_pool.acquire()
+        try:
+            return repo.dashboard_version(conn, test_id)
+        finally:
+            db_reader_pool.release(conn)
+
+    if current_version() is None:
+        abort(404)
+
+    def stream():
+        sub = live_updates.subscribe(test_id)
+        try:
+            # a reconnecting page learns at once whether it missed anything
+            yield "retry: 5000\n\n" + sse_frame("sync", {"version": current_version()})
+            while True:
+                frame = sub.get(LIVE_HEARTBEAT_SECONDS)
+                if frame is None:
+                    frame = sse_frame("sync", {"version": current_version()})
+                yield frame
+        finally:
+            live_updates.unsubscribe(sub)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/trainer/results/<int:test_id>/attempts.json")
+def trainer_results_attempts(test_id):
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    cursor, q, limit = page_args()
+    items, next_cursor = fetch_attempts_page(get_read_connection(), test_id, cursor, q, limit)
+    return jsonify({"items": items, "next_cursor": next_cursor})
+
+
+@app.route("/trainer/results/<int:test_id>/export")
+def trainer_results_export(test_id):
+    redirect_resp = trainer_login_required()
+    if redirect_resp:
+        return redirect_resp
+    test = repo.get_test(get_read_connection(), test_id)
+    if not test:
+        abort(404)
+    fmt = request.args.get("format", "csv")
+    layout = request.args.get("layout", "long")
+    if fmt not in EXPORT_FORMATS or layout not in EXPORT_LAYOUTS:
+        abort(400)
+    # optional date range on attempted_at: from is inclusive, to includes the whole day
+    try:
+        date_from = request.args.get("from") or None
+        date_to = request.args.get("to") or None
+        if date_from:
+            date_from = datetime.strptime(date_from, "%Y-%m-%d").isoformat()
+        if date_to:
+            date_to = (datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1)).isoformat()
+    except ValueError:
+        abort(400)
+    if fmt == "xlsx" and xlsxwriter is None:
+        flash("XLSX export needs the xlsxwriter package; exporting CSV works without it.", "warning")
+        return redirect(url_for("trainer_results", test_id=test_id))
+
+    @stream_with_context
+    def generate():
+        rows = export_rows(get_read_connection(), test_id, layout, date_from, date_to)
+        yield from (stream_csv(rows) if fmt == "csv" else stream_xlsx(rows))
+
+    mimetype = "text/csv" if fmt == "csv" else \
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    filename = f"{test['test_code']}_attempts_{layout}.{fmt}"
+    return Response(generate(), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
 
 
 # ---------------- Quiz flow for trainees: start, submit, results
+def enrolment_refusal(conn, test_id, trainee_id):
+    """Why the trainee may not take the test, or None; tests without enrolments are open to all trainees."""
+    restricted, enrolled = repo.enrolment_check(conn, test_id, trainee_id)
+    if restricted and not enrolled:
+        return "You are not enrolled in this test. Contact the trainer."
+    return None
+
+def reserve_attempt(test, trainee_id, started_at):
+    """Take the trainee's next attempts row under the test's policy.
+
+    Returns (attempt_no, session_key, None), or (None, None, reason) when the
+    policy refuses. The check is one index seek; if a concurrent start takes
+    the same attempt number first, the unique index rejects this insert and
+    the check runs again against that attempt.
+    """
+    policy = AttemptPolicy.from_test(test)
+    conn = get_db_connection()
+    for _ in range(3):
+        last = repo.last_attempt(conn, test["id"], trainee_id)
+        reason = policy.refusal(last, started_at)
+        if reason:
+            return None, None, reason
+        attempt_no = last["attempt_no"] + 1 if last else 1
+        session_key = secrets.token_urlsafe(16)
+        try:
+            repo.reserve_attempt(conn, test["id"], trainee_id, attempt_no, session_key, started_at.isoformat())
+        except DuplicateError:
+            continue
+        return attempt_no, session_key, None
+    return None, None, "Another attempt was started at the same time. Please try again."
+
 @app.route("/quiz/start/<test_code>", methods=["GET"])
 def quiz_start(test_code):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT id, name, duration_minutes FROM tests WHERE test_code = ?", (test_code,))
-    test = cur.fetchone()
+    conn = get_read_connection()
+    test = repo.get_test_by_code(conn, test_code)
     trainee = session.get('trainee')
     if not trainee:
         flash("Please enter your Employee ID to continue.", "warning")
@@ -583,166 +1388,162 @@ def quiz_start(test_code):
     test_id = test["id"]
     duration = test["duration_minutes"] or 5  # default to 5 minutes if not set
 
-    # fetch distinct question ids and question rows
-    cur.execute("SELECT id FROM questions WHERE test_id = ?", (test_id,))
-    id_rows = cur.fetchall()
-    question_ids = [r["id"] for r in id_rows]
-
-    if not question_ids:
+    # sample from the cached question bank; no per-start question queries
+    bank = question_banks.get(conn, test_id)
+    if not len(bank):
         flash("No questions available for this test. Contact the trainer.", "danger")
         return redirect(url_for("exam_landing", test_code=test_code))
 
-    # choose up to 5 unique question ids without replacement
-    pick_count = min(5, len(question_ids))
-    chosen_ids = random.sample(question_ids, k=pick_count)
-
-    # fetch the chosen question rows in a single query preserving order of chosen_ids
-    placeholders = ",".join("?" for _ in chosen_ids)
-    cur.execute(f"SELECT * FROM questions WHERE id IN ({placeholders})", tuple(chosen_ids))
-    rows = {r["id"]: r for r in cur.fetchall()}
-
-    # build quiz_questions in the same order as chosen_ids
-    quiz_questions = []
-    for qid in chosen_ids:
-        q = rows[qid]
-        quiz_questions.append({
-            "id": q["id"],
-            "text": q["question_text"],
-            "options": [q["option1"], q["option2"], q["option3"], q["option4"]],
-            "is_multiple": bool(q["is_multiple"])
-        })
+    # a refresh (or coming back after a dropped connection) resumes the same
+    # questions with whatever time is left on the server-side clock
+    sq = quiz_sessions.get(session.get("quiz_sid"))
+    if sq and sq["test_id"] == test_id and sq["trainee"]["id"] == trainee["id"]:
+        orders = sq.get("option_orders") or [None] * len(sq["question_ids"])
+        quiz_questions = []
+        for qid, order in zip(sq["question_ids"], orders):
+            i = bank.index_of(qid)
+            if i >= 0:
+                quiz_questions.append(present(bank.question(i), order))
+        remaining = datetime.fromisoformat(sq["deadline"]) - datetime.utcnow()
+        duration_seconds = max(int(remaining.total_seconds()), 0)
+        return render_template("quiz.html", test_name=test["name"], duration_seconds=duration_seconds,
+                               questions=quiz_questions, test_code=test_code)
+
+    # the session's trainee may have been admitted through another test's landing page
+    refusal = enrolment_refusal(conn, test_id, trainee["id"])
+    if refusal:
+        flash(refusal, "danger")
+        return redirect(url_for("exam_landing", test_code=test_code))
+
+    # a new quiz is a new attempt: the policy is checked and the ledger row
+    # taken before any questions are drawn
+    started_at = datetime.utcnow()
+    attempt_no, session_key, refusal = reserve_attempt(test, trainee["id"], started_at)
+    if refusal:
+        flash(refusal, "warning")
+        return redirect(url_for("exam_landing", test_code=test_code))
 
-    # store only the chosen ids in session to avoid any accidental re-selection on refresh
-    session['current_quiz'] = {
+    # draw per the test's sampling config; O(question_count), not O(bank size)
+    config = SamplingConfig.from_test(test)
+    rng = draw_rng(config, test_id, trainee["id"])
+    chosen = draw_positions(bank, config, rng)
+    orders = option_orders(config, len(chosen), rng)
+    chosen_ids = [bank.ids[i] for i in chosen]
+    quiz_questions = [present(bank.question(i), orders[n] if orders else None) for n, i in enumerate(chosen)]
+
+    # keep the chosen ids server-side so a refresh cannot re-roll the questions
+    quiz_sessions.discard(session.get("quiz_sid"))
+    session["quiz_sid"] = quiz_sessions.create({
         "test_id": test_id,
         "test_code": test_code,
         "question_ids": chosen_ids,
-        "started_at": datetime.utcnow().isoformat(),
-        "duration_seconds": duration * 60
-    }
+        "option_orders": orders,
+        "trainee": trainee,
+        "attempt_no": attempt_no,
+        "session_key": session_key,
+        "max_attempts": test["max_attempts"],
+        "score_policy": test["score_policy"],
+        "started_at": started_at.isoformat(),
+        "deadline": (started_at + timedelta(minutes=duration)).isoformat(),
+    }, ttl_seconds=duration * 60 + SUBMIT_GRACE_SECONDS)
 
     return render_template("quiz.html", test_name=test["name"], duration_seconds=duration * 60, questions=quiz_questions, test_code=test_code)
 
 @app.route("/quiz/submit/<test_code>", methods=["POST"])
 def quiz_submit(test_code):
-    sq = session.get("current_quiz")
+    sq = quiz_sessions.get(session.get("quiz_sid"))
     if not sq or sq.get("test_code") != test_code:
+        # unknown, already submitted, or past deadline + SUBMIT_GRACE_SECONDS
         flash("No active quiz found or quiz expired.", "danger")
         return redirect(url_for("login"))
     test_id = sq["test_id"]
     question_ids = sq["question_ids"]
 
-    #building answers and score
-    conn = get_db_connection()
-    cur = conn.cursor()
-    placeholders = ",".join("?" for _ in question_ids)
-    cur.execute(f"SELECT id, correct FROM questions WHERE id IN ({placeholders})", tuple(question_ids))
-    rows = cur.fetchall()
-    correct_map = {r["id"]: r["correct"] for r in rows}
-    
+    #building answers and score against the cached answer keys
+    conn = get_read_connection()
+    bank = question_banks.get(conn, test_id)
+
     score = 0
     total = len(question_ids)
-    raw_answers = {}
-    for qid in question_ids:
-        field = f"q_{qid}"
-        vals = request.form.getlist(field)
-        vals_norm = ";".join(sorted(set(vals), key=lambda x: int(x))) if vals else ""
-        raw_answers[str(qid)] = vals_norm
-        correct_ans = correct_map.get(qid, "")
-        if vals_norm and correct_ans:
-            if set(vals_norm.split(";")) == set(correct_ans.split(";")):
-                score += 1
-
-    # do not insert empty submissions
-    if not any(v for v in raw_answers.values()):
+    answer_rows = []  # (question_id, selected_mask, is_correct)
+    question_results = []
+    orders = sq.get("option_orders") or [None] * total
+    for qid, order in zip(question_ids, orders):
+        # answers arrive in displayed option positions; grade in the bank's
+        selected = remap_mask(answer_mask(";".join(request.form.getlist(f"q_{qid}"))), order)
+        correct_mask = bank.correct_mask(qid)  # None if the question was deleted meanwhile
+        is_correct = bool(selected) and selected == correct_mask
+        if is_correct:
+            score += 1
+        answer_rows.append((qid, selected, 1 if is_correct else 0))
+        if selected and correct_mask is not None:
+            question_results.append((qid, is_correct))
+
+    # do not insert empty submissions while there is time left to answer; once the
+    # timer ran out (auto_submitted by the page, or the deadline passed) record the
+    # empty attempt, since quiz_start would only send the trainee straight back here
+    out_of_time = (request.form.get("auto_submitted") == "1"
+                   or datetime.utcnow() >= datetime.fromisoformat(sq["deadline"]))
+    if not out_of_time and not any(mask for _, mask, _ in answer_rows):
         flash("No answers submitted. Please answer at least one question.", "warning")
-        return redirect(url_for("quiz_start", test_code=test_code))        
-    
-    trainee = session.get("trainee")
-    trainee_id = trainee["id"] if trainee else None
-    trainee_emp = trainee["emp_id"] if trainee else None
-    trainee_name = trainee["name"] if trainee else None
-
-    # avoid duplicate recent inserts from accidental double submit
-    if trainee_id is not None:
-        cur.execute("""
-            SELECT id FROM results
-            WHERE test_id = ? AND trainee_id = ? ORDER BY attempted_at DESC LIMIT 1
-        """, (test_id, trainee_id))
-        last = cur.fetchone()
-    if last:
-        # optional: check timestamp difference and skip if too recent (e.g., <5 seconds)
-        try:
-            last_ts = datetime.fromisoformat(last["attempted_at"])
-        except Exception:
-            last_ts = None
-        if last_ts and (datetime.utcnow() - last_ts) < timedelta(seconds=5):
-            flash("Submission already received.", "info")
-            conn.close()
-            return redirect(url_for("trainer_results", test_id=test_id))
-    now = datetime.utcnow().isoformat()
-    cur.execute("""
-        INSERT INTO results (test_id, attempted_at, score, total, raw_answers, trainee_id, trainee_emp_id, trainee_name)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (test_id, now, score, total, json.dumps(raw_answers), trainee_id, trainee_emp, trainee_name))
-    conn.commit()
-    conn.close()
+        return redirect(url_for("quiz_start", test_code=test_code))
 
-    # clear session quiz state and use PRG to avoid re-post on refresh
-    session.pop("current_quiz", None)
+    # claiming removes the server copy, so a double submit (or a second
+    # worker process) cannot record the same attempt twice
+    if quiz_sessions.claim(session.pop("quiz_sid", None)) is None:
+        flash("Submission already received.", "info")
+        return redirect(url_for("login"))
+    trainee = sq["trainee"]
+    trainee_id = trainee["id"]
+    trainee_emp = trainee["emp_id"]
+    trainee_name = trainee["name"]
+
+    # hand the graded attempt to the group-commit writer; returns once durable.
+    # The session key claims the attempts row, so even a replay that got past
+    # claim() above (e.g. from another worker's memory store) is recorded once
+    sub = {
+        "test_id": test_id,
+        "attempted_at": datetime.utcnow().isoformat(),
+        "score": score,
+        "total": total,
+        "trainee_id": trainee_id,
+        "trainee_emp_id": trainee_emp,
+        "trainee_name": trainee_name,
+        "answers": answer_rows,
+        "question_results": question_results,
+        "session_key": sq.get("session_key"),
+    }
+    try:
+        result_id = submission_writer.write(sub, get_db_connection)
+    except SubmissionError:
+        app.logger.exception("submission for test %s by %s failed", test_id, trainee_emp)
+        # nothing was recorded: give the claimed session back so the same attempt can be submitted again
+        ttl = (datetime.fromisoformat(sq["deadline"]) - datetime.utcnow()).total_seconds() + SUBMIT_GRACE_SECONDS
+        if ttl <= 0:
+            flash("Your answers could not be saved and the quiz time is over. Contact the trainer.", "danger")
+            return redirect(url_for("exam_landing", test_code=test_code))
+        session["quiz_sid"] = quiz_sessions.create(sq, ttl_seconds=int(ttl))
+        flash("Your answers could not be saved. Please submit again.", "danger")
+        return redirect(url_for("quiz_start", test_code=test_code))
+    if result_id is None:
+        flash("Submission already received.", "info")
+        return redirect(url_for("login"))
 
-    return render_template("quiz_result.html", score=score, total=total, test_code=test_code)
+    # the writer regrades against the committed keys, so show its score
+    return render_template("quiz_result.html", score=sub["score"], total=total, test_code=test_code,
+                           attempt_no=sq.get("attempt_no"), max_attempts=sq.get("max_attempts"),
+                           score_policy=sq.get("score_policy"))
 
-# ---------------- Admin utility: simple DB migration if tables missing
+# ---------------- Admin utility: bring the schema up to date (see init_db.MIGRATIONS)
 def ensure_schema():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    # tests table (if not present)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS tests (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        test_code TEXT UNIQUE NOT NULL,
-        name TEXT NOT NULL DEFAULT '',
-        description TEXT DEFAULT '',
-        duration_minutes INTEGER DEFAULT 0,
-        created_at TEXT,
-        updated_at TEXT
-    )
-    """)
-    # questions table
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS questions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        test_id INTEGER NOT NULL,
-        question_text TEXT NOT NULL,
-        option1 TEXT NOT NULL,
-        option2 TEXT NOT NULL,
-        option3 TEXT NOT NULL,
-        option4 TEXT NOT NULL,
-        correct TEXT NOT NULL,
-        is_multiple INTEGER NOT NULL DEFAULT 0,
-        FOREIGN KEY (test_id) REFERENCES tests(id) ON DELETE CASCADE
-    )
-    """)
-    # results table
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS results (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        test_id INTEGER NOT NULL,
-        attempted_at TEXT NOT NULL,
-        score INTEGER NOT NULL,
-        total INTEGER NOT NULL,
-        raw_answers TEXT NOT NULL,
-        FOREIGN KEY (test_id) REFERENCES tests(id) ON DELETE CASCADE
-    )
-    """)
-    conn.commit()
-    conn.close()
+    # locked per backend, so concurrently starting workers migrate only once
+    repo.migrate()
 
-# Run schema ensure on startup
-ensure_schema()
+# wsgi.py migrates once before forking workers and sets QUIZ_MIGRATE_ON_IMPORT=0
+if os.environ.get("QUIZ_MIGRATE_ON_IMPORT", "1") != "0":
+    ensure_schema()
 
 # ---------------- Run app
 if __name__ == "__main__":
-    # debug mode for development; remove debug=True in production
+    # development server only; production runs through wsgi.py
     app.run(debug=True)
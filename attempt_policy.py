@@ -0,0 +1,65 @@
+# attempt_policy.py
+"""Per-test attempt policies, enforced when a quiz starts.
+
+Every started quiz takes the next row in the attempts ledger, numbered per
+(test, trainee) and guarded by unique indexes; the quiz session carries the
+row's key so the submission can claim it exactly once. Tests can set:
+
+- max_attempts: how many quizzes a trainee may start (0 = unlimited)
+- cooldown_minutes: wait between the end of one attempt (its submission,
+  or its start if it was never submitted) and the start of the next
+- score_policy: which attempt counts for leaderboards and points, the
+  "best" one or the "latest" one
+
+A refresh of an open quiz resumes its session and does not start an attempt.
+"""
+from datetime import datetime, timedelta
+
+SCORE_POLICIES = ("best", "latest")
+
+
+class AttemptPolicy:
+    __slots__ = ("max_attempts", "cooldown_minutes", "score_policy")
+
+    def __init__(self, max_attempts=0, cooldown_minutes=0, score_policy="best"):
+        self.max_attempts = max_attempts or 0
+        self.cooldown_minutes = cooldown_minutes or 0
+        self.score_policy = score_policy if score_policy in SCORE_POLICIES else "best"
+
+    @classmethod
+    def from_test(cls, test):
+        """Build from a tests row; NULL columns fall back to the defaults."""
+        return cls(
+            max_attempts=test["max_attempts"],
+            cooldown_minutes=test["cooldown_minutes"],
+            score_policy=test["score_policy"],
+        )
+
+    def refusal(self, last, now):
+        """Why the trainee may not start another attempt, or None.
+
+        last is the trainee's latest attempts row for the test (None before the first).
+        """
+        if last is None:
+            return None
+        if self.max_attempts and last["attempt_no"] >= self.max_attempts:
+            plural = "attempt" if self.max_attempts == 1 else "attempts"
+            return f"You have used your {self.max_attempts} {plural} for this test."
+        if self.cooldown_minutes:
+            ended = datetime.fromisoformat(last["submitted_at"] or last["started_at"])
+            wait = ended + timedelta(minutes=self.cooldown_minutes) - now
+            if wait.total_seconds() > 0:
+                minutes = int(wait.total_seconds() // 60) + 1
+                return f"You can retake this test in {minutes} minute{'s' if minutes != 1 else ''}."
+        return None
+
+    def describe(self):
+        """Short summary for the landing page, or "" when nothing is restricted."""
+        parts = []
+        if self.max_attempts:
+            parts.append(f"{self.max_attempts} attempt{'s' if self.max_attempts != 1 else ''} allowed")
+        if self.cooldown_minutes:
+            parts.append(f"{self.cooldown_minutes} min between attempts")
+        if parts and (self.max_attempts or 0) != 1:
+            parts.append(f"your {self.score_policy} score counts")
+        return ", ".join(parts)
@@ -0,0 +1,364 @@
+# benchmark.py
+"""Cohort exam-spike benchmark.
+
+Seeds a throwaway SQLite database through the real trainer routes (create
+test, CSV upload, roster import), then replays a cohort sitting an exam:
+
+  1. every trainee logs in, enters their Employee ID and starts the quiz
+  2. every trainee submits at once (timers expiring together) while trainer
+     dashboards hammer the results page
+
+Reports p50/p95/p99 latency per route, throughput and lock/queue-wait
+counters, and saves them as JSON so runs can be compared across commits:
+
+    python benchmark.py --trainees 500 --concurrency 50 -o bench_output.json
+    python benchmark.py --compare bench_output.json
+
+--server gunicorn runs the production entry point (wsgi.py) as a separate
+multi-process server; --workers 1,2,4 repeats the run on a fresh database
+per worker count and prints how throughput scales.
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import logging
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+import socket
+import http.client
+import statistics
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+
+TRAINER_PASSWORD = "bench-trainer"
+
+
+class HttpClient:
+    """Minimal cookie-keeping HTTP client that never follows redirects."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.cookies = {}
+
+    def request(self, method, path, form=None, files=None):
+        headers = {}
+        body = None
+        if files:
+            boundary = "----bench%x" % random.getrandbits(64)
+            parts = []
+            for name, value in (form or {}).items():
+                parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+            for name, (filename, data) in files.items():
+                parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                             f'Content-Type: text/csv\r\n\r\n'.encode() + data + b"\r\n")
+            body = b"".join(parts) + f"--{boundary}--\r\n".encode()
+            headers["Content-Type"] = f"multipart/form-data; boundary={boundary}"
+        elif form is not None:
+            body = urlencode(form, doseq=True).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            data = resp.read()
+            for header in resp.headers.get_all("Set-Cookie") or []:
+                for key, morsel in SimpleCookie(header).items():
+                    self.cookies[key] = morsel.value
+            return resp.status, data.decode("utf-8", "replace")
+        finally:
+            conn.close()
+
+    def get(self, path):
+        return self.request("GET", path)
+
+    def post(self, path, form=None, files=None):
+        return self.request("POST", path, form, files)
+
+
+class TestClient:
+    """Same interface over Flask's in-process test client (no sockets)."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path):
+        resp = self.client.get(path)
+        return resp.status_code, resp.get_data(as_text=True)
+
+    def post(self, path, form=None, files=None):
+        data = dict(form or {})
+        for name, (filename, content) in (files or {}).items():
+            data[name] = (io.BytesIO(content), filename)
+        resp = self.client.post(path, data=data,
+                                content_type="multipart/form-data" if files else None)
+        return resp.status_code, resp.get_data(as_text=True)
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.locked = 0
+        self._lock = threading.Lock()
+
+    def timed(self, route, fn, *args, expect=(200, 302)):
+        started = time.perf_counter()
+        status, body = fn(*args)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.samples.setdefault(route, []).append(elapsed)
+            if status not in expect:
+                self.errors[route] = self.errors.get(route, 0) + 1
+                if "locked" in body:
+                    self.locked += 1
+        return status, body
+
+    def summary(self):
+        routes = {}
+        for route, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            cuts = statistics.quantiles(ordered, n=100, method="inclusive") if len(ordered) > 1 else ordered * 99
+            routes[route] = {
+                "count": len(ordered),
+                "errors": self.errors.get(route, 0),
+                "p50_ms": round(cuts[49] * 1000, 3),
+                "p95_ms": round(cuts[94] * 1000, 3),
+                "p99_ms": round(cuts[98] * 1000, 3),
+                "max_ms": round(ordered[-1] * 1000, 3),
+            }
+        return routes
+
+
+def seed(client, args):
+    """Create tests, upload question banks and import the roster via the real routes."""
+    client.post("/trainer/login", {"trainer_password": TRAINER_PASSWORD})
+    codes = []
+    for t in range(args.tests):
+        code = f"B{t:05d}"
+        client.post("/trainer/create", {"name": f"Bench {t}", "duration": "30",
+                                        "code_mode": "manual", "manual_code": code})
+        codes.append(code)
+    status, listing = client.get("/trainer")
+    test_ids = [int(x) for x in dict.fromkeys(re.findall(r"/trainer/upload/(\d+)", listing))]
+    for test_id in test_ids:
+        rows = ["Question,Option1,Option2,Option3,Option4,Correct"]
+        for q in range(args.questions):
+            correct = random.choice(["1", "2", "3", "4", "1;3", "2;4"])
+            rows.append(f"Test {test_id} question {q},A,B,C,D,{correct}")
+        client.post(f"/trainer/upload/{test_id}", files={"csv_file": ("bank.csv", "\n".join(rows).encode())})
+    roster = "emp_id,name\n" + "".join(f"BE{i:06d},Bench Trainee {i}\n" for i in range(args.trainees))
+    client.post("/trainer/trainees/import", files={"roster_file": ("roster.csv", roster.encode())})
+    return codes, test_ids
+
+
+def start_wsgi_server(workdir, workers, threads):
+    """Launch wsgi.py on a free port; returns (process, port) once it accepts connections."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = dict(os.environ, QUIZ_SERVER="gunicorn", QUIZ_BIND=f"127.0.0.1:{port}",
+               QUIZ_WORKERS=str(workers), QUIZ_THREADS=str(threads))
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    proc = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "wsgi.py")],
+                            env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"wsgi.py exited with {proc.returncode}; see {log.name}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return proc, port
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise SystemExit(f"wsgi.py did not start listening within 30s; see {log.name}")
+
+
+def run(args, workers=1):
+    workdir = tempfile.mkdtemp(prefix="quiz-bench-")
+    db_path = os.path.join(workdir, "bench.db")
+    os.environ["QUIZ_DB_PATH"] = db_path
+    os.environ["TRAINER_PASSWORD"] = TRAINER_PASSWORD
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    server = proc = quiz_app = None
+    if args.server == "gunicorn":
+        # a separate process tree; stats come back over HTTP
+        proc, port = start_wsgi_server(workdir, workers, args.threads)
+        make_client = lambda: HttpClient("127.0.0.1", port)
+    else:
+        import app as quiz_app  # imported late so it picks up the temp database
+    if args.server == "wsgi":
+        from werkzeug.serving import make_server
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no per-request access log
+        server = make_server("127.0.0.1", 0, quiz_app.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        make_client = lambda: HttpClient("127.0.0.1", server.server_port)
+    elif args.server == "client":
+        make_client = lambda: TestClient(quiz_app.app)
+
+    started = time.perf_counter()
+    codes, test_ids = seed(make_client(), args)
+    seed_seconds = time.perf_counter() - started
+
+    rec = Recorder()
+    trainees = [(f"BE{i:06d}", random.choice(codes), make_client()) for i in range(args.trainees)]
+    pending = {}
+
+    def start_exam(trainee):
+        emp_id, code, client = trainee
+        rec.timed("login", client.post, "/", {"action": "trainee_login", "test_code": code})
+        rec.timed("exam_landing", client.post, f"/exam/{code}", {"emp_id": emp_id})
+        status, body = rec.timed("quiz_start", client.get, f"/quiz/start/{code}", expect=(200,))
+        pending[emp_id] = sorted(set(re.findall(r'name="q_(\d+)"', body)))
+
+    def submit_exam(trainee):
+        emp_id, code, client = trainee
+        form = {f"q_{qid}": [str(random.randint(1, 4))] for qid in pending.get(emp_id, [])}
+        rec.timed("quiz_submit", client.post, f"/quiz/submit/{code}", form, expect=(200,))
+
+    stop_dashboards = threading.Event()
+
+    def watch_dashboard(n):
+        client = make_client()
+        client.post("/trainer/login", {"trainer_password": TRAINER_PASSWORD})
+        done = 0
+        while not stop_dashboards.is_set() and done < args.dashboard_requests:
+            rec.timed("trainer_results", client.get, f"/trainer/results/{random.choice(test_ids)}", expect=(200,))
+            done += 1
+
+    phase_start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(start_exam, trainees))
+    start_seconds = time.perf_counter() - phase_start
+
+    phase_start = time.perf_counter()
+    watchers = [threading.Thread(target=watch_dashboard, args=(i,)) for i in range(args.dashboard_clients)]
+    for w in watchers:
+        w.start()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        list(pool.map(submit_exam, trainees))
+    submit_seconds = time.perf_counter() - phase_start
+    stop_dashboards.set()
+    for w in watchers:
+        w.join()
+
+    if proc is not None:
+        # only the worker that answers reports; its pools are one process's share
+        admin = make_client()
+        admin.post("/trainer/login", {"trainer_password": TRAINER_PASSWORD})
+        worker_stats = json.loads(admin.get("/trainer/pool-stats")[1])
+        proc.terminate()
+        proc.wait(30)
+    else:
+        worker_stats = {"writer": quiz_app.db_writer_pool.stats(), "reader": quiz_app.db_reader_pool.stats(),
+                        "submissions": quiz_app.submission_writer.stats()}
+    if server is not None:
+        server.shutdown()
+    with sqlite3.connect(db_path) as conn:
+        stored = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": dict(vars(args), workers=workers if proc is not None else 1),
+        "seed_seconds": round(seed_seconds, 3),
+        "routes": rec.summary(),
+        "throughput": {
+            "exam_starts_per_sec": round(len(trainees) / start_seconds, 1) if start_seconds else None,
+            "submissions_per_sec": round(len(trainees) / submit_seconds, 1) if submit_seconds else None,
+            "results_stored": stored,
+        },
+        "lock_waits": {
+            "database_locked_errors": rec.locked,
+            "writer_pool": worker_stats["writer"],
+            "reader_pool": worker_stats["reader"],
+            "submission_writer": worker_stats["submissions"],
+        },
+    }
+
+
+def compare(current, baseline):
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline.get('timestamp')}):")
+    for route, stats in current["routes"].items():
+        old = baseline.get("routes", {}).get(route)
+        if not old:
+            continue
+        deltas = "  ".join(
+            f"{k} {stats[k]:.1f} ({(stats[k] - old[k]) / old[k] * 100:+.0f}%)" if old[k] else f"{k} {stats[k]:.1f}"
+            for k in ("p50_ms", "p95_ms", "p99_ms"))
+        print(f"  {route:16} {deltas}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tests", type=int, default=3)
+    parser.add_argument("--questions", type=int, default=50, help="questions per test")
+    parser.add_argument("--trainees", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent trainee clients")
+    parser.add_argument("--dashboard-clients", type=int, default=4)
+    parser.add_argument("--dashboard-requests", type=int, default=200, help="max requests per dashboard client")
+    parser.add_argument("--server", choices=("wsgi", "client", "gunicorn"), default="wsgi",
+                        help="threaded local WSGI server, Flask's in-process test client, "
+                             "or wsgi.py under gunicorn in a separate process")
+    parser.add_argument("--workers", default="1",
+                        help="gunicorn worker counts, comma separated (e.g. 1,2,4); one run each")
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument("--output", "-o", default="bench_output.json")
+    parser.add_argument("--compare", metavar="JSON", help="previous run to compare against")
+    args = parser.parse_args()
+    worker_counts = [int(w) for w in args.workers.split(",")]
+    if len(worker_counts) > 1 and args.server != "gunicorn":
+        parser.error("several --workers values need --server gunicorn")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+    results = []
+    for workers in worker_counts:
+        result = run(args, workers)
+        results.append(result)
+        if len(worker_counts) > 1:
+            print(f"\n== {workers} worker(s)")
+        print(f"{'route':16} {'count':>7} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for route, s in result["routes"].items():
+            print(f"{route:16} {s['count']:>7} {s['errors']:>6} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f}")
+        print("throughput:", result["throughput"])
+        print("lock waits: locked errors", result["lock_waits"]["database_locked_errors"],
+              "| writer pool waits", result["lock_waits"]["writer_pool"]["waits"],
+              "| submission batches", result["lock_waits"]["submission_writer"]["batches"])
+
+    with open(args.output, "w") as fh:
+        # a sweep saves every run; a single run keeps the comparable layout
+        json.dump(results[0] if len(results) == 1 else {"runs": results}, fh, indent=2)
+    if len(results) > 1:
+        print(f"\n{'workers':>7} {'starts/s':>10} {'submits/s':>10} {'submit p95 ms':>14} {'locked':>7}")
+        for result in results:
+            t, submit = result["throughput"], result["routes"].get("quiz_submit", {})
+            print(f"{result['config']['workers']:>7} {t['exam_starts_per_sec']:>10} {t['submissions_per_sec']:>10} "
+                  f"{submit.get('p95_ms', 0):>14.2f} {result['lock_waits']['database_locked_errors']:>7}")
+    print(f"saved to {args.output}")
+    if baseline:
+        if "runs" in baseline:
+            baseline = baseline["runs"][-1]
+        compare(results[-1], baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# dashboard_cache.py
+"""Per-test cache of the results dashboard payload.
+
+Entries are keyed by (test_id, tests.dashboard_version). Every write that
+changes what the dashboard shows bumps that version in the same transaction,
+so a cached payload is valid for exactly as long as its version is current
+and never needs explicit invalidation; old versions simply fall out of the
+LRU or expire after ttl seconds. The version also makes the ETag, so a
+polling client whose copy is current gets a 304 without the payload even
+being looked up.
+"""
+import gzip
+import json
+import time
+import threading
+from collections import OrderedDict
+
+
+class DashboardPayload:
+    __slots__ = ("test_id", "version", "etag", "body", "created", "_gzipped")
+
+    def __init__(self, test_id, version, data):
+        self.test_id = test_id
+        self.version = version
+        self.etag = dashboard_etag(test_id, version)
+        self.body = json.dumps(data, separators=(",", ":")).encode()
+        self.created = time.monotonic()
+        self._gzipped = None
+
+    @property
+    def gzipped(self):
+        # compressed once per version, on the first client that accepts gzip
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6)
+        return self._gzipped
+
+
+def dashboard_etag(test_id, version):
+    """ETag value (unquoted); sent as weak so gzip and identity share it."""
+    return f"dash-{test_id}-{version}"
+
+
+class DashboardCache:
+    def __init__(self, max_entries=256, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, test_id, version):
+        key = (test_id, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.created < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, test_id, version, data):
+        entry = DashboardPayload(test_id, version, data)
+        with self._lock:
+            # only the newest version of a test is worth keeping
+            for key in [k for k in self._entries if k[0] == test_id and k[1] != version]:
+                del self._entries[key]
+            self._entries[(test_id, version)] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,184 @@
+# db_pool.py
+"""Thread-safe SQLite connection pools.
+
+Connections are opened once, configured once (pragmas, mmap, page cache,
+foreign keys, statement cache) and then reused across requests instead of
+being reopened per request. app.py keeps one writer pool and one read-only
+pool and hands connections out through flask.g.
+"""
+import os
+import time
+import queue
+import sqlite3
+import threading
+from pathlib import Path
+
+
+class PoolTimeout(RuntimeError):
+    """Raised when no connection became free within checkout_timeout."""
+
+
+class ConnectionPool:
+    # driver exceptions that mark a connection as broken; subclasses for
+    # other drivers (repository.PostgresPool) override this and _connect()
+    errors = (sqlite3.Error,)
+
+    def __init__(self, db_path, size=4, readonly=False, timeout=30, checkout_timeout=30,
+                 cached_statements=256, mmap_size=256 * 1024 * 1024, cache_size_kib=16 * 1024,
+                 health_check_interval=30, factory=sqlite3.Connection,
+                 journal_size_limit=64 * 1024 * 1024):
+        self.db_path = db_path
+        self.factory = factory
+        self.size = size
+        self.readonly = readonly
+        self.timeout = timeout
+        self.checkout_timeout = checkout_timeout
+        self.cached_statements = cached_statements
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.health_check_interval = health_check_interval
+        self.journal_size_limit = journal_size_limit
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # called at construction and again in a forked child, which must not
+        # reuse the parent's sqlite handles
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._last_used = {}
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self.replaced = 0
+
+    def _connect(self):
+        if self.readonly:
+            target, uri = Path(self.db_path).absolute().as_uri() + "?mode=ro", True
+        else:
+            target, uri = self.db_path, False
+        conn = sqlite3.connect(target, uri=uri, timeout=self.timeout,
+                               detect_types=sqlite3.PARSE_DECLTYPES,
+                               check_same_thread=False,
+                               cached_statements=self.cached_statements,
+                               factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        if not self.readonly:
+            # journal mode is persistent in the file; only a writer may change it
+            conn.execute("PRAGMA journal_mode=WAL;")
+            # under several worker processes the WAL rarely gets a reader-free
+            # moment to restart; truncate it after checkpoints so it cannot
+            # stay at its high-water mark
+            conn.execute(f"PRAGMA journal_size_limit={int(self.journal_size_limit)};")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute("PRAGMA foreign_keys=ON;")
+        conn.execute("PRAGMA temp_store=MEMORY;")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)};")
+        # negative cache_size is in KiB rather than pages
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kib)};")
+        return conn
+
+    def open_connection(self):
+        """A configured connection outside the pool; the caller owns and closes it."""
+        return self._connect()
+
+    def _healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except self.errors:
+            return False
+
+    def acquire(self):
+        if os.getpid() != self._pid:
+            with self._lock:
+                if os.getpid() != self._pid:
+                    self._reset()
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                grow = self._created < self.size
+                if grow:
+                    self._created += 1
+            if grow:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                started = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.checkout_timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self.timeouts += 1
+                    raise PoolTimeout(f"no database connection free after {self.checkout_timeout}s")
+                waited = time.perf_counter() - started
+                with self._lock:
+                    self.waits += 1
+                    self.wait_seconds += waited
+                    self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+        idle_for = time.monotonic() - self._last_used.get(id(conn), time.monotonic())
+        if idle_for > self.health_check_interval and not self._healthy(conn):
+            self._discard(conn)
+            conn = self._connect()
+            with self._lock:
+                self._created += 1
+                self.replaced += 1
+        with self._lock:
+            self.checkouts += 1
+        return conn
+
+    def release(self, conn):
+        if os.getpid() != self._pid:
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except self.errors:
+            self._discard(conn)
+            return
+        self._last_used[id(conn)] = time.monotonic()
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        try:
+            conn.close()
+        except self.errors:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            idle = self._idle.qsize()
+            return {
+                "size": self.size,
+                "readonly": self.readonly,
+                "open": self._created,
+                "idle": idle,
+                "in_use": self._created - idle,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_seconds_total": round(self.wait_seconds, 6),
+                "wait_seconds_max": round(self.max_wait_seconds, 6),
+                "timeouts": self.timeouts,
+                "replaced": self.replaced,
+            }
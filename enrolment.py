@@ -0,0 +1,178 @@
+# enrolment.py
+"""Bulk test enrolment from pasted Employee IDs or a roster file (CSV or JSON Lines).
+
+IDs are resolved to trainees a batch at a time through the lower(emp_id)
+index and inserted with ON CONFLICT DO NOTHING, one transaction per batch,
+so enrolling a whole roster costs a few statements per thousand trainees.
+The same transaction keeps the test_stats enrolment counters that the
+dashboard reads in step.
+A roster export can be uploaded as is: only the first CSV column (or the
+emp_id key) is read.
+"""
+import re
+import csv
+import json
+import codecs
+from datetime import datetime
+
+from roster import EMP_ID_RE
+
+EMP_ID_SEPARATORS = re.compile(r"[\s,;]+")
+
+
+class EnrolmentReport:
+    def __init__(self):
+        self.rows = 0
+        self.enrolled = 0
+        self.already = 0
+        self.unknown = []  # the first max_errors (line number, emp_id) not in the trainees table
+        self.unknown_count = 0
+        self.errors = []  # (line number, message)
+
+    @property
+    def rejected(self):
+        """Rows neither enrolled nor already enrolled: unknown, malformed or unread."""
+        return self.rows - self.enrolled - self.already
+
+    def error_messages(self, limit=5):
+        msgs = [f"Line {line}: {msg}" for line, msg in self.errors[:limit]]
+        if self.unknown_count:
+            shown = [emp_id for _, emp_id in self.unknown[:limit]]
+            more = self.unknown_count - len(shown)
+            msgs.append(f"Not registered: {', '.join(shown)}" + (f" and {more} more" if more else ""))
+        if len(self.errors) > limit:
+            msgs.append(f"... and {len(self.errors) - limit} more error(s)")
+        return msgs
+
+
+def iter_pasted_ids(text):
+    """Yield (line, emp_id) from text with IDs separated by newlines, commas or spaces."""
+    for line_no, line in enumerate(text.splitlines(), start=1):
+        for emp_id in EMP_ID_SEPARATORS.split(line):
+            if emp_id:
+                yield line_no, emp_id
+
+
+def iter_file_ids(byte_stream, fmt="csv"):
+    """Yield (line, emp_id) from a roster file; emp_id is None for an unreadable record."""
+    lines = codecs.iterdecode(byte_stream, "utf-8-sig")
+    if fmt == "jsonl":
+        for line_no, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, str(json.loads(line).get("emp_id") or "").strip()
+            except (ValueError, AttributeError):
+                yield line_no, None
+        return
+    reader = csv.reader(lines)
+    for r in reader:
+        if not r or not r[0].strip():
+            continue
+        if reader.line_num == 1 and r[0].strip().lower().replace(" ", "_") in ("emp_id", "employee_id", "standard_id"):
+            continue
+        yield reader.line_num, r[0].strip()
+
+
+def insert_enrolment_rows(cur, test_id, trainee_ids, enrolled_at):
+    """Enrol trainee_ids in test_id, skipping existing enrolments, and mark the dashboard stale."""
+    trainee_ids = list(trainee_ids)
+    added = []
+    for i in range(0, len(trainee_ids), 500):
+        chunk = trainee_ids[i:i + 500]
+        added.extend(r[0] for r in cur.execute(f"""
+            INSERT INTO test_enrolments (test_id, trainee_id, enrolled_at)
+            VALUES {", ".join("(?, ?, ?)" for _ in chunk)}
+            ON CONFLICT (test_id, trainee_id) DO NOTHING
+            RETURNING trainee_id
+        """, [v for trainee_id in chunk for v in (test_id, trainee_id, enrolled_at)]).fetchall())
+    update_enrolment_stats(cur, test_id, added, 1)
+    cur.execute("UPDATE tests SET dashboard_version = dashboard_version + 1 WHERE id = ?", (test_id,))
+
+
+def update_enrolment_stats(cur, test_id, trainee_ids, sign):
+    """Count trainee_ids into (sign=1) or out of (sign=-1) test_stats.enrolled and enrolled_participants.
+
+    Runs in the caller's transaction; one seek into results per trainee.
+    """
+    if not trainee_ids:
+        return
+    participants = 0
+    for i in range(0, len(trainee_ids), 500):
+        chunk = trainee_ids[i:i + 500]
+        participants += cur.execute(f"""
+            SELECT COUNT(DISTINCT trainee_id) FROM results
+            WHERE test_id = ? AND trainee_id IN ({",".join("?" for _ in chunk)})
+        """, (test_id, *chunk)).fetchone()[0]
+    cur.execute("""
+        INSERT INTO test_stats (test_id, enrolled, enrolled_participants) VALUES (?, ?, ?)
+        ON CONFLICT(test_id) DO UPDATE SET
+            enrolled = test_stats.enrolled + excluded.enrolled,
+            enrolled_participants = test_stats.enrolled_participants + excluded.enrolled_participants
+    """, (test_id, sign * len(trainee_ids), sign * participants))
+
+
+def _enrol_batch(conn, test_id, batch, report, now, enrol, max_errors):
+    cur = conn.cursor()
+    keys = list(dict.fromkeys(emp_id.lower() for _, emp_id in batch))
+    placeholders = ",".join("?" for _ in keys)
+    cur.execute(f"SELECT id, lower(emp_id) FROM trainees WHERE lower(emp_id) IN ({placeholders})", tuple(keys))
+    found = {r[1]: r[0] for r in cur.fetchall()}
+    ids = list(dict.fromkeys(found[k] for k in keys if k in found))
+    existing = set()
+    if ids:
+        cur.execute(f"SELECT trainee_id FROM test_enrolments WHERE test_id = ? "
+                    f"AND trainee_id IN ({','.join('?' for _ in ids)})", (test_id, *ids))
+        existing = {r[0] for r in cur.fetchall()}
+    seen = set()
+    for line_no, emp_id in batch:
+        trainee_id = found.get(emp_id.lower())
+        if trainee_id is None:
+            report.unknown_count += 1
+            if len(report.unknown) < max_errors:
+                report.unknown.append((line_no, emp_id))
+        elif trainee_id in existing or trainee_id in seen:
+            report.already += 1
+        else:
+            seen.add(trainee_id)
+            report.enrolled += 1
+    if seen:
+        enrol(cur, test_id, sorted(seen), now)
+    conn.commit()
+
+
+def enrol_trainees(conn, test_id, records, batch_size=1000, max_errors=1000, enrol=insert_enrolment_rows):
+    """Enrol the trainees named by records, (line, emp_id) pairs from iter_pasted_ids/iter_file_ids.
+
+    Unregistered and malformed IDs are reported and skipped; both are
+    counted, but only the first max_errors of each are kept. enrol(cursor,
+    test_id, trainee_ids, enrolled_at) writes one batch; the storage backend
+    can swap in its own statement.
+    """
+    report = EnrolmentReport()
+    now = datetime.utcnow().isoformat()
+    batch = []
+    try:
+        for line_no, emp_id in records:
+            report.rows += 1
+            if emp_id is None:
+                error = "Invalid JSON object"
+            elif not EMP_ID_RE.fullmatch(emp_id):
+                error = f"Employee ID '{emp_id}' must be alphanumeric"
+            else:
+                batch.append((line_no, emp_id))
+                if len(batch) >= batch_size:
+                    _enrol_batch(conn, test_id, batch, report, now, enrol, max_errors)
+                    batch = []
+                continue
+            if len(report.errors) < max_errors:
+                report.errors.append((line_no, error))
+        if batch:
+            _enrol_batch(conn, test_id, batch, report, now, enrol, max_errors)
+    except UnicodeDecodeError as e:
+        conn.rollback()
+        report.errors.append((report.rows + 1, f"File is not valid UTF-8 ({e.reason})"))
+    except Exception:
+        conn.rollback()
+        raise
+    return report
@@ -1,23 +1,33 @@
 # init_db.py
+import os
+import sys
+import json
 import sqlite3
+from contextlib import contextmanager
 from datetime import datetime
 
-DB_PATH = "quiz.db"
+from aggregates import rebuild_dashboard_stats, rebuild_enrolment_stats, rebuild_trainee_progress
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DB_PATH = os.environ.get("QUIZ_DB_PATH", "quiz.db")
+# the SQL relies on RETURNING and ALTER TABLE ... DROP COLUMN, both new in 3.35
+MIN_SQLITE_VERSION = (3, 35)
+
+def require_sqlite_version():
+    """Fail at startup, not on the first write, when Python's SQLite is too old."""
+    if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+        raise RuntimeError(f"SQLite {'.'.join(map(str, MIN_SQLITE_VERSION))} or newer is required; "
+                           f"this Python is linked against {sqlite3.sqlite_version}")
 
 def init_db():
     conn = sqlite3.connect(DB_PATH)
+    migrate_schema(conn)
     c = conn.cursor()
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS tests (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        test_code TEXT UNIQUE NOT NULL,
-        name TEXT NOT NULL,
-        description TEXT DEFAULT '',
-        duration_minutes INTEGER DEFAULT 0,
-        created_at TEXT,
-        updated_at TEXT
-    )
-    """)
     sample_codes = [
         ("123456", "Orientation Quiz", "A quick intro quiz", 10),
         ("654321", "Security Awareness", "Phishing & security basics", 20),
@@ -36,10 +46,29 @@ def init_db():
     conn.close()
     print("Database initialized/updated at", DB_PATH)
 
-def migrate():
-    conn = sqlite3.connect(DB_PATH)
+# ---------------- Versioned schema migrations
+# Each migration is applied once, in order, and recorded in PRAGMA user_version.
+# Migrations must be idempotent against databases created before versioning
+# existed (user_version 0), which is why they check before ALTERing.
+
+def _add_column(c, table, column, decl):
+    cols = [r[1] for r in c.execute(f"PRAGMA table_info({table})").fetchall()]
+    if column not in cols:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def _m001_base_schema(conn):
     c = conn.cursor()
-    # questions table
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS tests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        test_code TEXT UNIQUE NOT NULL,
+        name TEXT NOT NULL,
+        description TEXT DEFAULT '',
+        duration_minutes INTEGER DEFAULT 0,
+        created_at TEXT,
+        updated_at TEXT
+    )
+    """)
     c.execute("""
     CREATE TABLE IF NOT EXISTS questions (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -62,18 +91,10 @@ def migrate():
         attempted_at TEXT NOT NULL,
         score INTEGER NOT NULL,
         total INTEGER NOT NULL,
-        raw_answers TEXT NOT NULL, -- JSON or simple encoding of answers
         FOREIGN KEY (test_id) REFERENCES tests(id) ON DELETE CASCADE
     )
     """)
-    conn.commit()
-    conn.close()
-    print("Migration complete")
-
-def add_trainees():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""
+    c.execute("""
     CREATE TABLE IF NOT EXISTS trainees (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         emp_id TEXT NOT NULL UNIQUE,
@@ -81,54 +102,489 @@ def add_trainees():
         created_at TEXT
     )
     """)
-    conn.commit()
-    conn.close()
-    print("Trainees table ensured.")
+    _add_column(c, "tests", "total_trainees", "INTEGER DEFAULT 0")
+    _add_column(c, "results", "trainee_id", "INTEGER")
+    _add_column(c, "results", "trainee_emp_id", "TEXT")
+    _add_column(c, "results", "trainee_name", "TEXT")
 
-def add_total_trainees():
-    conn = sqlite3.connect(DB_PATH)
+def _m002_stats_tables(conn):
     c = conn.cursor()
-    # Add column if not exists (SQLite doesn't support IF NOT EXISTS for ALTER, so check pragma)
-    cols = [r[1] for r in c.execute("PRAGMA table_info(tests)").fetchall()]
-    if "total_trainees" not in cols:
-        c.execute("ALTER TABLE tests ADD COLUMN total_trainees INTEGER DEFAULT 0")
-        print("Added total_trainees column.")
-    else:
-        print("Column total_trainees already exists.")
-    conn.commit()
-    conn.close()
+    # dashboard aggregates maintained incrementally by quiz_submit; existing
+    # attempts are counted by _m003 once their answers are in result_answers
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS question_stats (
+        question_id INTEGER PRIMARY KEY,
+        test_id INTEGER NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0, -- attempts with a non-empty selection
+        correct INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS test_stats (
+        test_id INTEGER PRIMARY KEY,
+        participants INTEGER NOT NULL DEFAULT 0,
+        bucket_100 INTEGER NOT NULL DEFAULT 0,
+        bucket_75plus INTEGER NOT NULL DEFAULT 0,
+        bucket_50to75 INTEGER NOT NULL DEFAULT 0,
+        bucket_below50 INTEGER NOT NULL DEFAULT 0
+    )
+    """)
 
+def _m003_result_answers(conn):
+    _, skipped = convert_raw_answers(conn)
+    if skipped:
+        print(f"Skipped {skipped} unreadable raw_answers entries", file=sys.stderr)
+    rebuild_dashboard_stats(conn.cursor())
 
+def _m004_hot_indexes(conn):
+    c = conn.cursor()
+    # trainer_results attempts list and per-test result scans
+    c.execute("CREATE INDEX IF NOT EXISTS idx_results_test_attempted ON results (test_id, attempted_at)")
+    # latest-attempt lookup for a trainee; covering since id is the rowid
+    c.execute("CREATE INDEX IF NOT EXISTS idx_results_test_trainee ON results (test_id, trainee_id, attempted_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_questions_test ON questions (test_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_question_stats_test ON question_stats (test_id)")
+    # exam_landing does a case-insensitive Employee ID lookup
+    c.execute("CREATE INDEX IF NOT EXISTS idx_trainees_emp_lower ON trainees (lower(emp_id))")
 
-if __name__ == "__main__":
-    init_db()
-    migrate()
-    add_trainees()
-    add_total_trainees()
-
-    #add_results_trainee
-    conn=sqlite3.connect(DB_PATH)
-    cur=conn.cursor()
-    # Only add columns if not exists
-    cols = [r[1] for r in cur.execute("PRAGMA table_info(results)").fetchall()]
-    if "trainee_id" not in cols:
-        cur.execute("ALTER TABLE results ADD COLUMN trainee_id INTEGER")
-    if "trainee_emp_id" not in cols:
-        cur.execute("ALTER TABLE results ADD COLUMN trainee_emp_id TEXT")
+def _m005_question_text_index(conn):
+    c = conn.cursor()
+    # serves both "questions of a test" and the importer's duplicate check,
+    # so the single-column index is redundant
+    c.execute("CREATE INDEX IF NOT EXISTS idx_questions_test_text ON questions (test_id, question_text)")
+    c.execute("DROP INDEX IF EXISTS idx_questions_test")
+
+def _m006_trainee_listing_index(conn):
+    # keyset pagination of the trainee list orders on this expression
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trainees_created ON trainees (COALESCE(created_at, ''))")
+
+def _m007_quiz_sessions(conn):
+    # server-side quiz sessions (see quiz_sessions.py); the cookie only holds the id
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS quiz_sessions (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at TEXT NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_quiz_sessions_expires ON quiz_sessions (expires_at)")
+
+def _m008_sampling_config(conn):
+    # per-test sampling settings (see sampling.py) and the fields they stratify on
+    _add_column(conn, "tests", "question_count", "INTEGER")
+    _add_column(conn, "tests", "stratify_by", "TEXT")
+    _add_column(conn, "tests", "shuffle_options", "INTEGER DEFAULT 0")
+    _add_column(conn, "tests", "seeded_draw", "INTEGER DEFAULT 0")
+    _add_column(conn, "questions", "topic", "TEXT")
+    _add_column(conn, "questions", "difficulty", "TEXT")
+
+def _m009_correct_mask(conn):
+    # answer keys compiled to bitmasks at upload; grading compares integers
+    _add_column(conn, "questions", "correct_mask", "INTEGER NOT NULL DEFAULT 0")
+    conn.create_function("answer_mask", 1, answer_mask, deterministic=True)
+    conn.execute("UPDATE questions SET correct_mask = answer_mask(correct)")
+
+def _m010_dashboard_version(conn):
+    # bumped with every write that changes the results dashboard (see dashboard_cache.py)
+    _add_column(conn, "tests", "dashboard_version", "INTEGER NOT NULL DEFAULT 0")
+
+def _m011_trainee_progress(conn):
+    # per-trainee rollups maintained by quiz_submit (see repository.record_trainee_progress);
+    # leaderboards read a top-N straight off these indexes. Existing attempts
+    # are backfilled by _m012, once tests.score_policy and latest_pct exist.
+    c = conn.cursor()
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS trainee_test_stats (
+        trainee_id INTEGER NOT NULL,
+        test_id INTEGER NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        best_score INTEGER NOT NULL DEFAULT 0,
+        best_total INTEGER NOT NULL DEFAULT 0,
+        best_pct REAL NOT NULL DEFAULT 0, -- best attempt by percentage; the earliest wins ties
+        best_at TEXT,
+        latest_score INTEGER NOT NULL DEFAULT 0,
+        latest_total INTEGER NOT NULL DEFAULT 0,
+        latest_at TEXT,
+        score_sum INTEGER NOT NULL DEFAULT 0, -- average = score_sum / total_sum
+        total_sum INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (trainee_id, test_id)
+    ) WITHOUT ROWID
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS trainee_stats (
+        trainee_id INTEGER PRIMARY KEY,
+        tests_taken INTEGER NOT NULL DEFAULT 0,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        points INTEGER NOT NULL DEFAULT 0, -- sum of best scores across tests
+        score_sum INTEGER NOT NULL DEFAULT 0,
+        total_sum INTEGER NOT NULL DEFAULT 0,
+        last_attempt_at TEXT
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_trainee_test_stats_rank "
+              "ON trainee_test_stats (test_id, best_pct DESC, best_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_trainee_stats_points ON trainee_stats (points DESC, trainee_id)")
+
+def _m012_attempt_ledger(conn):
+    # per-test attempt policies (see attempt_policy.py) and the ledger that enforces them:
+    # one row per started quiz, numbered per (test, trainee); the unique indexes make a
+    # concurrent second start or a replayed submission fail instead of slipping through
+    c = conn.cursor()
+    _add_column(c, "tests", "max_attempts", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(c, "tests", "cooldown_minutes", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(c, "tests", "score_policy", "TEXT NOT NULL DEFAULT 'best'")
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS attempts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        test_id INTEGER NOT NULL,
+        trainee_id INTEGER NOT NULL,
+        attempt_no INTEGER NOT NULL,
+        session_key TEXT NOT NULL, -- idempotency key carried by the quiz session
+        started_at TEXT NOT NULL,
+        submitted_at TEXT,
+        result_id INTEGER,
+        FOREIGN KEY (test_id) REFERENCES tests(id) ON DELETE CASCADE
+    )
+    """)
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_attempts_trainee ON attempts (test_id, trainee_id, attempt_no)")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_attempts_session ON attempts (session_key)")
+    # attempts recorded before the ledger count towards max_attempts
+    c.execute("""
+    INSERT OR IGNORE INTO attempts (test_id, trainee_id, attempt_no, session_key, started_at, submitted_at, result_id)
+    SELECT test_id, trainee_id,
+           ROW_NUMBER() OVER (PARTITION BY test_id, trainee_id ORDER BY attempted_at, id),
+           'result-' || id, attempted_at, attempted_at, id
+    FROM results
+    WHERE trainee_id IS NOT NULL
+    """)
+    # the latest attempt's percentage, for ranking tests scored by the latest attempt
+    _add_column(c, "trainee_test_stats", "latest_pct", "REAL NOT NULL DEFAULT 0")
+    # roll up the attempts recorded before the trainee progress tables existed
+    rebuild_trainee_progress(c)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_trainee_test_stats_latest "
+              "ON trainee_test_stats (test_id, latest_pct DESC, latest_at)")
+
+def _m013_jobs(conn):
+    # background job queue for heavy trainer actions (see jobs.py); no foreign key to
+    # tests, since a delete job has to outlive the test it deletes
+    c = conn.cursor()
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        test_id INTEGER,
+        lane TEXT, -- jobs in one lane run one at a time, in id order
+        params TEXT NOT NULL, -- JSON
+        status TEXT NOT NULL DEFAULT 'queued', -- queued, running, done, failed, cancelled
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        run_after TEXT NOT NULL,
+        processed INTEGER NOT NULL DEFAULT 0,
+        total INTEGER NOT NULL DEFAULT 0,
+        result TEXT, -- JSON
+        error TEXT,
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        worker TEXT,
+        created_at TEXT NOT NULL,
+        started_at TEXT,
+        heartbeat_at TEXT,
+        finished_at TEXT
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, run_after)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_lane ON jobs (lane, status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_test ON jobs (test_id, id)")
+
+def _m014_test_enrolments(conn):
+    # per-test enrolment (see enrolment.py): a test with enrolments only admits its
+    # enrolled trainees, and participation is enrolment against results
+    c = conn.cursor()
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS test_enrolments (
+        test_id INTEGER NOT NULL,
+        trainee_id INTEGER NOT NULL,
+        enrolled_at TEXT NOT NULL,
+        PRIMARY KEY (test_id, trainee_id),
+        FOREIGN KEY (test_id) REFERENCES tests(id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+    """)
+    # the enrolment list pages newest first; delete_trainee clears a trainee's rows
+    c.execute("CREATE INDEX IF NOT EXISTS idx_test_enrolments_enrolled "
+              "ON test_enrolments (test_id, enrolled_at, trainee_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_test_enrolments_trainee ON test_enrolments (trainee_id)")
+
+def _m015_enrolment_counters(conn):
+    # enrolled trainees and how many of them attempted the test, kept in step by
+    # enrolment.update_enrolment_stats and record_submission, so the dashboard and
+    # the enrolments page read two counters instead of walking the enrolments
+    c = conn.cursor()
+    _add_column(c, "test_stats", "enrolled", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(c, "test_stats", "enrolled_participants", "INTEGER NOT NULL DEFAULT 0")
+    rebuild_enrolment_stats(c)
+
+MIGRATIONS = [
+    (1, "base tables and trainee columns", _m001_base_schema),
+    (2, "dashboard aggregate tables", _m002_stats_tables),
+    (3, "normalized result_answers", _m003_result_answers),
+    (4, "indexes for hot lookups", _m004_hot_indexes),
+    (5, "question text index for duplicate checks", _m005_question_text_index),
+    (6, "trainee listing index", _m006_trainee_listing_index),
+    (7, "server-side quiz sessions", _m007_quiz_sessions),
+    (8, "question sampling configuration", _m008_sampling_config),
+    (9, "compiled answer-key bitmasks", _m009_correct_mask),
+    (10, "dashboard payload version", _m010_dashboard_version),
+    (11, "trainee progress rollups", _m011_trainee_progress),
+    (12, "attempt policies and ledger", _m012_attempt_ledger),
+    (13, "background job queue", _m013_jobs),
+    (14, "per-test enrolment", _m014_test_enrolments),
+    (15, "enrolment counters on test_stats", _m015_enrolment_counters),
+]
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate_schema(conn, verbose=False):
+    """Bring the database up to the latest migration. Returns the new version."""
+    require_sqlite_version()
+    version = schema_version(conn)
+    for target, description, apply in MIGRATIONS:
+        if target <= version:
+            continue
+        apply(conn)
+        # PRAGMA does not accept bound parameters; target is a trusted int
+        conn.execute(f"PRAGMA user_version = {int(target)}")
+        conn.commit()
+        version = target
+        if verbose:
+            print(f"Applied migration {target}: {description}")
+    return version
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive advisory lock on path, held across processes until the block exits."""
+    with open(path, "a+b") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        else:
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+def migrate_locked(db_path=DB_PATH, verbose=False):
+    """migrate_schema() safe to call from many worker processes at once.
+
+    An up-to-date database costs one PRAGMA read. Otherwise the first process
+    migrates while holding <db>.migrate.lock; the rest wait on the lock and
+    then find nothing left to do.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        if schema_version(conn) >= MIGRATIONS[-1][0]:
+            return schema_version(conn)
+        with _file_lock(db_path + ".migrate.lock"):
+            return migrate_schema(conn, verbose)
+    finally:
+        conn.close()
+
+# ---------------- Query plan checks for the hot paths
+# (name, sql, params, indexes the plan may use)
+HOT_QUERIES = [
+    ("results by test",
+     "SELECT score, total FROM results WHERE test_id = ?", (1,),
+     ("idx_results_test_attempted", "idx_results_test_trainee")),
+    ("attempts list",
+     """SELECT r.id, r.attempted_at, r.score, r.total, t.emp_id, t.name
+        FROM results r LEFT JOIN trainees t ON r.trainee_id = t.id
+        WHERE r.test_id = ? ORDER BY r.attempted_at DESC""", (1,),
+     ("idx_results_test_attempted",)),
+    ("attempts page (keyset)",
+     """SELECT r.id, r.attempted_at FROM results r LEFT JOIN trainees t ON r.trainee_id = t.id
+        WHERE r.test_id = ? AND (r.attempted_at, r.id) < (?, ?)
+        ORDER BY r.attempted_at DESC, r.id DESC LIMIT 51""", (1, "2025-01-01", 10),
+     ("idx_results_test_attempted",)),
+    ("trainees page (keyset)",
+     """SELECT id, emp_id, name, created_at FROM trainees
+        WHERE COALESCE(created_at, '') <= ? AND (COALESCE(created_at, '') < ? OR id < ?)
+        ORDER BY COALESCE(created_at, '') DESC, id DESC LIMIT 51""", ("2025-01-01", "2025-01-01", 10),
+     ("idx_trainees_created",)),
+    ("trainee attempts",
+     "SELECT score, total, attempted_at FROM results WHERE test_id = ? AND trainee_id = ?", (1, 1),
+     ("idx_results_test_trainee",)),
+    ("attempt policy check",
+     """SELECT attempt_no, started_at, submitted_at FROM attempts WHERE test_id = ? AND trainee_id = ?
+        ORDER BY attempt_no DESC LIMIT 1""", (1, 1),
+     ("idx_attempts_trainee",)),
+    ("attempt claim",
+     "UPDATE attempts SET submitted_at = ? WHERE session_key = ? AND submitted_at IS NULL", ("2025-01-01", "k"),
+     ("idx_attempts_session",)),
+    ("questions by test",
+     "SELECT id FROM questions WHERE test_id = ?", (1,),
+     ("idx_questions_test_text",)),
+    ("duplicate question check",
+     "SELECT question_text FROM questions WHERE test_id = ? AND question_text IN (?, ?)", (1, "a", "b"),
+     ("idx_questions_test_text",)),
+    ("trainee lookup",
+     "SELECT id, emp_id, name FROM trainees WHERE LOWER(emp_id) = LOWER(?)", ("E1",),
+     ("idx_trainees_emp_lower",)),
+    ("expired quiz sessions",
+     "SELECT id FROM quiz_sessions WHERE expires_at < ?", ("2025-01-01",),
+     ("idx_quiz_sessions_expires",)),
+    ("answers by question",
+     "SELECT COUNT(*), SUM(is_correct) FROM result_answers WHERE question_id = ? AND selected_mask <> 0", (1,),
+     ("idx_result_answers_question",)),
+    ("overall leaderboard",
+     """SELECT s.trainee_id, t.emp_id, s.points FROM trainee_stats s JOIN trainees t ON t.id = s.trainee_id
+        ORDER BY s.points DESC, s.trainee_id LIMIT 50""", (),
+     ("idx_trainee_stats_points",)),
+    ("test leaderboard",
+     """SELECT s.trainee_id, t.emp_id, s.best_pct FROM trainee_test_stats s JOIN trainees t ON t.id = s.trainee_id
+        WHERE s.test_id = ? ORDER BY s.best_pct DESC, s.best_at LIMIT 50""", (1,),
+     ("idx_trainee_test_stats_rank",)),
+    ("latest-score leaderboard",
+     """SELECT s.trainee_id, t.emp_id, s.latest_pct FROM trainee_test_stats s JOIN trainees t ON t.id = s.trainee_id
+        WHERE s.test_id = ? ORDER BY s.latest_pct DESC, s.latest_at LIMIT 50""", (1,),
+     ("idx_trainee_test_stats_latest",)),
+    ("job claim",
+     """SELECT j.id FROM jobs j WHERE j.status = 'queued' AND j.run_after <= ?
+        AND (j.lane IS NULL OR NOT EXISTS (SELECT 1 FROM jobs p WHERE p.lane = j.lane AND p.id <> j.id
+             AND (p.status = 'running' OR (p.status = 'queued' AND p.id < j.id))))
+        ORDER BY j.id LIMIT 1""", ("2025-01-01",),
+     ("idx_jobs_queue",)),
+    ("jobs by test",
+     "SELECT * FROM jobs WHERE test_id = ? ORDER BY id DESC LIMIT 50", (1,),
+     ("idx_jobs_test",)),
+    ("enrolment check",
+     """SELECT EXISTS (SELECT 1 FROM test_enrolments WHERE test_id = ?),
+               EXISTS (SELECT 1 FROM test_enrolments WHERE test_id = ? AND trainee_id = ?)""", (1, 1, 1),
+     ("PRIMARY KEY (test_id=? AND trainee_id=?)",)),
+    ("non-participants",
+     """SELECT t.id, t.emp_id, e.enrolled_at FROM test_enrolments e JOIN trainees t ON t.id = e.trainee_id
+        WHERE e.test_id = ? AND NOT EXISTS (SELECT 1 FROM results r
+              WHERE r.test_id = e.test_id AND r.trainee_id = e.trainee_id)
+        ORDER BY e.enrolled_at DESC, e.trainee_id DESC LIMIT 51""", (1,),
+     ("idx_results_test_trainee",)),
+    ("trainee rank",
+     "SELECT COUNT(*) FROM trainee_stats WHERE points > ?", (10,),
+     ("idx_trainee_stats_points",)),
+]
+
+def check_query_plans(conn):
+    """Assert every hot query is planned through its index; returns the plans."""
+    plans = {}
+    failures = []
+    for name, sql, params, indexes in HOT_QUERIES:
+        detail = " | ".join(r[-1] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall())
+        plans[name] = detail
+        if not any(index in detail for index in indexes):
+            failures.append(f"{name}: expected {' or '.join(indexes)}, got {detail}")
+    assert not failures, "Query plan regression:\n" + "\n".join(failures)
+    return plans
+
+def answer_mask(answer):
+    """Encode a ';'-joined option list such as "1;3" as a bitmask (bit 0 = option 1)."""
+    mask = 0
+    for part in str(answer or "").replace(",", ";").split(";"):
+        part = part.strip()
+        if part in ("1", "2", "3", "4"):
+            mask |= 1 << (int(part) - 1)
+    return mask
+
+def mask_answer(mask):
+    """Inverse of answer_mask: 0b101 -> "1;3"."""
+    return ";".join(str(i + 1) for i in range(4) if mask & (1 << i))
+
+def convert_raw_answers(conn, chunk_size=1000):
+    """Move results.raw_answers JSON into result_answers and drop the column.
+
+    Walks results by id in bounded chunks so memory stays flat regardless of
+    table size; INSERT OR IGNORE makes an interrupted run safe to repeat.
+    Entries that cannot be read (bad JSON, a non-numeric question id, an
+    answer that is not a string) are skipped. Returns (results rows
+    converted, entries skipped).
+    """
+    c = conn.cursor()
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS result_answers (
+        result_id INTEGER NOT NULL,
+        question_id INTEGER NOT NULL,
+        selected_mask INTEGER NOT NULL DEFAULT 0, -- bit 0 = option1 ... bit 3 = option4
+        is_correct INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (result_id, question_id),
+        FOREIGN KEY (result_id) REFERENCES results(id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+    """)
+    c.execute("""
+    CREATE INDEX IF NOT EXISTS idx_result_answers_question
+    ON result_answers (question_id, selected_mask, is_correct)
+    """)
+    cols = [r[1] for r in c.execute("PRAGMA table_info(results)").fetchall()]
+    if "raw_answers" not in cols:
+        conn.commit()
+        return 0, 0
+
+    correct_masks = {qid: answer_mask(correct) for qid, correct in c.execute("SELECT id, correct FROM questions")}
+    converted = skipped = 0
+    last_id = 0
+    while True:
+        rows = c.execute(
+            "SELECT id, raw_answers FROM results WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, chunk_size)).fetchall()
+        if not rows:
+            break
+        batch = []
+        for result_id, raw in rows:
+            try:
+                answers = json.loads(raw) if raw else {}
+            except ValueError:
+                answers = None
+            if not isinstance(answers, dict):
+                skipped += 1
+                continue
+            for s_qid, ans in answers.items():
+                try:
+                    qid = int(s_qid)
+                except ValueError:
+                    skipped += 1
+                    continue
+                if ans is not None and not isinstance(ans, (str, int)):
+                    skipped += 1
+                    continue
+                mask = answer_mask(ans)
+                expected = correct_masks.get(qid, 0)
+                batch.append((result_id, qid, mask, 1 if mask and mask == expected else 0))
+        c.executemany("""
+            INSERT OR IGNORE INTO result_answers (result_id, question_id, selected_mask, is_correct)
+            VALUES (?, ?, ?, ?)
+        """, batch)
+        conn.commit()
+        converted += len(rows)
+        last_id = rows[-1][0]
+    c.execute("ALTER TABLE results DROP COLUMN raw_answers")
     conn.commit()
-    conn.close()
-    print("results table updated (if columns were missing).")
+    return converted, skipped
+
+
+if __name__ == "__main__":
+    if "--check-plans" in sys.argv[1:]:
+        conn = sqlite3.connect(DB_PATH)
+        migrate_schema(conn)
+        for name, detail in check_query_plans(conn).items():
+            print(f"{name:24} {detail}")
+        conn.close()
+        print("All hot queries use their indexes.")
+        sys.exit(0)
 
-    #add_results_trainee_cols
     conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cols = [r[1] for r in cur.execute("PRAGMA table_info(results)").fetchall()]
-    if "trainee_id" not in cols:
-        cur.execute("ALTER TABLE results ADD COLUMN trainee_id INTEGER")
-    if "trainee_emp_id" not in cols:
-        cur.execute("ALTER TABLE results ADD COLUMN trainee_emp_id TEXT")
-    if "trainee_name" not in cols:
-        cur.execute("ALTER TABLE results ADD COLUMN trainee_name TEXT")
-    conn.commit()
+    before = schema_version(conn)
+    with _file_lock(DB_PATH + ".migrate.lock"):
+        after = migrate_schema(conn, verbose=True)
     conn.close()
-    print("Ensured trainee columns exist in results table.")
\ No newline at end of file
+    print(f"Schema at version {after} (was {before}).")
+    init_db()
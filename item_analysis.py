@@ -0,0 +1,321 @@
+# item_analysis.py
+"""Classical item analysis per test: difficulty, discrimination, distractors, reliability.
+
+Everything is derived from a handful of per-question sums (attempts, correct,
+and the sums of the rest score r = score - is_correct, r² and is_correct·r)
+plus per-option selection counts and the sum and sum of squares of the
+attempt scores. These are sufficient statistics: a new attempt only adds to
+them, so a committed submission updates a cached test in O(its answers)
+instead of forcing a recompute.
+
+A full build reads the test's answers in one query into flat arrays and
+forms every sum at once. Because attempts usually draw a sample of the bank,
+the attempts × questions matrix is mostly empty, so the sums are taken with
+bincount over the answers rather than as products over a dense matrix (the
+same numbers, with memory that grows with answers instead of attempts ×
+questions). NumPy is used when installed; otherwise the same pass runs in
+plain Python.
+
+- Difficulty (p-value): share of the attempts shown a question that got it right.
+- Discrimination: point-biserial correlation of the item with the rest score
+  (corrected item-total, so an item is not correlated with itself).
+- Distractors: share of attempts choosing each option, and leaving it blank.
+- Reliability: KR-20 (Cronbach's alpha for right/wrong items). When attempts
+  draw a subset of the bank, the summed item variance is taken as items per
+  attempt × the mean item variance; with the whole bank per attempt this is
+  exactly KR-20. It is only reported from MIN_FLAG_ATTEMPTS attempts on, and
+  capped at 1.0, which the estimate can overshoot on a small or sampled test.
+"""
+import math
+import threading
+from array import array
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # optional; the pure-Python path gives identical results
+    np = None
+
+OPTIONS = 4
+
+# review flags, only raised once a question has been shown MIN_FLAG_ATTEMPTS times
+MIN_FLAG_ATTEMPTS = 10
+EASY_P = 0.9
+HARD_P = 0.2
+LOW_DISCRIMINATION = 0.2
+
+
+def _ratio(num, den):
+    return num / den if den else None
+
+
+def _round(value, digits=4):
+    return round(value, digits) if value is not None else None
+
+
+class ItemStats:
+    """Sufficient statistics of one test's attempts at one dashboard version."""
+
+    def __init__(self, test_id, version, questions, engine):
+        self.test_id = test_id
+        self.version = version
+        self.engine = engine
+        self.ids = [q["id"] for q in questions]
+        self.labels = [q["question_text"] for q in questions]
+        self.keys = [q["correct_mask"] for q in questions]
+        self.index = {qid: j for j, qid in enumerate(self.ids)}
+        n = len(self.ids)
+        self.attempts = 0
+        self.score_sum = 0
+        self.score_sq_sum = 0
+        self.total_sum = 0
+        self.presented = [0] * n
+        self.correct = [0] * n
+        self.rest_sum = [0] * n
+        self.rest_sq_sum = [0] * n
+        self.correct_rest_sum = [0] * n
+        self.chosen = [[0] * OPTIONS for _ in range(n)]
+        self.blank = [0] * n
+
+    def add_attempt(self, score, total, answers):
+        """Fold in one attempt; answers are (question_id, selected_mask, is_correct).
+
+        Answers to questions no longer in the bank only count towards the score.
+        """
+        self.attempts += 1
+        self.score_sum += score
+        self.score_sq_sum += score * score
+        self.total_sum += total
+        for qid, mask, ok in answers:
+            j = self.index.get(qid)
+            if j is None:
+                continue
+            rest = score - ok
+            self.presented[j] += 1
+            self.correct[j] += ok
+            self.rest_sum[j] += rest
+            self.rest_sq_sum[j] += rest * rest
+            self.correct_rest_sum[j] += ok * rest
+            if mask:
+                chosen = self.chosen[j]
+                for k in range(OPTIONS):
+                    if mask >> k & 1:
+                        chosen[k] += 1
+            else:
+                self.blank[j] += 1
+
+    def _discrimination(self, j):
+        n = self.presented[j]
+        if n < 2:
+            return None
+        mean_x, mean_r = self.correct[j] / n, self.rest_sum[j] / n
+        var_x = mean_x * (1 - mean_x)
+        var_r = self.rest_sq_sum[j] / n - mean_r * mean_r
+        if var_x <= 0 or var_r <= 1e-12:
+            return None
+        return (self.correct_rest_sum[j] / n - mean_x * mean_r) / math.sqrt(var_x * var_r)
+
+    def _flags(self, p, discrimination, rates, key):
+        flags = []
+        if p >= EASY_P:
+            flags.append("too easy")
+        elif p <= HARD_P:
+            flags.append("too hard")
+        if discrimination is not None and discrimination < LOW_DISCRIMINATION:
+            flags.append("low discrimination")
+        key_options = [k for k in range(OPTIONS) if key >> k & 1]
+        if len(key_options) == 1 and any(rates[k] > rates[key_options[0]] for k in range(OPTIONS) if k not in key_options):
+            # more trainees pick a wrong option than the key: often a mis-keyed question
+            flags.append("distractor outdraws key")
+        return flags
+
+    def to_dict(self):
+        items, variances = [], []
+        for j, qid in enumerate(self.ids):
+            n = self.presented[j]
+            p = _ratio(self.correct[j], n)
+            discrimination = self._discrimination(j)
+            rates = [_ratio(c, n) or 0.0 for c in self.chosen[j]]
+            if p is not None:
+                variances.append(p * (1 - p))
+            items.append({
+                "id": qid,
+                "label": self.labels[j],
+                "attempts": n,
+                "p": _round(p),
+                "discrimination": _round(discrimination),
+                "options": [_round(r) for r in rates],
+                "blank": _round(_ratio(self.blank[j], n) or 0.0),
+                "key": [k for k in range(OPTIONS) if self.keys[j] >> k & 1],
+                "flags": self._flags(p, discrimination, rates, self.keys[j]) if n >= MIN_FLAG_ATTEMPTS else [],
+            })
+
+        mean = _ratio(self.score_sum, self.attempts)
+        variance = self.score_sq_sum / self.attempts - mean * mean if self.attempts else None
+        per_attempt = _ratio(self.total_sum, self.attempts)
+        alpha = None
+        if self.attempts >= MIN_FLAG_ATTEMPTS and per_attempt and per_attempt > 1 and variances and variance > 0:
+            item_variance = per_attempt * sum(variances) / len(variances)
+            alpha = min(per_attempt / (per_attempt - 1) * (1 - item_variance / variance), 1.0)
+        return {
+            "test_id": self.test_id,
+            "version": self.version,
+            "engine": self.engine,
+            "attempts": self.attempts,
+            "mean_score": _round(mean),
+            "sd_score": _round(math.sqrt(max(variance, 0.0)) if variance is not None else None),
+            "items_per_attempt": _round(per_attempt),
+            "alpha": _round(alpha),
+            "items": items,
+        }
+
+
+# ---------------- Full build
+def _load(conn, test_id):
+    """(dashboard version, flat answer arrays); one statement, so both come from one snapshot.
+
+    Attempts with no stored answers appear once with question id -1.
+    """
+    cur = conn.execute("""
+        SELECT t.dashboard_version, r.id, r.score, r.total,
+               COALESCE(ra.question_id, -1), COALESCE(ra.selected_mask, 0), COALESCE(ra.is_correct, 0)
+        FROM tests t
+        LEFT JOIN results r ON r.test_id = t.id
+        LEFT JOIN result_answers ra ON ra.result_id = r.id
+        WHERE t.id = ?
+    """, (test_id,))
+    version = None
+    results, scores, totals, question_ids, masks, correct = (
+        array("q"), array("q"), array("q"), array("q"), array("q"), array("q"))
+    while True:
+        rows = cur.fetchmany(10000)
+        if not rows:
+            break
+        for row_version, rid, score, total, qid, mask, ok in rows:
+            version = row_version
+            if rid is None:
+                continue
+            results.append(rid)
+            scores.append(score)
+            totals.append(total)
+            question_ids.append(qid)
+            masks.append(mask)
+            correct.append(ok)
+    return version, (results, scores, totals, question_ids, masks, correct)
+
+
+def _sums_numpy(stats, results, scores, totals, question_ids, masks, correct):
+    as_array = lambda a: np.frombuffer(a, dtype=np.int64)  # noqa: E731
+    rid, score, total = as_array(results), as_array(scores), as_array(totals)
+    if not len(rid):
+        return
+    _, first = np.unique(rid, return_index=True)
+    stats.attempts = len(first)
+    stats.score_sum = int(score[first].sum())
+    stats.score_sq_sum = int((score[first] ** 2).sum())
+    stats.total_sum = int(total[first].sum())
+
+    n = len(stats.ids)
+    if not n:
+        return
+    ids = np.asarray(stats.ids, dtype=np.int64)  # ascending, from ORDER BY id
+    qid = as_array(question_ids)
+    col = np.minimum(np.searchsorted(ids, qid), n - 1)
+    known = ids[col] == qid
+    j, x, m = col[known], as_array(correct)[known], as_array(masks)[known]
+    rest = score[known] - x
+    sums = lambda weights: np.bincount(j, weights=weights, minlength=n).astype(np.int64).tolist()  # noqa: E731
+    stats.presented = np.bincount(j, minlength=n).tolist()
+    stats.correct = sums(x)
+    stats.rest_sum = sums(rest)
+    stats.rest_sq_sum = sums(rest * rest)
+    stats.correct_rest_sum = sums(x * rest)
+    stats.blank = sums(m == 0)
+    chosen = [sums((m >> k) & 1) for k in range(OPTIONS)]
+    stats.chosen = [list(c) for c in zip(*chosen)]
+
+
+def _sums_python(stats, results, scores, totals, question_ids, masks, correct):
+    answers = {}
+    attempt = {}
+    for i, rid in enumerate(results):
+        attempt.setdefault(rid, (scores[i], totals[i]))
+        if question_ids[i] >= 0:
+            answers.setdefault(rid, []).append((question_ids[i], masks[i], correct[i]))
+    for rid, (score, total) in attempt.items():
+        stats.add_attempt(score, total, answers.get(rid, ()))
+
+
+def build_item_stats(conn, test_id):
+    """ItemStats for test_id from scratch, or None if the test does not exist."""
+    version, arrays = _load(conn, test_id)
+    if version is None:
+        return None
+    questions = conn.execute(
+        "SELECT id, question_text, correct_mask FROM questions WHERE test_id = ? ORDER BY id", (test_id,)).fetchall()
+    stats = ItemStats(test_id, version, questions, "numpy" if np is not None else "python")
+    (_sums_numpy if np is not None else _sums_python)(stats, *arrays)
+    return stats
+
+
+# ---------------- Per-test cache
+class ItemAnalysisCache:
+    """Latest ItemStats per test, kept current by committed submissions.
+
+    An entry is valid for one tests.dashboard_version. apply() moves it to
+    the next version when the submission that made that version commits;
+    any other change (another worker's submission, a regrade, a question
+    edit) leaves a gap, and the next get() rebuilds.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+        self.increments = 0
+
+    def get(self, conn, test_id, version):
+        """The analysis as a dict (at version or newer), or None if the test does not exist."""
+        with self._lock:
+            entry = self._entries.get(test_id)
+            if entry is not None and entry.version >= version:
+                self._entries.move_to_end(test_id)
+                self.hits += 1
+                return entry.to_dict()
+        stats = build_item_stats(conn, test_id)
+        if stats is None:
+            return None
+        with self._lock:
+            self.builds += 1
+            current = self._entries.get(test_id)
+            if current is None or current.version < stats.version:
+                self._entries[test_id] = stats
+                self._entries.move_to_end(test_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return stats.to_dict()
+
+    def apply(self, sub):
+        """Fold a committed submission (the submission writer's item) into its test's entry."""
+        with self._lock:
+            entry = self._entries.get(sub["test_id"])
+            if entry is None:
+                return
+            version = sub.get("dashboard_version")
+            if version is None or entry.version != version - 1:
+                del self._entries[sub["test_id"]]
+                return
+            entry.add_attempt(sub["score"], sub["total"], sub["answers"])
+            entry.version = version
+            self.increments += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "builds": self.builds,
+                    "increments": self.increments}
@@ -0,0 +1,398 @@
+# jobs.py
+"""Background jobs for heavy trainer actions, queued in the jobs table.
+
+A trainer request only inserts a row and returns; a small pool of worker
+threads in each app process claims queued rows and runs the registered
+handler for their kind. Because the queue lives in the database, any
+process can report on, cancel or retry a job, and jobs survive restarts.
+
+- Jobs sharing a lane (e.g. every job of one test) run one at a time in the
+  order they were queued, so an import, a regrade and a delete of the same
+  test never overlap.
+- A handler reports progress with ctx.progress() and pauses between its
+  transactions with ctx.pause(), which waits while trainee submissions are
+  queued so heavy work yields the write lock to the hot path.
+- A failed handler is retried with backoff up to max_attempts; raise
+  JobFailed for failures a retry cannot fix. Only kinds registered as
+  cancellable stop mid-run (at ctx.check_cancelled()); the rest can only be
+  cancelled while queued.
+- A job whose worker stopped heartbeating for stale_seconds (a killed
+  process) is queued again, or failed once its attempts are used up. Each
+  process heartbeats its running jobs from a thread with its own
+  connection, so a handler that holds one long transaction (and so cannot
+  persist progress) is not mistaken for a dead one.
+"""
+import os
+import json
+import time
+import socket
+import threading
+from datetime import datetime, timedelta
+
+ACTIVE_STATUSES = ("queued", "running")
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """Raised by ctx.check_cancelled() once a cancel was requested."""
+
+
+class JobFailed(Exception):
+    """A permanent failure: the job is failed without a retry, keeping result for the trainer."""
+
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+def _now():
+    return datetime.utcnow().isoformat()
+
+
+def job_dict(row):
+    job = dict(row)
+    job["params"] = json.loads(job["params"] or "{}")
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    total, processed = job["total"], job["processed"]
+    job["percent"] = round(processed / total * 100, 1) if total else (100.0 if job["status"] == "done" else 0.0)
+    job["cancel_requested"] = bool(job["cancel_requested"])
+    return job
+
+
+class JobContext:
+    """What a handler sees of its job: params, progress and cancellation."""
+
+    def __init__(self, runner, conn, job_id, params, attempt):
+        self.runner = runner
+        self.conn = conn
+        self.job_id = job_id
+        self.params = params
+        self.attempt = attempt
+        self.processed = 0
+        self.total = 0
+        self._flushed = 0.0
+
+    def progress(self, processed, total=None, persist=True):
+        """Record progress; persisted at most every progress_interval seconds.
+
+        Pass persist=False while the handler holds an open write transaction
+        (SQLite would make this write wait for it).
+        """
+        self.processed = processed
+        if total is not None:
+            self.total = total
+        if persist and time.monotonic() - self._flushed >= self.runner.progress_interval:
+            self.flush()
+
+    def flush(self):
+        self.conn.execute("UPDATE jobs SET processed = ?, total = ?, heartbeat_at = ? WHERE id = ?",
+                          (self.processed, self.total, _now(), self.job_id))
+        self.conn.commit()
+        self._flushed = time.monotonic()
+
+    def check_cancelled(self):
+        row = self.conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (self.job_id,)).fetchone()
+        self.conn.commit()
+        if row is None or row[0]:
+            raise JobCancelled()
+
+    def pause(self):
+        """Between transactions: give queued trainee submissions the write lock first."""
+        self.runner.wait_until_idle()
+
+
+class JobRunner:
+    """Worker threads over the jobs table; started lazily in each process."""
+
+    def __init__(self, connect, workers=1, poll_interval=1.0, max_attempts=3, stale_seconds=900,
+                 keep_days=7, progress_interval=0.5, busy=None, max_yield=2.0, lock=None):
+        self.connect = connect
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.stale_seconds = stale_seconds
+        self.keep_days = keep_days
+        self.progress_interval = progress_interval
+        self.busy = busy
+        self.max_yield = max_yield
+        self.lock = lock  # lock(cursor) before a claim, for backends where a single UPDATE is not enough
+        self._kinds = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._threads = []
+        self._beater = None
+        self._running = set()  # ids of the jobs this process is executing
+        self.heartbeat_interval = min(60.0, stale_seconds / 4)
+        self._pid = None
+        self._last_sweep = 0.0
+        self.claimed = 0
+        self.succeeded = 0
+        self.retried = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def register(self, kind, run, cancellable=False, cleanup=None):
+        """run(ctx) does the work and returns a JSON-able result; cleanup(params) runs once the job is finished."""
+        self._kinds[kind] = (run, cancellable, cleanup)
+
+    # ---------------- Trainer-facing API (caller's connection)
+    def submit(self, conn, kind, params, test_id=None, lane=None):
+        """Queue a job and return its id; workers are woken at once."""
+        if kind not in self._kinds:
+            raise ValueError(f"unknown job kind {kind}")
+        now = _now()
+        job_id = conn.execute("""
+            INSERT INTO jobs (kind, test_id, lane, params, status, max_attempts, run_after, created_at)
+            VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)
+            RETURNING id
+        """, (kind, test_id, lane, json.dumps(params), self.max_attempts, now, now)).fetchone()[0]
+        conn.commit()
+        self.ensure_started()
+        self._wake.set()
+        return job_id
+
+    def get(self, conn, job_id):
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return job_dict(row) if row else None
+
+    def recent(self, conn, test_id=None, kind=None, limit=50):
+        """Newest jobs first, optionally for one test and kind."""
+        clauses, params = [], []
+        if test_id is not None:
+            clauses.append("test_id = ?")
+            params.append(test_id)
+        if kind is not None:
+            clauses.append("kind = ?")
+            params.append(kind)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = conn.execute(f"SELECT * FROM jobs {where} ORDER BY id DESC LIMIT ?", (*params, limit)).fetchall()
+        return [job_dict(r) for r in rows]
+
+    def cancel(self, conn, job_id):
+        """Cancel a queued job, or ask a running cancellable one to stop. Returns (ok, message)."""
+        row = conn.execute("""
+            UPDATE jobs SET status = 'cancelled', finished_at = ?
+            WHERE id = ? AND status = 'queued'
+            RETURNING kind, params
+        """, (_now(), job_id)).fetchone()
+        conn.commit()
+        if row is not None:
+            self._cleanup(row["kind"], row["params"])
+            with self._lock:
+                self.cancelled += 1
+            return True, "Job cancelled."
+        job = self.get(conn, job_id)
+        if job is None:
+            return False, "Job not found."
+        if job["status"] != "running":
+            return False, f"Job already {job['status']}."
+        if not self._kinds.get(job["kind"], (None, False))[1]:
+            return False, "This job cannot be stopped once it has started."
+        conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        conn.commit()
+        return True, "Cancellation requested; the job stops at its next checkpoint."
+
+    def retry(self, conn, job_id):
+        """Queue a failed or cancelled job again with a fresh set of attempts. Returns (ok, message)."""
+        row = conn.execute("""
+            UPDATE jobs SET status = 'queued', attempts = 0, run_after = ?, processed = 0, total = 0,
+                            error = NULL, result = NULL, cancel_requested = 0, finished_at = NULL
+            WHERE id = ? AND status IN ('failed', 'cancelled')
+            RETURNING id
+        """, (_now(), job_id)).fetchone()
+        conn.commit()
+        if row is None:
+            job = self.get(conn, job_id)
+            return False, "Job not found." if job is None else f"Only failed or cancelled jobs can be retried ({job['status']})."
+        self.ensure_started()
+        self._wake.set()
+        return True, "Job queued again."
+
+    # ---------------- Workers
+    def ensure_started(self):
+        """Start this process's workers if needed (after a fork the parent's threads are gone)."""
+        if self.workers <= 0:
+            return
+        if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._threads = []
+                self._beater = None
+                self._running = set()
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"job-worker-{len(self._threads)}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            if self._beater is None or not self._beater.is_alive():
+                self._beater = threading.Thread(target=self._beat, name="job-heartbeat", daemon=True)
+                self._beater.start()
+
+    def wait_until_idle(self):
+        if self.busy is None:
+            return
+        deadline = time.monotonic() + self.max_yield
+        while self.busy() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _work(self):
+        worker = f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+        conn = self.connect()
+        try:
+            while True:
+                if time.monotonic() - self._last_sweep >= 60:
+                    self._last_sweep = time.monotonic()
+                    self._sweep(conn)
+                self.wait_until_idle()
+                job = self._claim(conn, worker)
+                if job is None:
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+                    continue
+                self._execute(conn, job)
+        finally:
+            conn.close()
+
+    def _beat(self):
+        conn = self.connect()
+        try:
+            while True:
+                time.sleep(self.heartbeat_interval)
+                with self._lock:
+                    running = sorted(self._running)
+                if not running:
+                    continue
+                try:
+                    self._heartbeat(conn, running)
+                except Exception:
+                    conn.rollback()  # e.g. the write lock stayed busy; the next beat tries again
+        finally:
+            conn.close()
+
+    def _heartbeat(self, conn, job_ids):
+        placeholders = ",".join("?" for _ in job_ids)
+        conn.execute(f"UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND id IN ({placeholders})",
+                     (_now(), *job_ids))
+        conn.commit()
+
+    def _claim(self, conn, worker):
+        """Atomically take the oldest runnable job whose lane is free."""
+        now = _now()
+        cur = conn.cursor()
+        if self.lock is not None:
+            self.lock(cur)
+        row = cur.execute("""
+            UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?,
+                            started_at = ?, heartbeat_at = ?, cancel_requested = 0
+            WHERE id = (
+                SELECT j.id FROM jobs j
+                WHERE j.status = 'queued' AND j.run_after <= ?
+                  AND (j.lane IS NULL OR NOT EXISTS (
+                      SELECT 1 FROM jobs p
+                      WHERE p.lane = j.lane AND p.id <> j.id
+                        AND (p.status = 'running' OR (p.status = 'queued' AND p.id < j.id))))
+                ORDER BY j.id
+                LIMIT 1)
+            RETURNING id, kind, params, attempts, max_attempts
+        """, (worker, now, now, now)).fetchone()
+        conn.commit()
+        if row is not None:
+            with self._lock:
+                self.claimed += 1
+        return row
+
+    def _execute(self, conn, job):
+        job_id = job["id"]
+        run = self._kinds.get(job["kind"], (None, False, None))[0]
+        ctx = JobContext(self, conn, job_id, json.loads(job["params"] or "{}"), job["attempts"])
+        with self._lock:
+            self._running.add(job_id)
+        try:
+            self._run(conn, job, run, ctx)
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+
+    def _run(self, conn, job, run, ctx):
+        job_id, kind, params = job["id"], job["kind"], job["params"]
+        try:
+            if run is None:
+                raise JobFailed(f"no handler for job kind {kind}")
+            result = run(ctx)
+        except JobCancelled:
+            self._finish(conn, job_id, "cancelled", ctx, kind, params)
+            with self._lock:
+                self.cancelled += 1
+        except JobFailed as e:
+            self._finish(conn, job_id, "failed", ctx, kind, params, result=e.result, error=str(e))
+            with self._lock:
+                self.failed += 1
+        except Exception as e:
+            conn.rollback()
+            if job["attempts"] < job["max_attempts"]:
+                backoff = min(5 * 2 ** (job["attempts"] - 1), 300)
+                conn.execute("""
+                    UPDATE jobs SET status = 'queued', run_after = ?, error = ?, worker = NULL
+                    WHERE id = ?
+                """, ((datetime.utcnow() + timedelta(seconds=backoff)).isoformat(), str(e), job_id))
+                conn.commit()
+                with self._lock:
+                    self.retried += 1
+            else:
+                self._finish(conn, job_id, "failed", ctx, kind, params, error=str(e))
+                with self._lock:
+                    self.failed += 1
+        else:
+            self._finish(conn, job_id, "done", ctx, kind, params, result=result)
+            with self._lock:
+                self.succeeded += 1
+
+    def _finish(self, conn, job_id, status, ctx, kind, params, result=None, error=None):
+        conn.rollback()
+        conn.execute("""
+            UPDATE jobs SET status = ?, processed = ?, total = ?, result = ?, error = ?, finished_at = ?
+            WHERE id = ?
+        """, (status, ctx.processed, ctx.total, json.dumps(result) if result is not None else None, error,
+              _now(), job_id))
+        conn.commit()
+        self._cleanup(kind, params)
+
+    def _cleanup(self, kind, params):
+        cleanup = self._kinds.get(kind, (None, False, None))[2]
+        if cleanup is not None:
+            try:
+                cleanup(json.loads(params or "{}"))
+            except Exception:
+                pass
+
+    def _sweep(self, conn):
+        """Requeue jobs orphaned by a dead worker and forget finished jobs older than keep_days.
+
+        Jobs this process is running are never orphans, whatever their heartbeat says.
+        """
+        now = datetime.utcnow()
+        stale = (now - timedelta(seconds=self.stale_seconds)).isoformat()
+        with self._lock:
+            running = sorted(self._running)
+        spare = f"AND id NOT IN ({','.join('?' for _ in running)})" if running else ""
+        orphans = conn.execute(f"""
+            UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                            error = 'worker stopped responding', worker = NULL,
+                            finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE ? END
+            WHERE status = 'running' AND heartbeat_at < ? {spare}
+            RETURNING kind, params, status
+        """, (now.isoformat(), stale, *running)).fetchall()
+        conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?",
+                     ((now - timedelta(days=self.keep_days)).isoformat(),))
+        conn.commit()
+        for kind, params, status in orphans:
+            if status == "failed":
+                self._cleanup(kind, params)
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers, "alive": sum(1 for t in self._threads if t.is_alive()),
+                    "claimed": self.claimed, "succeeded": self.succeeded, "retried": self.retried,
+                    "failed": self.failed, "cancelled": self.cancelled}
@@ -0,0 +1,101 @@
+# live_updates.py
+"""In-process fan-out of dashboard updates to server-sent-event streams.
+
+The submission writer publishes one event per committed attempt. Each event
+is serialized once and then handed to every open stream for that test as a
+ready-made SSE frame, so the work done per submission is one json.dumps plus
+one queue put per viewer, and an idle dashboard costs nothing but a
+heartbeat. Viewers never poll the database for chart data.
+
+Events carry the test's dashboard_version after the change. A client that
+sees a gap (a write made by another worker process, a regrade, a question
+edit) or is told it fell behind refetches dashboard.json instead.
+"""
+import json
+import queue
+import threading
+
+RESYNC = "event: resync\ndata: {}\n\n"
+
+
+def sse_frame(event, data, event_id=None):
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append("data: " + json.dumps(data, separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
+
+
+class Subscription:
+    __slots__ = ("test_id", "_queue", "overflowed")
+
+    def __init__(self, test_id, max_pending):
+        self.test_id = test_id
+        self._queue = queue.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+    def _offer(self, frame):
+        try:
+            self._queue.put_nowait(frame)
+        except queue.Full:
+            # a stalled client; drop its backlog and make it refetch instead
+            self.overflowed = True
+
+    def get(self, timeout):
+        """The next frame, a resync frame after an overflow, or None on timeout."""
+        if self.overflowed:
+            self.overflowed = False
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    return RESYNC
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LivePublisher:
+    def __init__(self, max_pending=256):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._subscribers = {}  # test_id -> set of Subscription
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, test_id):
+        sub = Subscription(test_id, self.max_pending)
+        with self._lock:
+            self._subscribers.setdefault(test_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subscribers.get(sub.test_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.test_id]
+
+    def publish(self, test_id, event, data, event_id=None):
+        """Queue one event for every stream watching test_id; never blocks."""
+        with self._lock:
+            subs = list(self._subscribers.get(test_id, ()))
+            self.published += 1
+            self.delivered += len(subs)
+        if not subs:
+            return 0
+        frame = sse_frame(event, data, event_id)
+        for sub in subs:
+            sub._offer(frame)
+        return len(subs)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tests": len(self._subscribers),
+                "subscribers": sum(len(s) for s in self._subscribers.values()),
+                "published": self.published,
+                "delivered": self.delivered,
+            }
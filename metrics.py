@@ -0,0 +1,204 @@
+# metrics.py
+"""Opt-in per-route request, SQL and template timing.
+
+Pooled connections are created with factory=TimedConnection, whose cursors
+time every execute() and charge it to the Flask endpoint being served (or
+"background" outside a request, e.g. the submission writer thread).
+Template rendering is timed through Flask's render signals. Aggregates are
+kept as fixed-bucket histograms and rendered in the Prometheus text format;
+statements and requests over their thresholds are logged.
+"""
+import time
+import logging
+import sqlite3
+import threading
+
+from flask import g, has_request_context, request, before_render_template, template_rendered
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+_local = threading.local()
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, help_text, labels, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted(self._series.items())
+        for label_values, series in items:
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            sep = "," if labels else ""
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels}{sep}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{labels}}} {series[-1]}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    def __init__(self, slow_query_ms=100, slow_request_ms=1000, logger=None):
+        self.slow_query = slow_query_ms / 1000.0
+        self.slow_request = slow_request_ms / 1000.0
+        self.logger = logger or logging.getLogger("quiz.metrics")
+        self.request_seconds = Histogram(
+            "quiz_request_duration_seconds", "Time spent serving a request.", ("route", "method", "status"))
+        self.query_seconds = Histogram(
+            "quiz_sql_query_duration_seconds", "Time spent in a single SQL statement.", ("route",))
+        self.request_queries = Histogram(
+            "quiz_sql_queries_per_request", "SQL statements issued by one request.", ("route",), COUNT_BUCKETS)
+        self.request_sql_seconds = Histogram(
+            "quiz_sql_seconds_per_request", "Total SQL time of one request.", ("route",))
+        self.template_seconds = Histogram(
+            "quiz_template_render_seconds", "Time spent rendering a template.", ("template",))
+        self.slow_queries = 0
+        self.slow_requests = 0
+        self._lock = threading.Lock()
+
+    # -- SQL
+    def record_query(self, sql, seconds):
+        if has_request_context():
+            route = request.endpoint or "unknown"
+            g._metrics_queries = g.get("_metrics_queries", 0) + 1
+            g._metrics_sql_seconds = g.get("_metrics_sql_seconds", 0.0) + seconds
+        else:
+            route = "background"
+        self.query_seconds.observe(seconds, route)
+        if seconds >= self.slow_query:
+            with self._lock:
+                self.slow_queries += 1
+            self.logger.warning("slow query (%.1f ms) in %s: %s", seconds * 1000, route, " ".join(sql.split()))
+
+    # -- requests
+    def _before_request(self):
+        g._metrics_started = time.perf_counter()
+
+    def _after_request(self, response):
+        started = g.get("_metrics_started")
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        route = request.endpoint or "unknown"
+        queries = g.get("_metrics_queries", 0)
+        self.request_seconds.observe(elapsed, route, request.method, str(response.status_code))
+        self.request_queries.observe(queries, route)
+        self.request_sql_seconds.observe(g.get("_metrics_sql_seconds", 0.0), route)
+        if elapsed >= self.slow_request:
+            with self._lock:
+                self.slow_requests += 1
+            self.logger.warning("slow request (%.1f ms, %d queries): %s %s",
+                                elapsed * 1000, queries, request.method, request.path)
+        return response
+
+    # -- templates
+    def _before_render(self, sender, template, context, **extra):
+        stack = getattr(_local, "render_started", None)
+        if stack is None:
+            stack = _local.render_started = []
+        stack.append(time.perf_counter())
+
+    def _rendered(self, sender, template, context, **extra):
+        stack = getattr(_local, "render_started", None)
+        if stack:
+            self.template_seconds.observe(time.perf_counter() - stack.pop(), template.name or "string")
+
+    def install(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app, weak=False)
+        template_rendered.connect(self._rendered, app, weak=False)
+
+    def render(self):
+        lines = []
+        for hist in (self.request_seconds, self.request_queries, self.request_sql_seconds,
+                     self.query_seconds, self.template_seconds):
+            lines.extend(hist.render())
+        counters = [("quiz_slow_queries_total", "Statements slower than the slow-query threshold.", self.slow_queries),
+                    ("quiz_slow_requests_total", "Requests slower than the slow-request threshold.", self.slow_requests)]
+        for name, help_text, value in counters:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+# The active Metrics instance; TimedCursor reports here when it is set.
+active = None
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        if active is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            active.record_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        if active is None:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            active.record_query(sql, time.perf_counter() - started)
+
+    def executescript(self, sql_script):
+        if active is None:
+            return super().executescript(sql_script)
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            active.record_query(sql_script, time.perf_counter() - started)
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection factory whose cursors (and execute shortcuts) are timed."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute* create their cursor in C, bypassing the override above
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def enable(app, slow_query_ms=100, slow_request_ms=1000):
+    """Create the Metrics instance, hook it into app and make TimedCursor report to it."""
+    global active
+    active = Metrics(slow_query_ms, slow_request_ms, app.logger)
+    active.install(app)
+    return active
@@ -0,0 +1,162 @@
+# question_cache.py
+"""In-process cache of per-test question banks.
+
+quiz_start samples from, and quiz_submit grades against, an immutable
+snapshot of a test's questions so neither has to query SQLite on the hot
+path. Trainer routes that change questions call invalidate(test_id).
+"""
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+
+class QuestionBank:
+    """Immutable, array-backed snapshot of one test's questions, ordered by id."""
+
+    __slots__ = ("test_id", "ids", "texts", "options", "correct_masks", "multiple", "topics", "difficulties",
+                 "_strata", "nbytes")
+
+    def __init__(self, test_id, rows):
+        self.test_id = test_id
+        self.ids = array("q", (r["id"] for r in rows))
+        self.texts = tuple(r["question_text"] for r in rows)
+        self.options = tuple((r["option1"], r["option2"], r["option3"], r["option4"]) for r in rows)
+        self.correct_masks = array("B", (r["correct_mask"] for r in rows))
+        self.multiple = array("B", (1 if r["is_multiple"] else 0 for r in rows))
+        self.topics = tuple(r["topic"] for r in rows)
+        self.difficulties = tuple(r["difficulty"] for r in rows)
+        self._strata = {}
+        self.nbytes = self._estimate_size()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _estimate_size(self):
+        size = sys.getsizeof(self.ids) + sys.getsizeof(self.correct_masks) + sys.getsizeof(self.multiple)
+        size += sum(sys.getsizeof(t) for t in self.texts)
+        size += sum(sys.getsizeof(o) for opts in self.options for o in opts)
+        return size
+
+    def index_of(self, question_id):
+        """Position of question_id in the bank, or -1 if it is no longer present."""
+        i = bisect_left(self.ids, question_id)
+        if i < len(self.ids) and self.ids[i] == question_id:
+            return i
+        return -1
+
+    def strata(self, field):
+        """{value: array of positions} for "topic" or "difficulty"; built once per snapshot."""
+        groups = self._strata.get(field)
+        if groups is None:
+            values = self.topics if field == "topic" else self.difficulties
+            groups = {}
+            for i, value in enumerate(values):
+                groups.setdefault(value, array("I")).append(i)
+            self._strata[field] = groups
+        return groups
+
+    def question(self, i):
+        """Template-ready dict for the question at position i."""
+        return {
+            "id": self.ids[i],
+            "text": self.texts[i],
+            "options": list(self.options[i]),
+            "is_multiple": bool(self.multiple[i]),
+        }
+
+    def correct_mask(self, question_id):
+        """Answer-key bitmask for question_id, or None if it was deleted."""
+        i = self.index_of(question_id)
+        return self.correct_masks[i] if i >= 0 else None
+
+
+def load_question_bank(conn, test_id):
+    rows = conn.execute("""
+        SELECT id, question_text, option1, option2, option3, option4, correct_mask, is_multiple, topic, difficulty
+        FROM questions
+        WHERE test_id = ?
+        ORDER BY id ASC
+    """, (test_id,)).fetchall()
+    return QuestionBank(test_id, rows)
+
+
+class QuestionBankCache:
+    """LRU of QuestionBank snapshots bounded by entry count and total bytes.
+
+    Concurrent misses for the same test share one load, and a generation
+    counter per test stops a load that raced with invalidate() from
+    publishing a stale snapshot.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._banks = OrderedDict()
+        self._bytes = 0
+        self._generations = {}
+        self._load_locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, conn, test_id):
+        with self._lock:
+            bank = self._banks.get(test_id)
+            if bank is not None:
+                self._banks.move_to_end(test_id)
+                self.hits += 1
+                return bank
+            self.misses += 1
+            load_lock = self._load_locks.setdefault(test_id, threading.Lock())
+        with load_lock:
+            with self._lock:
+                bank = self._banks.get(test_id)
+                if bank is not None:
+                    return bank
+                generation = self._generations.get(test_id, 0)
+            bank = load_question_bank(conn, test_id)
+            with self._lock:
+                if self._generations.get(test_id, 0) == generation:
+                    self._store(test_id, bank)
+                self._load_locks.pop(test_id, None)
+        return bank
+
+    def _store(self, test_id, bank):
+        if bank.nbytes > self.max_bytes:
+            return
+        old = self._banks.pop(test_id, None)
+        if old is not None:
+            self._bytes -= old.nbytes
+        self._banks[test_id] = bank
+        self._bytes += bank.nbytes
+        while self._banks and (len(self._banks) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._banks.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def invalidate(self, test_id):
+        with self._lock:
+            self._generations[test_id] = self._generations.get(test_id, 0) + 1
+            bank = self._banks.pop(test_id, None)
+            if bank is not None:
+                self._bytes -= bank.nbytes
+
+    def clear(self):
+        with self._lock:
+            for test_id in self._banks:
+                self._generations[test_id] = self._generations.get(test_id, 0) + 1
+            self._banks.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._banks),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,170 @@
+# question_import.py
+"""Streaming CSV importer for question banks.
+
+The upload is decoded line by line and validated row by row, and rows are
+inserted in bounded chunks inside one transaction, so memory use does not
+grow with the size of the file and a bad row rolls the whole import back.
+"""
+import csv
+import time
+import codecs
+
+from init_db import answer_mask
+
+CSV_COLUMNS = "Question,Option1,Option2,Option3,Option4,Correct"
+OPTIONAL_COLUMNS = "Topic,Difficulty"
+
+
+class ImportReport:
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.rows = 0
+        self.inserted = 0
+        self.skipped = 0
+        self.errors = []  # (line number, message)
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.elapsed if self.elapsed > 0 else float(self.rows)
+
+    def error_messages(self, limit=5):
+        msgs = [f"Line {line}: {msg}" for line, msg in self.errors[:limit]]
+        if len(self.errors) > limit:
+            msgs.append(f"... and {len(self.errors) - limit} more error(s)")
+        return msgs
+
+
+def parse_question_row(r):
+    """Validate one CSV row; returns (text, opts, correct_norm, is_multiple, topic, difficulty) or raises ValueError."""
+    if len(r) < 6:
+        raise ValueError(f"Each row must have 6 columns: {CSV_COLUMNS}")
+    q_text = r[0].strip()
+    opts = [r[1].strip(), r[2].strip(), r[3].strip(), r[4].strip()]
+    correct_raw = r[5].strip()
+    if not q_text or not all(opts):
+        raise ValueError("Question text and all four options are required")
+    if not correct_raw:
+        raise ValueError("Correct column is required")
+    parts = [p.strip() for p in correct_raw.replace(",", ";").split(";") if p.strip()]
+    for p in parts:
+        if p not in ("1", "2", "3", "4"):
+            raise ValueError(f"Invalid correct index '{p}' for question '{q_text}'")
+    correct_norm = ";".join(sorted(set(parts), key=lambda x: int(x)))
+    is_multiple = 1 if len(parts) > 1 else 0
+    # optional trailing columns used for stratified sampling
+    topic = r[6].strip() if len(r) > 6 and r[6].strip() else None
+    difficulty = r[7].strip().lower() if len(r) > 7 and r[7].strip() else None
+    return q_text, opts, correct_norm, is_multiple, topic, difficulty
+
+
+def _existing_texts(cur, test_id, texts):
+    placeholders = ",".join("?" for _ in texts)
+    cur.execute(f"""
+        SELECT question_text FROM questions
+        WHERE test_id = ? AND question_text IN ({placeholders})
+    """, (test_id, *texts))
+    return {r[0] for r in cur.fetchall()}
+
+
+QUESTION_INSERT_COLUMNS = ("test_id", "question_text", "option1", "option2", "option3", "option4", "correct",
+                           "is_multiple", "topic", "difficulty", "correct_mask")
+
+
+def insert_question_rows(cur, rows):
+    """Insert question rows laid out as QUESTION_INSERT_COLUMNS."""
+    cur.executemany(f"""
+        INSERT INTO questions ({", ".join(QUESTION_INSERT_COLUMNS)})
+        VALUES ({", ".join("?" for _ in QUESTION_INSERT_COLUMNS)})
+    """, rows)
+
+
+def import_questions(conn, test_id, byte_stream, chunk_size=500, dry_run=False,
+                     skip_duplicates=False, max_errors=50, insert=insert_question_rows, on_chunk=None):
+    """Import questions for test_id from a binary CSV stream.
+
+    Commits only if every row is valid; otherwise rolls back and returns the
+    line-numbered errors (validation continues past the first error, up to
+    max_errors, so a trainer can fix several at once). With skip_duplicates,
+    questions whose text already exists in the test, or appeared earlier in
+    the file, are skipped. In dry_run nothing is written; duplicates across
+    chunks of the file itself are then not detected. insert(cursor, rows)
+    writes each chunk; the storage backend can swap in a bulk load.
+    on_chunk(), if given, runs after each chunk; raising from it rolls the
+    import back (used for progress and cancellation by background jobs).
+    """
+    report = ImportReport(dry_run=dry_run)
+    started = time.perf_counter()
+    cur = conn.cursor()
+    reader = csv.reader(codecs.iterdecode(byte_stream, "utf-8-sig"))
+    chunk = []
+
+    def flush():
+        if skip_duplicates:
+            existing = _existing_texts(cur, test_id, list({row[1] for row in chunk}))
+            fresh = []
+            for row in chunk:
+                if row[1] in existing:
+                    report.skipped += 1
+                else:
+                    existing.add(row[1])
+                    fresh.append(row)
+        else:
+            fresh = chunk
+        if not dry_run and fresh:
+            insert(cur, fresh)
+        report.inserted += len(fresh)
+        chunk.clear()
+        if on_chunk is not None:
+            on_chunk()
+
+    try:
+        first = True
+        while len(report.errors) < max_errors:
+            try:
+                r = next(reader)
+            except StopIteration:
+                break
+            except (UnicodeDecodeError, csv.Error) as e:
+                report.errors.append((reader.line_num + 1, f"Unreadable row ({e})"))
+                break
+            if first:
+                first = False
+                # skip header row if present
+                if r and r[0].strip().lower() == "question":
+                    continue
+            if not any(cell.strip() for cell in r):
+                continue
+            report.rows += 1
+            try:
+                q_text, opts, correct_norm, is_multiple, topic, difficulty = parse_question_row(r)
+            except ValueError as e:
+                report.errors.append((reader.line_num, str(e)))
+                continue
+            if report.errors:
+                # keep validating, but nothing more will be written
+                continue
+            # the answer key is compiled to a bitmask once, here
+            chunk.append((test_id, q_text, opts[0], opts[1], opts[2], opts[3], correct_norm, is_multiple,
+                          topic, difficulty, answer_mask(correct_norm)))
+            if len(chunk) >= chunk_size:
+                flush()
+        if report.rows == 0 and not report.errors:
+            report.errors.append((reader.line_num, "CSV is empty"))
+        if not report.errors and chunk:
+            flush()
+        if report.errors or dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    report.elapsed = time.perf_counter() - started
+    if report.errors:
+        report.inserted = 0
+    return report
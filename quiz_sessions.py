@@ -0,0 +1,212 @@
+# quiz_sessions.py
+"""Server-side quiz sessions.
+
+The trainee's cookie carries only an opaque session id; the quiz itself
+(test, chosen questions, trainee, start time and deadline) lives here. That
+keeps cookies a few bytes regardless of quiz length, lets a refreshed quiz
+page resume the same questions, and lets quiz_submit check the deadline
+against the server's clock rather than the browser's.
+
+MemorySessionStore is a bounded LRU and is enough for a single process.
+SQLiteSessionStore keeps the rows in the quiz_sessions table and uses the
+LRU only as a read-through front; claim() always goes to the database, so a
+session can be submitted once even across several worker processes.
+"""
+import os
+import json
+import time
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+
+def _now():
+    return datetime.utcnow().isoformat()
+
+
+class MemorySessionStore:
+    def __init__(self, max_entries=10000, sweep_interval=60):
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # id -> (expires_at, data)
+        self._sweeper = None
+        self._sweeper_pid = None
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    # -- in-memory LRU
+    def _cache_get(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= _now():
+                del self._entries[sid]
+                self.expired += 1
+                return None
+            self._entries.move_to_end(sid)
+            self.hits += 1
+            return entry[1]
+
+    def _cache_put(self, sid, expires_at, data):
+        with self._lock:
+            self._entries[sid] = (expires_at, data)
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _cache_pop(self, sid):
+        with self._lock:
+            entry = self._entries.pop(sid, None)
+        return entry
+
+    # -- store interface
+    def create(self, data, ttl_seconds):
+        """Store data under a new opaque id that expires after ttl_seconds."""
+        self._ensure_sweeper()
+        sid = secrets.token_urlsafe(24)
+        expires_at = (datetime.utcnow() + timedelta(seconds=ttl_seconds)).isoformat()
+        self._persist(sid, expires_at, data)
+        self._cache_put(sid, expires_at, data)
+        return sid
+
+    def get(self, sid):
+        """The session's data, or None if it is unknown, claimed or expired."""
+        if not sid:
+            return None
+        return self._cache_get(sid)
+
+    def claim(self, sid):
+        """Remove the session and return its data; only one caller ever gets it."""
+        if not sid:
+            return None
+        entry = self._cache_pop(sid)
+        if entry is None or entry[0] <= _now():
+            return None
+        return entry[1]
+
+    def discard(self, sid):
+        if sid:
+            self._cache_pop(sid)
+
+    def _persist(self, sid, expires_at, data):
+        pass
+
+    # -- expiry
+    def sweep(self):
+        """Drop expired sessions; returns how many were removed."""
+        now = _now()
+        with self._lock:
+            stale = [sid for sid, (expires_at, _) in self._entries.items() if expires_at <= now]
+            for sid in stale:
+                del self._entries[sid]
+            self.expired += len(stale)
+        return len(stale)
+
+    def _ensure_sweeper(self):
+        if self.sweep_interval <= 0:
+            return
+        if self._sweeper is not None and self._sweeper.is_alive() and self._sweeper_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sweeper is not None and self._sweeper.is_alive() and self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+            self._sweeper = threading.Thread(target=self._sweep_forever, name="quiz-session-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception:
+                # a locked database or similar; try again next interval
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": type(self).__name__,
+                "cached": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+            }
+
+
+class SQLiteSessionStore(MemorySessionStore):
+    """quiz_sessions table with the LRU in front of it.
+
+    writer_pool and reader_pool are db_pool.ConnectionPool instances; each
+    operation borrows a connection only for the duration of its statement.
+    """
+
+    def __init__(self, writer_pool, reader_pool=None, max_entries=10000, sweep_interval=60):
+        super().__init__(max_entries=max_entries, sweep_interval=sweep_interval)
+        self.writer_pool = writer_pool
+        self.reader_pool = reader_pool or writer_pool
+
+    def _persist(self, sid, expires_at, data):
+        conn = self.writer_pool.acquire()
+        try:
+            conn.execute("INSERT INTO quiz_sessions (id, data, expires_at) VALUES (?, ?, ?)",
+                         (sid, json.dumps(data), expires_at))
+            conn.commit()
+        finally:
+            self.writer_pool.release(conn)
+
+    def get(self, sid):
+        data = super().get(sid)
+        if data is not None or not sid:
+            return data
+        # not cached here: created by another process, or evicted
+        conn = self.reader_pool.acquire()
+        try:
+            row = conn.execute("SELECT data, expires_at FROM quiz_sessions WHERE id = ? AND expires_at > ?",
+                               (sid, _now())).fetchone()
+        finally:
+            self.reader_pool.release(conn)
+        if row is None:
+            return None
+        data = json.loads(row[0])
+        self._cache_put(sid, row[1], data)
+        return data
+
+    def claim(self, sid):
+        if not sid:
+            return None
+        self._cache_pop(sid)
+        conn = self.writer_pool.acquire()
+        try:
+            rows = conn.execute("DELETE FROM quiz_sessions WHERE id = ? AND expires_at > ? RETURNING data",
+                               (sid, _now())).fetchall()
+            conn.commit()
+        finally:
+            self.writer_pool.release(conn)
+        return json.loads(rows[0][0]) if rows else None
+
+    def discard(self, sid):
+        if not sid:
+            return
+        self._cache_pop(sid)
+        conn = self.writer_pool.acquire()
+        try:
+            conn.execute("DELETE FROM quiz_sessions WHERE id = ?", (sid,))
+            conn.commit()
+        finally:
+            self.writer_pool.release(conn)
+
+    def sweep(self):
+        removed = super().sweep()
+        conn = self.writer_pool.acquire()
+        try:
+            cur = conn.execute("DELETE FROM quiz_sessions WHERE expires_at <= ?", (_now(),))
+            conn.commit()
+        finally:
+            self.writer_pool.release(conn)
+        return max(removed, cur.rowcount)
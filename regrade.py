@@ -0,0 +1,160 @@
+# regrade.py
+"""Rescore every attempt of a test against its current answer keys.
+
+Used after a trainer fixes a wrong answer key. All of the test's answers
+are read in one ordered pass into flat arrays of (result, selected mask,
+answer-key mask); correctness is a single elementwise comparison and the new
+scores a single bincount. Only rows whose outcome actually changed are
+written back. NumPy is used when installed; otherwise the same pass runs in
+plain Python over the arrays.
+
+Editing one question's key instead queues a background job (see jobs.py)
+running regrade_question, which streams only that question's answers and
+applies them in small transactions while the dashboards keep serving.
+"""
+import time
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # optional; the pure-Python path gives identical results
+    np = None
+
+
+class RegradeReport:
+    def __init__(self, test_id):
+        self.test_id = test_id
+        self.attempts = 0
+        self.answers = 0
+        self.changed_answers = 0
+        self.changed_scores = 0
+        self.engine = "numpy" if np is not None else "python"
+        self.elapsed = 0.0
+
+
+def _load(conn, test_id, batch_size=10000):
+    """Flat arrays over the test's answers, ordered by result id.
+
+    Answers to questions that have since been deleted get key -1, so they
+    can never count as correct (as when they were first graded).
+    """
+    results, old_scores = array("q"), array("q")
+    answer_result, selected, keys, old_correct, question_ids = (
+        array("q"), array("q"), array("q"), array("B"), array("q"))
+    cur = conn.execute("""
+        SELECT r.id, r.score, ra.question_id, ra.selected_mask, ra.is_correct, COALESCE(q.correct_mask, -1)
+        FROM results r
+        LEFT JOIN result_answers ra ON ra.result_id = r.id
+        LEFT JOIN questions q ON q.id = ra.question_id
+        WHERE r.test_id = ?
+        ORDER BY r.id
+    """, (test_id,))
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        for rid, score, qid, mask, ok, key in rows:
+            if not results or results[-1] != rid:
+                results.append(rid)
+                old_scores.append(score)
+            if qid is None:
+                continue
+            answer_result.append(len(results) - 1)
+            question_ids.append(qid)
+            selected.append(mask)
+            keys.append(key)
+            old_correct.append(ok)
+    return results, old_scores, answer_result, question_ids, selected, keys, old_correct
+
+
+def _grade_numpy(n_results, answer_result, selected, keys):
+    sel = np.frombuffer(selected, dtype=np.int64)
+    key = np.frombuffer(keys, dtype=np.int64)
+    correct = (sel != 0) & (sel == key)
+    scores = np.bincount(np.frombuffer(answer_result, dtype=np.int64), weights=correct, minlength=n_results)
+    return correct.astype(np.uint8).tolist(), scores.astype(np.int64).tolist()
+
+
+def _grade_python(n_results, answer_result, selected, keys):
+    correct = [1 if s and s == k else 0 for s, k in zip(selected, keys)]
+    scores = [0] * n_results
+    for i, ok in zip(answer_result, correct):
+        scores[i] += ok
+    return correct, scores
+
+
+def regrade_test(conn, test_id):
+    """Recompute result_answers.is_correct and results.score for test_id; commits.
+
+    The caller refreshes the dashboard aggregates (app.rebuild_stats) afterwards.
+    """
+    report = RegradeReport(test_id)
+    started = time.perf_counter()
+    results, old_scores, answer_result, question_ids, selected, keys, old_correct = _load(conn, test_id)
+    report.attempts, report.answers = len(results), len(selected)
+    grade = _grade_numpy if np is not None else _grade_python
+    correct, scores = grade(len(results), answer_result, selected, keys)
+
+    answer_updates = [(ok, results[answer_result[i]], question_ids[i])
+                      for i, ok in enumerate(correct) if ok != old_correct[i]]
+    score_updates = [(score, results[i]) for i, score in enumerate(scores) if score != old_scores[i]]
+    cur = conn.cursor()
+    cur.executemany("UPDATE result_answers SET is_correct = ? WHERE result_id = ? AND question_id = ?",
+                    answer_updates)
+    cur.executemany("UPDATE results SET score = ? WHERE id = ?", score_updates)
+    conn.commit()
+    report.changed_answers, report.changed_scores = len(answer_updates), len(score_updates)
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+# ---------------- Background regrade after a single answer-key edit
+def regrade_question(read_conn, write_conn, test_id, question_id, new_mask, apply_fn, chunk_size=500,
+                     progress=None):
+    """Stream the answers to question_id and regrade them chunk by chunk.
+
+    Answers are read from a snapshot on read_conn; each chunk is applied by
+    apply_fn(cursor, test_id, question_id, [(result_id, is_correct)]) in its
+    own BEGIN IMMEDIATE transaction on write_conn, so readers only ever see
+    whole chunks (answers, scores and aggregates together). apply_fn returns
+    how many attempts changed. progress(processed, total), if given, runs
+    after each committed chunk. A last pass then regrades answers committed
+    after the snapshot that still disagree with new_mask. Returns (answers
+    processed, attempts changed).
+    """
+    params = (question_id,)
+    total = read_conn.execute(
+        "SELECT COUNT(*) FROM result_answers WHERE question_id = ? AND selected_mask <> 0", params).fetchone()[0]
+    cur = read_conn.execute(
+        "SELECT result_id, selected_mask FROM result_answers WHERE question_id = ? AND selected_mask <> 0", params)
+    wcur = write_conn.cursor()
+    processed = changed = 0
+
+    def apply(rows):
+        changes = [(result_id, 1 if mask == new_mask else 0) for result_id, mask in rows]
+        wcur.execute("BEGIN IMMEDIATE")
+        try:
+            n = apply_fn(wcur, test_id, question_id, changes)
+            wcur.execute("COMMIT")
+        except Exception:
+            wcur.execute("ROLLBACK")
+            raise
+        return n
+
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        changed += apply(rows)
+        processed += len(rows)
+        if progress is not None:
+            progress(processed, total)
+    # graded against the old key but committed after the snapshot
+    late = read_conn.execute("""
+        SELECT result_id, selected_mask FROM result_answers
+        WHERE question_id = ? AND selected_mask <> 0
+          AND is_correct <> CASE WHEN selected_mask = ? THEN 1 ELSE 0 END
+    """, (question_id, new_mask)).fetchall()
+    for i in range(0, len(late), chunk_size):
+        changed += apply(late[i:i + chunk_size])
+    return processed, changed
@@ -0,0 +1,1053 @@
+# repository.py
+"""Data access for tests, questions, trainees and results.
+
+app.py goes through a Repository rather than writing SQL inline. There are
+two backends, picked by open_repository() from the configuration:
+
+- SQLiteRepository (default): the pooled SQLite file, migrated by
+  init_db.MIGRATIONS.
+- PostgresRepository (QUIZ_DB_BACKEND=postgres): a server database for
+  when SQLite's single writer is the ceiling. Needs the optional psycopg
+  package. Question uploads and submitted answers are written with COPY,
+  and roster batches are one multi-row upsert each.
+
+Both backends run the same SQL, written with "?" placeholders. PgConnection
+gives psycopg connections the sqlite3 shape the rest of the tree already
+uses: qmark parameters, rows indexable by name and position, and execute()
+on the connection. So the modules with their own portable SQL (question
+cache, session store, exports, regrades) run on either backend unchanged.
+"""
+import re
+import sqlite3
+import functools
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from db_pool import ConnectionPool
+from aggregates import (
+    SCORE_BUCKETS, COUNTED_SCORE, score_bucket, score_pct, progress_row, write_progress_rows,
+    refresh_trainee_totals, rebuild_trainee_progress,
+)
+from init_db import migrate_locked, require_sqlite_version
+from question_import import QUESTION_INSERT_COLUMNS, insert_question_rows
+from roster import upsert_trainee_rows
+from enrolment import insert_enrolment_rows, update_enrolment_stats
+
+try:
+    import psycopg
+    from psycopg.pq import TransactionStatus
+except ImportError:  # optional; only the postgres backend needs it
+    psycopg = None
+
+BACKENDS = ("sqlite", "postgres")
+
+TEST_COLUMNS = ("name", "description", "duration_minutes", "total_trainees", "question_count", "stratify_by",
+                "shuffle_options", "seeded_draw", "max_attempts", "cooldown_minutes", "score_policy")
+QUESTION_COLUMNS = ("question_text", "option1", "option2", "option3", "option4", "correct", "correct_mask",
+                    "is_multiple", "topic", "difficulty")
+ANSWER_COLUMNS = ("result_id", "question_id", "selected_mask", "is_correct")
+
+
+def _now():
+    return datetime.utcnow().isoformat()
+
+
+class DuplicateError(ValueError):
+    """A unique key (test code, Employee ID) is already taken."""
+
+
+class Repository(ABC):
+    """SQL shared by the backends. Methods take the connection or cursor to run on.
+
+    Subclasses provide writer_pool/reader_pool (db_pool.ConnectionPool
+    interface), errors (the driver's base exception), integrity_errors and
+    migrate(), and may override the bulk writers.
+    """
+
+    backend = None
+    errors = ()
+    integrity_errors = ()
+
+    @abstractmethod
+    def migrate(self, verbose=False):
+        """Bring the schema up to date; returns the schema version."""
+
+    # ---------------- Tests
+    def list_tests(self, conn):
+        return conn.execute("""
+            SELECT id, test_code, name, duration_minutes, created_at, updated_at
+            FROM tests
+            ORDER BY created_at DESC
+        """).fetchall()
+
+    def get_test(self, conn, test_id):
+        return conn.execute("SELECT * FROM tests WHERE id = ?", (test_id,)).fetchone()
+
+    def get_test_by_code(self, conn, code):
+        return conn.execute("SELECT * FROM tests WHERE test_code = ?", (code,)).fetchone()
+
+    def test_code_exists(self, conn, code):
+        return conn.execute("SELECT 1 FROM tests WHERE test_code = ?", (code,)).fetchone() is not None
+
+    def create_test(self, conn, code, name, description, duration_minutes):
+        """Insert and commit a test; DuplicateError if the code is taken."""
+        now = _now()
+        try:
+            row = conn.execute("""
+                INSERT INTO tests (test_code, name, description, duration_minutes, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                RETURNING id
+            """, (code, name, description, duration_minutes, now, now)).fetchone()
+            conn.commit()
+        except self.integrity_errors as e:
+            conn.rollback()
+            raise DuplicateError(f"Test code {code} already exists") from e
+        return row[0]
+
+    def update_test(self, conn, test_id, values):
+        """Set the given TEST_COLUMNS, mark the dashboard stale and commit.
+
+        Changing score_policy recomputes the points of everyone who took the test.
+        """
+        unknown = set(values) - set(TEST_COLUMNS)
+        if unknown:
+            raise ValueError(f"not editable: {', '.join(sorted(unknown))}")
+        cur = conn.cursor()
+        old = cur.execute("SELECT score_policy FROM tests WHERE id = ?", (test_id,)).fetchone()
+        cur.execute(f"""
+            UPDATE tests SET {", ".join(f"{c} = ?" for c in values)}, updated_at = ?
+            WHERE id = ?
+        """, (*values.values(), _now(), test_id))
+        self.bump_dashboard_version(cur, test_id)
+        if old is not None and "score_policy" in values and values["score_policy"] != old[0]:
+            self.refresh_trainee_totals(cur, [r[0] for r in cur.execute(
+                "SELECT trainee_id FROM trainee_test_stats WHERE test_id = ?", (test_id,)).fetchall()])
+        conn.commit()
+
+    def delete_test_results(self, conn, test_id, limit):
+        """Delete and commit up to limit of the test's attempts (answers cascade); returns how many.
+
+        Lets a background delete work through a large test in short write
+        transactions before delete_test removes the rest.
+        """
+        cur = conn.cursor()
+        cur.execute("""
+            DELETE FROM results WHERE id IN (SELECT id FROM results WHERE test_id = ? ORDER BY id LIMIT ?)
+        """, (test_id, limit))
+        deleted = cur.rowcount
+        conn.commit()
+        return deleted
+
+    def count_test_results(self, conn, test_id):
+        return conn.execute("SELECT COUNT(*) FROM results WHERE test_id = ?", (test_id,)).fetchone()[0]
+
+    def delete_test(self, conn, test_id):
+        # questions, results, answers and attempts go with it (ON DELETE CASCADE)
+        cur = conn.cursor()
+        cur.execute("DELETE FROM tests WHERE id = ?", (test_id,))
+        cur.execute("DELETE FROM question_stats WHERE test_id = ?", (test_id,))
+        cur.execute("DELETE FROM test_stats WHERE test_id = ?", (test_id,))
+        affected = [r[0] for r in cur.execute("SELECT trainee_id FROM trainee_test_stats WHERE test_id = ?",
+                                              (test_id,)).fetchall()]
+        cur.execute("DELETE FROM trainee_test_stats WHERE test_id = ?", (test_id,))
+        self.refresh_trainee_totals(cur, affected)
+        conn.commit()
+
+    def dashboard_version(self, conn, test_id):
+        """The test's dashboard version, or None if it does not exist."""
+        row = conn.execute("SELECT dashboard_version FROM tests WHERE id = ?", (test_id,)).fetchone()
+        return row[0] if row else None
+
+    def bump_dashboard_version(self, cur, test_id):
+        """Mark test_id's cached dashboard payload stale; runs in the caller's transaction.
+
+        Returns the new version (None if the test is gone).
+        """
+        row = cur.execute("UPDATE tests SET dashboard_version = dashboard_version + 1 WHERE id = ? "
+                          "RETURNING dashboard_version", (test_id,)).fetchone()
+        return row[0] if row else None
+
+    # ---------------- Questions
+    def list_questions(self, conn, test_id):
+        return conn.execute("""
+            SELECT id, question_text, option1, option2, option3, option4, correct, is_multiple
+            FROM questions
+            WHERE test_id = ?
+            ORDER BY id ASC
+        """, (test_id,)).fetchall()
+
+    def get_question(self, conn, question_id):
+        return conn.execute("SELECT * FROM questions WHERE id = ?", (question_id,)).fetchone()
+
+    def update_question(self, conn, question_id, test_id, values):
+        """Set the given QUESTION_COLUMNS, mark the test's dashboard stale and commit."""
+        unknown = set(values) - set(QUESTION_COLUMNS)
+        if unknown:
+            raise ValueError(f"not editable: {', '.join(sorted(unknown))}")
+        cur = conn.cursor()
+        cur.execute(f"UPDATE questions SET {', '.join(f'{c} = ?' for c in values)} WHERE id = ?",
+                    (*values.values(), question_id))
+        self.bump_dashboard_version(cur, test_id)
+        conn.commit()
+
+    def delete_questions(self, conn, question_ids):
+        """Delete questions and their stats; returns (ids of the affected tests, rows deleted)."""
+        cur = conn.cursor()
+        placeholders = ",".join("?" for _ in question_ids)
+        # resolved from the ids, so callers cannot leave a stale bank behind
+        cur.execute(f"SELECT DISTINCT test_id FROM questions WHERE id IN ({placeholders})", tuple(question_ids))
+        affected = [r[0] for r in cur.fetchall()]
+        cur.execute(f"DELETE FROM questions WHERE id IN ({placeholders})", tuple(question_ids))
+        deleted = cur.rowcount
+        cur.execute(f"DELETE FROM question_stats WHERE question_id IN ({placeholders})", tuple(question_ids))
+        for test_id in affected:
+            self.bump_dashboard_version(cur, test_id)
+        conn.commit()
+        return affected, deleted
+
+    def insert_questions(self, cur, rows):
+        """Bulk insert for question_import; rows are laid out as QUESTION_INSERT_COLUMNS."""
+        insert_question_rows(cur, rows)
+
+    # ---------------- Trainees
+    def find_trainee(self, conn, emp_id):
+        """Case-insensitive Employee ID lookup."""
+        return conn.execute("SELECT id, emp_id, name FROM trainees WHERE LOWER(emp_id) = LOWER(?)",
+                            (emp_id,)).fetchone()
+
+    def get_trainee(self, conn, trainee_id):
+        return conn.execute("SELECT id, emp_id, name, created_at FROM trainees WHERE id = ?", (trainee_id,)).fetchone()
+
+    def add_trainee(self, conn, emp_id, name):
+        """Insert and commit a trainee; DuplicateError if the Employee ID is taken."""
+        try:
+            row = conn.execute("INSERT INTO trainees (emp_id, name, created_at) VALUES (?, ?, ?) RETURNING id",
+                               (emp_id, name, _now())).fetchone()
+            conn.commit()
+        except self.integrity_errors as e:
+            conn.rollback()
+            raise DuplicateError(f"Employee ID {emp_id} already exists") from e
+        return row[0]
+
+    def delete_trainee(self, conn, trainee_id):
+        # results keep the emp id and name they were recorded with; the rollups go
+        cur = conn.cursor()
+        cur.execute("DELETE FROM trainees WHERE id = ?", (trainee_id,))
+        cur.execute("DELETE FROM trainee_test_stats WHERE trainee_id = ?", (trainee_id,))
+        cur.execute("DELETE FROM trainee_stats WHERE trainee_id = ?", (trainee_id,))
+        cur.execute("DELETE FROM attempts WHERE trainee_id = ?", (trainee_id,))
+        for (test_id,) in cur.execute("DELETE FROM test_enrolments WHERE trainee_id = ? RETURNING test_id",
+                                      (trainee_id,)).fetchall():
+            update_enrolment_stats(cur, test_id, [trainee_id], -1)
+            self.bump_dashboard_version(cur, test_id)
+        conn.commit()
+
+    def upsert_trainees(self, cur, rows):
+        """Bulk upsert for roster imports; rows are (emp_id, name, created_at)."""
+        upsert_trainee_rows(cur, rows)
+
+    def trainees_page(self, conn, cursor, pattern, limit):
+        """Trainees newest first, keyed on (created_at, id); pattern is an escaped LIKE pattern."""
+        clauses, params = [], []
+        if cursor:
+            # spelled out (not a row value) so SQLite can range-seek the expression index
+            clauses.append("COALESCE(created_at, '') <= ? AND (COALESCE(created_at, '') < ? OR id < ?)")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+        if pattern:
+            clauses.append("(lower(emp_id) LIKE ? ESCAPE '\\' OR lower(name) LIKE ? ESCAPE '\\')")
+            params.extend([pattern, pattern])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return conn.execute(f"""
+            SELECT id, emp_id, name, created_at FROM trainees
+            {where}
+            ORDER BY COALESCE(created_at, '') DESC, id DESC
+            LIMIT ?
+        """, (*params, limit)).fetchall()
+
+    # ---------------- Job queue (see jobs.py)
+    def lock_job_queue(self, cur):
+        """Serialize job claims; a no-op where writes already are (SQLite's single writer)."""
+
+    # ---------------- Attempt ledger (see attempt_policy.py)
+    def last_attempt(self, conn, test_id, trainee_id):
+        """The trainee's latest attempts row for the test, or None; one seek on idx_attempts_trainee."""
+        return conn.execute("""
+            SELECT attempt_no, started_at, submitted_at FROM attempts
+            WHERE test_id = ? AND trainee_id = ?
+            ORDER BY attempt_no DESC
+            LIMIT 1
+        """, (test_id, trainee_id)).fetchone()
+
+    def reserve_attempt(self, conn, test_id, trainee_id, attempt_no, session_key, started_at):
+        """Insert and commit the ledger row of a started quiz.
+
+        DuplicateError if attempt_no was taken meanwhile (a concurrent start
+        by the same trainee); starts by other trainees never conflict.
+        """
+        try:
+            conn.execute("""
+                INSERT INTO attempts (test_id, trainee_id, attempt_no, session_key, started_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (test_id, trainee_id, attempt_no, session_key, started_at))
+            conn.commit()
+        except self.integrity_errors as e:
+            conn.rollback()
+            raise DuplicateError(f"Attempt {attempt_no} was already started") from e
+
+    # ---------------- Results
+    def record_submission(self, cur, sub):
+        """Write one graded submission: results row, per-question answers, aggregates.
+
+        sub is the dict built by quiz_submit. Runs in the caller's transaction
+        (the submission writer's batch, or inline); returns the new results id
+        and stores the new dashboard version in sub["dashboard_version"].
+        With a session_key, the submission first claims its attempts row and
+        returns None without writing anything if it was already submitted.
+        The answers are regraded against the committed keys first (see
+        regrade_submission), so sub's score may change.
+        """
+        session_key = sub.get("session_key")
+        if session_key is not None:
+            claimed = cur.execute("""
+                UPDATE attempts SET submitted_at = ?
+                WHERE session_key = ? AND submitted_at IS NULL
+                RETURNING id
+            """, (sub["attempted_at"], session_key)).fetchone()
+            if claimed is None:
+                return None
+        self.regrade_submission(cur, sub)
+        result_id = cur.execute("""
+            INSERT INTO results (test_id, attempted_at, score, total, trainee_id, trainee_emp_id, trainee_name)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            RETURNING id
+        """, (sub["test_id"], sub["attempted_at"], sub["score"], sub["total"],
+              sub["trainee_id"], sub["trainee_emp_id"], sub["trainee_name"])).fetchone()[0]
+        self.insert_answers(cur, [(result_id, qid, mask, ok) for qid, mask, ok in sub["answers"]])
+        # same transaction as the INSERT so the dashboard aggregates never drift
+        sub["dashboard_version"] = self.record_attempt_stats(cur, sub["test_id"], sub["score"], sub["total"],
+                                                             sub["question_results"])
+        if sub["trainee_id"] is not None:
+            self.record_trainee_progress(cur, sub["trainee_id"], sub["test_id"], sub["score"], sub["total"],
+                                         sub["attempted_at"])
+            sub["new_participant"] = self.first_enrolled_attempt(cur, sub["test_id"], sub["trainee_id"], result_id)
+            if sub["new_participant"]:
+                cur.execute("UPDATE test_stats SET enrolled_participants = enrolled_participants + 1 WHERE test_id = ?",
+                            (sub["test_id"],))
+        if session_key is not None:
+            cur.execute("UPDATE attempts SET result_id = ? WHERE id = ?", (result_id, claimed[0]))
+        return result_id
+
+    def regrade_submission(self, cur, sub):
+        """Grade sub's answers again against the keys committed now, in the caller's transaction.
+
+        quiz_submit grades against a cached bank, which may predate an answer
+        key edit or come from another process that has not seen it. The edit's
+        regrade job only rescans attempts committed before it started, so an
+        attempt written later has to pick up the new key here.
+        """
+        keys = dict(cur.execute("SELECT id, correct_mask FROM questions WHERE test_id = ?",
+                                (sub["test_id"],)).fetchall())
+        answers, question_results = [], []
+        for qid, mask, _ in sub["answers"]:
+            key = keys.get(qid)  # None if the question was deleted meanwhile
+            ok = 1 if mask and mask == key else 0
+            answers.append((qid, mask, ok))
+            if mask and key is not None:
+                question_results.append((qid, bool(ok)))
+        sub["answers"], sub["question_results"] = answers, question_results
+        sub["score"] = sum(ok for _, _, ok in answers)
+
+    def insert_answers(self, cur, rows):
+        """Bulk insert of result_answers rows laid out as ANSWER_COLUMNS."""
+        cur.executemany("""
+            INSERT INTO result_answers (result_id, question_id, selected_mask, is_correct)
+            VALUES (?, ?, ?, ?)
+        """, rows)
+
+    def record_attempt_stats(self, cur, test_id, score, total, question_results):
+        """Fold one attempt into the aggregate tables.
+
+        question_results is a list of (question_id, is_correct) for the questions
+        the trainee actually answered. Returns the new dashboard version.
+        """
+        bucket = score_bucket(score, total)
+        # target columns are qualified: Postgres rejects the bare names as ambiguous
+        cur.execute(f"""
+            INSERT INTO test_stats (test_id, participants, bucket_{bucket})
+            VALUES (?, 1, 1)
+            ON CONFLICT(test_id) DO UPDATE SET
+                participants = test_stats.participants + 1,
+                bucket_{bucket} = test_stats.bucket_{bucket} + 1
+        """, (test_id,))
+        if question_results:
+            cur.executemany("""
+                INSERT INTO question_stats (question_id, test_id, attempts, correct)
+                VALUES (?, ?, 1, ?)
+                ON CONFLICT(question_id) DO UPDATE SET
+                    attempts = question_stats.attempts + 1,
+                    correct = question_stats.correct + excluded.correct
+            """, [(qid, test_id, 1 if ok else 0) for qid, ok in question_results])
+        return self.bump_dashboard_version(cur, test_id)
+
+    def attempts_page(self, conn, test_id, cursor, pattern, limit):
+        """Attempts newest first, keyed on (attempted_at, id).
+
+        Walks idx_results_test_attempted from the cursor, so the cost of a page
+        does not depend on how many attempts the test has.
+        """
+        clauses, params = ["r.test_id = ?"], [test_id]
+        if cursor:
+            clauses.append("(r.attempted_at, r.id) < (?, ?)")
+            params.extend(cursor)
+        if pattern:
+            clauses.append("""(lower(COALESCE(t.emp_id, r.trainee_emp_id)) LIKE ? ESCAPE '\\'
+                               OR lower(COALESCE(t.name, r.trainee_name)) LIKE ? ESCAPE '\\')""")
+            params.extend([pattern, pattern])
+        # Prefer joining trainees on trainee_id; fall back to the emp id/name stored in results.
+        return conn.execute(f"""
+            SELECT r.id, r.attempted_at, r.score, r.total,
+                   COALESCE(t.emp_id, r.trainee_emp_id) AS emp_id,
+                   COALESCE(t.name, r.trainee_name) AS trainee_name
+            FROM results r
+            LEFT JOIN trainees t ON r.trainee_id = t.id
+            WHERE {" AND ".join(clauses)}
+            ORDER BY r.attempted_at DESC, r.id DESC
+            LIMIT ?
+        """, (*params, limit)).fetchall()
+
+    def test_stats(self, conn, test_id):
+        return conn.execute("SELECT * FROM test_stats WHERE test_id = ?", (test_id,)).fetchone()
+
+    def question_stats(self, conn, test_id):
+        return conn.execute("""
+            SELECT q.id, q.question_text,
+                   COALESCE(s.attempts, 0) AS attempts, COALESCE(s.correct, 0) AS correct
+            FROM questions q
+            LEFT JOIN question_stats s ON s.question_id = q.id
+            WHERE q.test_id = ?
+            ORDER BY q.id ASC
+        """, (test_id,)).fetchall()
+
+    # ---------------- Trainee progress (trainee_test_stats / trainee_stats)
+    def record_trainee_progress(self, cur, trainee_id, test_id, score, total, attempted_at):
+        """Fold one attempt into the trainee's rollups; runs in the submission's transaction."""
+        row = cur.execute("SELECT * FROM trainee_test_stats WHERE trainee_id = ? AND test_id = ?",
+                          (trainee_id, test_id)).fetchone()
+        policy = cur.execute("SELECT score_policy FROM tests WHERE id = ?", (test_id,)).fetchone()
+        counted = COUNTED_SCORE.get(policy[0] if policy else None, "best_score")
+        pct = score_pct(score, total)
+        if row is None:
+            progress = progress_row(trainee_id, test_id, [(score, total, attempted_at)])
+            old_points = 0
+        else:
+            progress = dict(row)
+            old_points = row[counted]
+            progress["attempts"] += 1
+            progress["score_sum"] += score
+            progress["total_sum"] += total
+            if pct > row["best_pct"]:
+                progress.update(best_score=score, best_total=total, best_pct=pct, best_at=attempted_at)
+            if attempted_at >= (row["latest_at"] or ""):
+                progress.update(latest_score=score, latest_total=total, latest_pct=pct, latest_at=attempted_at)
+        write_progress_rows(cur, [progress])
+        cur.execute("""
+            INSERT INTO trainee_stats (trainee_id, tests_taken, attempts, points, score_sum, total_sum, last_attempt_at)
+            VALUES (?, 1, 1, ?, ?, ?, ?)
+            ON CONFLICT(trainee_id) DO UPDATE SET
+                tests_taken = trainee_stats.tests_taken + ?,
+                attempts = trainee_stats.attempts + 1,
+                points = trainee_stats.points + ?,
+                score_sum = trainee_stats.score_sum + excluded.score_sum,
+                total_sum = trainee_stats.total_sum + excluded.total_sum,
+                last_attempt_at = CASE WHEN excluded.last_attempt_at > COALESCE(trainee_stats.last_attempt_at, '')
+                                       THEN excluded.last_attempt_at ELSE trainee_stats.last_attempt_at END
+        """, (trainee_id, progress[counted], score, total, attempted_at,
+              1 if row is None else 0, progress[counted] - old_points))
+
+    def refresh_trainee_totals(self, cur, trainee_ids=None):
+        """Recompute trainee_stats from trainee_test_stats for trainee_ids (all trainees if None)."""
+        refresh_trainee_totals(cur, trainee_ids)
+
+    def refresh_trainee_progress(self, cur, pairs):
+        """Recompute the rollups of (trainee_id, test_id) pairs from results, e.g. after a regrade."""
+        pairs = {(trainee_id, test_id) for trainee_id, test_id in pairs if trainee_id is not None}
+        rows = []
+        for trainee_id, test_id in pairs:
+            attempts = cur.execute("SELECT score, total, attempted_at FROM results WHERE test_id = ? AND trainee_id = ?",
+                                   (test_id, trainee_id)).fetchall()
+            if attempts:
+                rows.append(progress_row(trainee_id, test_id, attempts))
+            else:
+                cur.execute("DELETE FROM trainee_test_stats WHERE trainee_id = ? AND test_id = ?", (trainee_id, test_id))
+        write_progress_rows(cur, rows)
+        self.refresh_trainee_totals(cur, [trainee_id for trainee_id, _ in pairs])
+
+    def rebuild_trainee_progress(self, cur, test_id=None):
+        """Recompute the rollups from results, for one test or all of them. Returns the pairs written."""
+        return rebuild_trainee_progress(cur, test_id)
+
+    def leaderboard(self, conn, limit, test_id=None, score_policy="best"):
+        """Top trainees: overall by points (counted scores summed over tests), or one test by percentage.
+
+        A test is ranked by each trainee's best attempt, or their latest one
+        when score_policy is "latest".
+        """
+        if test_id is None:
+            return conn.execute("""
+                SELECT s.trainee_id, t.emp_id, t.name, s.points, s.tests_taken, s.attempts,
+                       s.score_sum, s.total_sum, s.last_attempt_at
+                FROM trainee_stats s
+                JOIN trainees t ON t.id = s.trainee_id
+                ORDER BY s.points DESC, s.trainee_id
+                LIMIT ?
+            """, (limit,)).fetchall()
+        order = "s.latest_pct DESC, s.latest_at" if score_policy == "latest" else "s.best_pct DESC, s.best_at"
+        return conn.execute(f"""
+            SELECT s.trainee_id, t.emp_id, t.name, s.best_score, s.best_total, s.best_pct, s.best_at,
+                   s.latest_score, s.latest_total, s.latest_pct, s.latest_at, s.attempts, s.score_sum, s.total_sum
+            FROM trainee_test_stats s
+            JOIN trainees t ON t.id = s.trainee_id
+            WHERE s.test_id = ?
+            ORDER BY {order}
+            LIMIT ?
+        """, (test_id, limit)).fetchall()
+
+    def trainee_progress(self, conn, trainee_id):
+        """(totals row or None, overall rank or None, per-test rollups newest first)."""
+        totals = conn.execute("SELECT * FROM trainee_stats WHERE trainee_id = ?", (trainee_id,)).fetchone()
+        rank = None
+        if totals is not None:
+            # ties share a rank; an index range count, so cheap near the top
+            rank = conn.execute("SELECT COUNT(*) FROM trainee_stats WHERE points > ?",
+                                (totals["points"],)).fetchone()[0] + 1
+        tests = conn.execute("""
+            SELECT s.*, t.test_code, t.name AS test_name, t.score_policy
+            FROM trainee_test_stats s
+            JOIN tests t ON t.id = s.test_id
+            WHERE s.trainee_id = ?
+            ORDER BY s.latest_at DESC
+        """, (trainee_id,)).fetchall()
+        return totals, rank, tests
+
+    # ---------------- Enrolment (see enrolment.py)
+    def enrolment_check(self, conn, test_id, trainee_id):
+        """(test restricts entry to enrolled trainees, trainee is enrolled); two primary-key seeks."""
+        row = conn.execute("""
+            SELECT EXISTS (SELECT 1 FROM test_enrolments WHERE test_id = ?),
+                   EXISTS (SELECT 1 FROM test_enrolments WHERE test_id = ? AND trainee_id = ?)
+        """, (test_id, test_id, trainee_id)).fetchone()
+        return bool(row[0]), bool(row[1])
+
+    def enrol_trainees(self, cur, test_id, trainee_ids, enrolled_at):
+        """Bulk enrolment for enrolment.enrol_trainees; runs in the caller's transaction."""
+        insert_enrolment_rows(cur, test_id, trainee_ids, enrolled_at)
+
+    def unenrol_trainees(self, conn, test_id, trainee_ids=None):
+        """Remove the given enrolments (all of the test's when None) and commit; returns how many."""
+        cur = conn.cursor()
+        if trainee_ids is None:
+            cur.execute("DELETE FROM test_enrolments WHERE test_id = ?", (test_id,))
+            removed = cur.rowcount
+            cur.execute("UPDATE test_stats SET enrolled = 0, enrolled_participants = 0 WHERE test_id = ?", (test_id,))
+        else:
+            gone = [r[0] for r in cur.execute(
+                f"DELETE FROM test_enrolments WHERE test_id = ? "
+                f"AND trainee_id IN ({','.join('?' for _ in trainee_ids)}) RETURNING trainee_id",
+                (test_id, *trainee_ids)).fetchall()]
+            update_enrolment_stats(cur, test_id, gone, -1)
+            removed = len(gone)
+        self.bump_dashboard_version(cur, test_id)
+        conn.commit()
+        return removed
+
+    def enrolment_counts(self, conn, test_id):
+        """(enrolled, enrolled with at least one attempt), from the counters in test_stats."""
+        row = conn.execute("SELECT enrolled, enrolled_participants FROM test_stats WHERE test_id = ?",
+                           (test_id,)).fetchone()
+        return (row[0], row[1]) if row else (0, 0)
+
+    def enrolment_page(self, conn, test_id, cursor, pattern, limit, missing_only=False):
+        """Enrolled trainees newest first, keyed on (enrolled_at, trainee_id).
+
+        missing_only keeps those without an attempt: an anti-join that probes
+        idx_results_test_trainee once per enrolment walked.
+        """
+        clauses, params = ["e.test_id = ?"], [test_id]
+        if cursor:
+            clauses.append("(e.enrolled_at < ? OR (e.enrolled_at = ? AND e.trainee_id < ?))")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+        if pattern:
+            clauses.append("(lower(t.emp_id) LIKE ? ESCAPE '\\' OR lower(t.name) LIKE ? ESCAPE '\\')")
+            params.extend([pattern, pattern])
+        attempted = "EXISTS (SELECT 1 FROM results r WHERE r.test_id = e.test_id AND r.trainee_id = e.trainee_id)"
+        if missing_only:
+            clauses.append(f"NOT {attempted}")
+        return conn.execute(f"""
+            SELECT t.id, t.emp_id, t.name, e.enrolled_at, {attempted} AS attempted
+            FROM test_enrolments e
+            JOIN trainees t ON t.id = e.trainee_id
+            WHERE {" AND ".join(clauses)}
+            ORDER BY e.enrolled_at DESC, e.trainee_id DESC
+            LIMIT ?
+        """, (*params, limit)).fetchall()
+
+    def first_enrolled_attempt(self, cur, test_id, trainee_id, result_id):
+        """Whether result_id is an enrolled trainee's first attempt at the test (it joins the participants)."""
+        return cur.execute("""
+            SELECT 1 FROM test_enrolments e
+            WHERE e.test_id = ? AND e.trainee_id = ?
+              AND NOT EXISTS (SELECT 1 FROM results r
+                              WHERE r.test_id = e.test_id AND r.trainee_id = e.trainee_id AND r.id <> ?)
+        """, (test_id, trainee_id, result_id)).fetchone() is not None
+
+
+class SQLiteRepository(Repository):
+    backend = "sqlite"
+    errors = (sqlite3.Error,)
+    integrity_errors = (sqlite3.IntegrityError,)
+
+    def __init__(self, db_path, writers=2, readers=8, factory=sqlite3.Connection, cache_size_kib=16 * 1024):
+        require_sqlite_version()
+        self.db_path = db_path
+        self.writer_pool = ConnectionPool(db_path, size=writers, factory=factory, cache_size_kib=cache_size_kib)
+        self.reader_pool = ConnectionPool(db_path, size=readers, readonly=True, factory=factory,
+                                          cache_size_kib=cache_size_kib)
+
+    def migrate(self, verbose=False):
+        return migrate_locked(self.db_path, verbose=verbose)
+
+
+# ---------------- PostgreSQL
+class PgRow:
+    """sqlite3.Row look-alike: index by position or column name, dict(row) works."""
+    __slots__ = ("_values", "_index")
+
+    def __init__(self, values, index):
+        self._values = values
+        self._index = index
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._values[self._index[key]]
+        return self._values[key]
+
+    def keys(self):
+        return list(self._index)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return f"PgRow({dict(zip(self._index, self._values))!r})"
+
+
+def _pg_row_factory(cursor):
+    index = {col.name: i for i, col in enumerate(cursor.description or ())}
+    return lambda values: PgRow(values, index)
+
+
+# the parts of a statement that ? and % have to be told apart in
+_PG_TOKENS = re.compile(r"""
+      '(?:[^']|'')*'?       # string literal; '' is an escaped quote
+    | "(?:[^"]|"")*"?       # quoted identifier
+    | --[^\n]*              # line comment
+    | /\*.*?(?:\*/|\Z)      # block comment
+    | [?%]
+""", re.VERBOSE | re.DOTALL)
+
+
+def _pg_token(match):
+    token = match.group()
+    if token == "?":
+        return "%s"
+    # psycopg reads every % in the statement as a placeholder marker, even in literals and comments
+    return token.replace("%", "%%")
+
+
+@functools.lru_cache(maxsize=512)
+def _pg_sql(sql, with_params):
+    """Translate qmark SQL: ? -> %s outside literals, identifiers and comments, % -> %% when parameters are bound."""
+    if sql.lstrip().upper().startswith("BEGIN IMMEDIATE"):
+        # SQLite's "take the write lock now"; row locks make it a plain BEGIN here
+        return "BEGIN"
+    if not with_params:
+        return sql
+    return _PG_TOKENS.sub(_pg_token, sql)
+
+
+class PgCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.lastrowid = None  # use RETURNING id
+
+    def execute(self, sql, parameters=()):
+        self._cursor.execute(_pg_sql(sql, bool(parameters)), tuple(parameters) or None)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._cursor.executemany(_pg_sql(sql, True), [tuple(p) for p in seq_of_parameters])
+        return self
+
+    def copy(self, statement):
+        return self._cursor.copy(statement)
+
+    def fetchone(self):
+        return self._cursor.fetchone() if self._cursor.description else None
+
+    def fetchall(self):
+        return self._cursor.fetchall() if self._cursor.description else []
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size) if self._cursor.description else []
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class PgConnection:
+    """psycopg connection with the parts of the sqlite3.Connection API the app uses."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.row_factory = None  # rows are always PgRow
+
+    def cursor(self):
+        return PgCursor(self._conn.cursor())
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+    @property
+    def in_transaction(self):
+        return self._conn.info.transaction_status != TransactionStatus.IDLE
+
+    @property
+    def isolation_level(self):
+        return None if self._conn.autocommit else ""
+
+    @isolation_level.setter
+    def isolation_level(self, value):
+        # sqlite3's None means "I issue BEGIN/COMMIT myself"
+        self._conn.autocommit = value is None
+
+
+class PostgresPool(ConnectionPool):
+    """db_pool.ConnectionPool over psycopg; db_path is the connection URL."""
+
+    def __init__(self, dsn, size=8, readonly=False, timeout=30, checkout_timeout=30, health_check_interval=30):
+        super().__init__(dsn, size=size, readonly=readonly, timeout=timeout, checkout_timeout=checkout_timeout,
+                         health_check_interval=health_check_interval)
+        self.errors = (psycopg.Error,)
+
+    def _connect(self):
+        conn = psycopg.connect(self.db_path, connect_timeout=self.timeout, row_factory=_pg_row_factory)
+        if self.readonly:
+            conn.read_only = True
+        return PgConnection(conn)
+
+
+# The schema at SQLite migration PG_SCHEMA_VERSION, in Postgres types.
+# Later migrations append to PG_MIGRATIONS with the same version numbers.
+PG_SCHEMA_VERSION = 10
+PG_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS tests (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        test_code TEXT UNIQUE NOT NULL,
+        name TEXT NOT NULL,
+        description TEXT DEFAULT '',
+        duration_minutes INTEGER DEFAULT 0,
+        created_at TEXT,
+        updated_at TEXT,
+        total_trainees INTEGER DEFAULT 0,
+        question_count INTEGER,
+        stratify_by TEXT,
+        shuffle_options INTEGER DEFAULT 0,
+        seeded_draw INTEGER DEFAULT 0,
+        dashboard_version INTEGER NOT NULL DEFAULT 0
+    )""",
+    """CREATE TABLE IF NOT EXISTS questions (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        test_id BIGINT NOT NULL REFERENCES tests(id) ON DELETE CASCADE,
+        question_text TEXT NOT NULL,
+        option1 TEXT NOT NULL,
+        option2 TEXT NOT NULL,
+        option3 TEXT NOT NULL,
+        option4 TEXT NOT NULL,
+        correct TEXT NOT NULL,
+        is_multiple INTEGER NOT NULL DEFAULT 0,
+        topic TEXT,
+        difficulty TEXT,
+        correct_mask INTEGER NOT NULL DEFAULT 0
+    )""",
+    """CREATE TABLE IF NOT EXISTS trainees (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        emp_id TEXT NOT NULL UNIQUE,
+        name TEXT NOT NULL,
+        created_at TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS results (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        test_id BIGINT NOT NULL REFERENCES tests(id) ON DELETE CASCADE,
+        attempted_at TEXT NOT NULL,
+        score INTEGER NOT NULL,
+        total INTEGER NOT NULL,
+        trainee_id BIGINT,
+        trainee_emp_id TEXT,
+        trainee_name TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS result_answers (
+        result_id BIGINT NOT NULL REFERENCES results(id) ON DELETE CASCADE,
+        question_id BIGINT NOT NULL,
+        selected_mask INTEGER NOT NULL DEFAULT 0,
+        is_correct INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (result_id, question_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS question_stats (
+        question_id BIGINT PRIMARY KEY,
+        test_id BIGINT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        correct INTEGER NOT NULL DEFAULT 0
+    )""",
+    """CREATE TABLE IF NOT EXISTS test_stats (
+        test_id BIGINT PRIMARY KEY,
+        participants INTEGER NOT NULL DEFAULT 0,
+        bucket_100 INTEGER NOT NULL DEFAULT 0,
+        bucket_75plus INTEGER NOT NULL DEFAULT 0,
+        bucket_50to75 INTEGER NOT NULL DEFAULT 0,
+        bucket_below50 INTEGER NOT NULL DEFAULT 0
+    )""",
+    """CREATE TABLE IF NOT EXISTS quiz_sessions (
+        id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        expires_at TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_results_test_attempted ON results (test_id, attempted_at)",
+    "CREATE INDEX IF NOT EXISTS idx_results_test_trainee ON results (test_id, trainee_id, attempted_at)",
+    "CREATE INDEX IF NOT EXISTS idx_questions_test_text ON questions (test_id, question_text)",
+    "CREATE INDEX IF NOT EXISTS idx_question_stats_test ON question_stats (test_id)",
+    "CREATE INDEX IF NOT EXISTS idx_trainees_emp_lower ON trainees (lower(emp_id))",
+    "CREATE INDEX IF NOT EXISTS idx_trainees_created ON trainees (COALESCE(created_at, ''))",
+    "CREATE INDEX IF NOT EXISTS idx_result_answers_question ON result_answers (question_id, selected_mask, is_correct)",
+    "CREATE INDEX IF NOT EXISTS idx_quiz_sessions_expires ON quiz_sessions (expires_at)",
+]
+# (version, description, [statements]) after PG_SCHEMA_VERSION, mirroring init_db.MIGRATIONS
+PG_MIGRATIONS = [
+    (11, "trainee progress rollups", [
+        """CREATE TABLE IF NOT EXISTS trainee_test_stats (
+            trainee_id BIGINT NOT NULL,
+            test_id BIGINT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            best_score INTEGER NOT NULL DEFAULT 0,
+            best_total INTEGER NOT NULL DEFAULT 0,
+            best_pct DOUBLE PRECISION NOT NULL DEFAULT 0,
+            best_at TEXT,
+            latest_score INTEGER NOT NULL DEFAULT 0,
+            latest_total INTEGER NOT NULL DEFAULT 0,
+            latest_at TEXT,
+            score_sum INTEGER NOT NULL DEFAULT 0,
+            total_sum INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (trainee_id, test_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS trainee_stats (
+            trainee_id BIGINT PRIMARY KEY,
+            tests_taken INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            points BIGINT NOT NULL DEFAULT 0,
+            score_sum BIGINT NOT NULL DEFAULT 0,
+            total_sum BIGINT NOT NULL DEFAULT 0,
+            last_attempt_at TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_trainee_test_stats_rank ON trainee_test_stats (test_id, best_pct DESC, best_at)",
+        "CREATE INDEX IF NOT EXISTS idx_trainee_stats_points ON trainee_stats (points DESC, trainee_id)",
+    ]),
+    (12, "attempt policies and ledger", [
+        "ALTER TABLE tests ADD COLUMN IF NOT EXISTS max_attempts INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE tests ADD COLUMN IF NOT EXISTS cooldown_minutes INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE tests ADD COLUMN IF NOT EXISTS score_policy TEXT NOT NULL DEFAULT 'best'",
+        """CREATE TABLE IF NOT EXISTS attempts (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            test_id BIGINT NOT NULL REFERENCES tests(id) ON DELETE CASCADE,
+            trainee_id BIGINT NOT NULL,
+            attempt_no INTEGER NOT NULL,
+            session_key TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            submitted_at TEXT,
+            result_id BIGINT
+        )""",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_attempts_trainee ON attempts (test_id, trainee_id, attempt_no)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_attempts_session ON attempts (session_key)",
+        """INSERT INTO attempts (test_id, trainee_id, attempt_no, session_key, started_at, submitted_at, result_id)
+        SELECT test_id, trainee_id,
+               ROW_NUMBER() OVER (PARTITION BY test_id, trainee_id ORDER BY attempted_at, id),
+               'result-' || id, attempted_at, attempted_at, id
+        FROM results
+        WHERE trainee_id IS NOT NULL
+        ON CONFLICT DO NOTHING""",
+        "ALTER TABLE trainee_test_stats ADD COLUMN IF NOT EXISTS latest_pct DOUBLE PRECISION NOT NULL DEFAULT 0",
+        "UPDATE trainee_test_stats SET latest_pct = latest_score * 100.0 / latest_total WHERE latest_total > 0",
+        "CREATE INDEX IF NOT EXISTS idx_trainee_test_stats_latest ON trainee_test_stats (test_id, latest_pct DESC, latest_at)",
+    ]),
+    (13, "background job queue", [
+        """CREATE TABLE IF NOT EXISTS jobs (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            kind TEXT NOT NULL,
+            test_id BIGINT,
+            lane TEXT,
+            params TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            run_after TEXT NOT NULL,
+            processed BIGINT NOT NULL DEFAULT 0,
+            total BIGINT NOT NULL DEFAULT 0,
+            result TEXT,
+            error TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            heartbeat_at TEXT,
+            finished_at TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, run_after)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_lane ON jobs (lane, status)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_test ON jobs (test_id, id)",
+    ]),
+    (14, "per-test enrolment", [
+        """CREATE TABLE IF NOT EXISTS test_enrolments (
+            test_id BIGINT NOT NULL REFERENCES tests(id) ON DELETE CASCADE,
+            trainee_id BIGINT NOT NULL,
+            enrolled_at TEXT NOT NULL,
+            PRIMARY KEY (test_id, trainee_id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_test_enrolments_enrolled ON test_enrolments (test_id, enrolled_at, trainee_id)",
+        "CREATE INDEX IF NOT EXISTS idx_test_enrolments_trainee ON test_enrolments (trainee_id)",
+    ]),
+    (15, "enrolment counters on test_stats", [
+        "ALTER TABLE test_stats ADD COLUMN IF NOT EXISTS enrolled INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE test_stats ADD COLUMN IF NOT EXISTS enrolled_participants INTEGER NOT NULL DEFAULT 0",
+        """INSERT INTO test_stats (test_id, enrolled, enrolled_participants)
+        SELECT e.test_id, COUNT(*),
+               SUM(CASE WHEN EXISTS (SELECT 1 FROM results r
+                                     WHERE r.test_id = e.test_id AND r.trainee_id = e.trainee_id)
+                        THEN 1 ELSE 0 END)
+        FROM test_enrolments e
+        GROUP BY e.test_id
+        ON CONFLICT (test_id) DO UPDATE SET
+            enrolled = excluded.enrolled,
+            enrolled_participants = excluded.enrolled_participants""",
+    ]),
+]
+PG_MIGRATION_LOCK = 0x71756979  # pg_advisory_lock key shared by every worker
+
+
+class PostgresRepository(Repository):
+    backend = "postgres"
+    integrity_errors = ()
+
+    def __init__(self, dsn, writers=8, readers=8):
+        if psycopg is None:
+            raise RuntimeError("the postgres backend needs psycopg (pip install 'psycopg[binary]')")
+        self.dsn = dsn
+        self.errors = (psycopg.Error,)
+        self.integrity_errors = (psycopg.errors.IntegrityError,)
+        self.writer_pool = PostgresPool(dsn, size=writers)
+        self.reader_pool = PostgresPool(dsn, size=readers, readonly=True)
+
+    def migrate(self, verbose=False):
+        """Create or upgrade the schema; an advisory lock makes concurrent workers take turns."""
+        conn = self.writer_pool.open_connection()
+        try:
+            conn.execute("SELECT pg_advisory_lock(?)", (PG_MIGRATION_LOCK,))
+            try:
+                conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+                row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+                version = row[0] or 0
+                if version < PG_SCHEMA_VERSION:
+                    for statement in PG_SCHEMA:
+                        conn.execute(statement)
+                    version = PG_SCHEMA_VERSION
+                    if verbose:
+                        print(f"Created the PostgreSQL schema at version {version}")
+                for target, description, statements in PG_MIGRATIONS:
+                    if target > version:
+                        for statement in statements:
+                            conn.execute(statement)
+                        version = target
+                        if verbose:
+                            print(f"Applied migration {target}: {description}")
+                conn.execute("DELETE FROM schema_version")
+                conn.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+                conn.commit()
+            finally:
+                conn.rollback()
+                conn.execute("SELECT pg_advisory_unlock(?)", (PG_MIGRATION_LOCK,))
+                conn.commit()
+        finally:
+            conn.close()
+        return version
+
+    def lock_job_queue(self, cur):
+        # the claim's lane check reads other rows, so concurrent claims take turns
+        cur.execute("SELECT pg_advisory_xact_lock(?)", (PG_MIGRATION_LOCK + 1,))
+
+    def insert_questions(self, cur, rows):
+        with cur.copy(f"COPY questions ({', '.join(QUESTION_INSERT_COLUMNS)}) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row(row)
+
+    def insert_answers(self, cur, rows):
+        with cur.copy(f"COPY result_answers ({', '.join(ANSWER_COLUMNS)}) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row(row)
+
+    def upsert_trainees(self, cur, rows):
+        # one statement per batch; a row listed twice would trip ON CONFLICT, so keep the last
+        rows = list({emp_id: (emp_id, name, created_at) for emp_id, name, created_at in rows}.values())
+        if not rows:
+            return
+        cur.execute(f"""
+            INSERT INTO trainees (emp_id, name, created_at) VALUES {", ".join("(?, ?, ?)" for _ in rows)}
+            ON CONFLICT (emp_id) DO UPDATE SET name = excluded.name
+        """, [value for row in rows for value in row])
+
+
+def open_repository(backend="sqlite", db_path="quiz.db", database_url="", writers=2, readers=8,
+                    factory=sqlite3.Connection, cache_size_kib=16 * 1024):
+    """The configured backend. Asking for postgres without psycopg or a URL is an error, not a quiet SQLite."""
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown database backend {backend!r}; use one of {', '.join(BACKENDS)}")
+    if backend == "postgres":
+        if psycopg is None:
+            raise RuntimeError("QUIZ_DB_BACKEND=postgres needs psycopg (pip install 'psycopg[binary]')")
+        if not database_url:
+            raise RuntimeError("QUIZ_DB_BACKEND=postgres needs QUIZ_DATABASE_URL")
+        return PostgresRepository(database_url, writers=writers, readers=readers)
+    return SQLiteRepository(db_path, writers=writers, readers=readers, factory=factory,
+                            cache_size_kib=cache_size_kib)
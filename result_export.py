@@ -0,0 +1,126 @@
+# result_export.py
+"""Streaming exports of a test's attempts.
+
+Rows are read with fetchmany and written out as they arrive, so exporting
+100k+ attempts uses the same memory as exporting ten. Two layouts:
+
+- long: one row per (attempt, question) with the selected options and
+  whether they were correct
+- wide: one row per attempt with one column per question (1 correct,
+  0 wrong, blank if the question was not in that attempt)
+"""
+import io
+import os
+import csv
+import tempfile
+
+from init_db import mask_answer
+
+try:
+    import xlsxwriter
+except ImportError:  # optional; only needed for format=xlsx
+    xlsxwriter = None
+
+EXPORT_LAYOUTS = ("long", "wide")
+EXPORT_FORMATS = ("csv", "xlsx")
+ATTEMPT_COLUMNS = ["Attempt ID", "Employee ID", "Trainee Name", "Attempted At", "Score", "Total", "Percent"]
+
+
+def _attempt_answers(conn, test_id, date_from=None, date_to=None, batch_size=1000):
+    """Yield joined (attempt, answer) rows ordered by attempt, then question."""
+    clauses, params = ["r.test_id = ?"], [test_id]
+    if date_from:
+        clauses.append("r.attempted_at >= ?")
+        params.append(date_from)
+    if date_to:
+        clauses.append("r.attempted_at < ?")
+        params.append(date_to)
+    cur = conn.execute(f"""
+        SELECT r.id, COALESCE(t.emp_id, r.trainee_emp_id) AS emp_id,
+               COALESCE(t.name, r.trainee_name) AS trainee_name,
+               r.attempted_at, r.score, r.total,
+               ra.question_id, q.question_text, ra.selected_mask, ra.is_correct
+        FROM results r
+        LEFT JOIN trainees t ON t.id = r.trainee_id
+        LEFT JOIN result_answers ra ON ra.result_id = r.id
+        LEFT JOIN questions q ON q.id = ra.question_id
+        WHERE {" AND ".join(clauses)}
+        ORDER BY r.attempted_at, r.id, ra.question_id
+    """, params)
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        yield from rows
+
+
+def _attempt_cells(row):
+    pct = round(row["score"] / row["total"] * 100, 1) if row["total"] else ""
+    return [row["id"], row["emp_id"] or "", row["trainee_name"] or "", row["attempted_at"],
+            row["score"], row["total"], pct]
+
+
+def export_rows(conn, test_id, layout="long", date_from=None, date_to=None):
+    """Yield the header and then one list of cells per output row."""
+    if layout == "long":
+        yield ATTEMPT_COLUMNS + ["Question ID", "Question", "Selected", "Correct"]
+        for row in _attempt_answers(conn, test_id, date_from, date_to):
+            answer = [row["question_id"], row["question_text"] or "",
+                      mask_answer(row["selected_mask"] or 0), row["is_correct"]]
+            if row["question_id"] is None:
+                answer = ["", "", "", ""]
+            yield _attempt_cells(row) + answer
+        return
+
+    questions = conn.execute(
+        "SELECT id, question_text FROM questions WHERE test_id = ? ORDER BY id", (test_id,)).fetchall()
+    position = {q["id"]: i for i, q in enumerate(questions)}
+    yield ATTEMPT_COLUMNS + [f"Q{q['id']}: {q['question_text']}" for q in questions]
+    current, cells = None, None
+    for row in _attempt_answers(conn, test_id, date_from, date_to):
+        if row["id"] != current:
+            if cells is not None:
+                yield cells
+            current = row["id"]
+            cells = _attempt_cells(row) + [""] * len(questions)
+        i = position.get(row["question_id"])
+        if i is not None:
+            cells[len(ATTEMPT_COLUMNS) + i] = row["is_correct"]
+    if cells is not None:
+        yield cells
+
+
+def stream_csv(rows, flush_every=500):
+    """Encode rows as CSV text, yielding a chunk every flush_every rows."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for n, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if n % flush_every == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def stream_xlsx(rows, chunk_size=64 * 1024):
+    """Write rows to a constant-memory workbook on disk, then stream the file."""
+    if xlsxwriter is None:
+        raise RuntimeError("XLSX export requires the optional 'xlsxwriter' package")
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+        sheet = workbook.add_worksheet("Attempts")
+        for r, row in enumerate(rows):
+            sheet.write_row(r, 0, row)
+        workbook.close()
+        with open(path, "rb") as fh:
+            while True:
+                chunk = fh.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
@@ -0,0 +1,150 @@
+# roster.py
+"""Bulk trainee roster import/export (CSV or JSON Lines).
+
+Imports stream the file and upsert on emp_id in batched transactions, so a
+bad row only costs that row and memory stays flat for any roster size.
+Exports stream rows out with fetchmany.
+"""
+import io
+import re
+import csv
+import json
+import codecs
+from datetime import datetime
+
+ROSTER_FORMATS = ("csv", "jsonl")
+EMP_ID_RE = re.compile(r"[A-Za-z0-9]+")
+
+
+class RosterReport:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.errors = []  # (line number, message)
+
+    def error_messages(self, limit=5):
+        msgs = [f"Line {line}: {msg}" for line, msg in self.errors[:limit]]
+        if len(self.errors) > limit:
+            msgs.append(f"... and {len(self.errors) - limit} more error(s)")
+        return msgs
+
+
+def roster_format(filename, requested=None):
+    """Pick the roster format from an explicit choice or the file extension."""
+    if requested in ROSTER_FORMATS:
+        return requested
+    if filename and filename.lower().endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return "csv"
+
+
+def _iter_records(byte_stream, fmt):
+    """Yield (line, emp_id, name) or (line, None, error message) per record."""
+    lines = codecs.iterdecode(byte_stream, "utf-8-sig")
+    if fmt == "jsonl":
+        for line_no, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+                yield line_no, str(rec.get("emp_id") or "").strip(), str(rec.get("name") or "").strip()
+            except (ValueError, AttributeError):
+                yield line_no, None, "Invalid JSON object"
+        return
+    reader = csv.reader(lines)
+    for r in reader:
+        if not any(cell.strip() for cell in r):
+            continue
+        if reader.line_num == 1 and r[0].strip().lower().replace(" ", "_") in ("emp_id", "employee_id", "standard_id"):
+            continue
+        if len(r) < 2:
+            yield reader.line_num, None, "Each row must have 2 columns: emp_id,name"
+            continue
+        yield reader.line_num, r[0].strip(), r[1].strip()
+
+
+def upsert_trainee_rows(cur, rows):
+    """Insert (emp_id, name, created_at) rows, renaming trainees that already exist."""
+    cur.executemany("""
+        INSERT INTO trainees (emp_id, name, created_at) VALUES (?, ?, ?)
+        ON CONFLICT(emp_id) DO UPDATE SET name = excluded.name
+    """, rows)
+
+
+def _upsert_batch(conn, batch, report, upsert):
+    cur = conn.cursor()
+    # Employee IDs are case-insensitive (the lower(emp_id) index): a row naming an
+    # existing trainee in another case renames that trainee instead of adding a look-alike
+    keys = list(dict.fromkeys(emp_id.lower() for emp_id, _, _ in batch))
+    placeholders = ",".join("?" for _ in keys)
+    cur.execute(f"SELECT lower(emp_id), emp_id FROM trainees WHERE lower(emp_id) IN ({placeholders})", tuple(keys))
+    stored = {r[0]: r[1] for r in cur.fetchall()}
+    rows = []
+    for emp_id, name, created_at in batch:
+        key = emp_id.lower()
+        if key in stored:
+            report.updated += 1
+        else:
+            stored[key] = emp_id
+            report.inserted += 1
+        rows.append((stored[key], name, created_at))
+    upsert(cur, rows)
+    conn.commit()
+
+
+def import_roster(conn, byte_stream, fmt="csv", batch_size=1000, max_errors=1000, upsert=upsert_trainee_rows):
+    """Upsert trainees from a binary CSV/JSONL stream; invalid rows are reported and skipped.
+
+    upsert(cursor, rows) writes one batch; the storage backend can swap in a
+    faster bulk statement.
+    """
+    report = RosterReport()
+    now = datetime.utcnow().isoformat()
+    batch = []
+    try:
+        for line_no, emp_id, name in _iter_records(byte_stream, fmt):
+            report.rows += 1
+            if emp_id is None:
+                error = name
+            elif not emp_id or not name:
+                error = "Both Employee ID and name are required"
+            elif not EMP_ID_RE.fullmatch(emp_id):
+                error = f"Employee ID '{emp_id}' must be alphanumeric"
+            else:
+                error = None
+            if error:
+                if len(report.errors) < max_errors:
+                    report.errors.append((line_no, error))
+                continue
+            batch.append((emp_id, name, now))
+            if len(batch) >= batch_size:
+                _upsert_batch(conn, batch, report, upsert)
+                batch = []
+        if batch:
+            _upsert_batch(conn, batch, report, upsert)
+    except UnicodeDecodeError as e:
+        conn.rollback()
+        report.errors.append((report.rows + 1, f"File is not valid UTF-8 ({e.reason})"))
+    except Exception:
+        conn.rollback()
+        raise
+    return report
+
+
+def export_roster(conn, fmt="csv", batch_size=1000):
+    """Yield the trainee roster as CSV or JSONL text chunks, one batch at a time."""
+    cur = conn.cursor()
+    cur.execute("SELECT emp_id, name, created_at FROM trainees ORDER BY id")
+    if fmt == "csv":
+        yield "emp_id,name,created_at\r\n"
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        if fmt == "jsonl":
+            yield "".join(json.dumps({"emp_id": r[0], "name": r[1], "created_at": r[2]}) + "\n" for r in rows)
+        else:
+            buf = io.StringIO()
+            csv.writer(buf).writerows(tuple(r) for r in rows)
+            yield buf.getvalue()
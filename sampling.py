@@ -0,0 +1,110 @@
+# sampling.py
+"""Per-test question sampling for quiz_start.
+
+A draw picks positions in a QuestionBank snapshot, so it costs O(k) for k
+questions rather than touching every question in the bank. Tests can set:
+
+- question_count: how many questions a trainee gets (default 5)
+- stratify_by: "topic" or "difficulty"; each group contributes in
+  proportion to its share of the bank
+- shuffle_options: present the four options in a random order per question
+- seeded_draw: derive the draw from (test, trainee) so a trainee always
+  gets the same questions and option order for that test
+
+Shuffled option orders are stored in the quiz session and remap_mask()
+turns a submitted answer back into the bank's original option positions.
+"""
+import random
+
+DEFAULT_QUESTION_COUNT = 5
+STRATIFY_FIELDS = ("topic", "difficulty")
+
+
+class SamplingConfig:
+    __slots__ = ("question_count", "stratify_by", "shuffle_options", "seeded_draw")
+
+    def __init__(self, question_count=DEFAULT_QUESTION_COUNT, stratify_by=None, shuffle_options=False,
+                 seeded_draw=False):
+        self.question_count = question_count
+        self.stratify_by = stratify_by if stratify_by in STRATIFY_FIELDS else None
+        self.shuffle_options = bool(shuffle_options)
+        self.seeded_draw = bool(seeded_draw)
+
+    @classmethod
+    def from_test(cls, test):
+        """Build from a tests row; NULL columns fall back to the defaults."""
+        return cls(
+            question_count=test["question_count"] or DEFAULT_QUESTION_COUNT,
+            stratify_by=test["stratify_by"],
+            shuffle_options=test["shuffle_options"],
+            seeded_draw=test["seeded_draw"],
+        )
+
+
+def draw_rng(config, test_id, trainee_id):
+    if config.seeded_draw:
+        return random.Random(f"quiz-draw:{test_id}:{trainee_id}")
+    return random.Random()
+
+
+def _allocate(sizes, k):
+    """Split k across groups proportionally to sizes (largest remainder), capped by each size."""
+    total = sum(sizes)
+    quotas = [k * s // total for s in sizes]
+    remainders = sorted(range(len(sizes)), key=lambda i: (k * sizes[i]) % total, reverse=True)
+    left = k - sum(quotas)
+    for i in remainders:
+        if left == 0:
+            break
+        if quotas[i] < sizes[i]:
+            quotas[i] += 1
+            left -= 1
+    return quotas
+
+
+def draw_positions(bank, config, rng):
+    """Positions (into bank) of the questions for one attempt, in presentation order."""
+    n = len(bank)
+    k = min(config.question_count, n)
+    if not config.stratify_by:
+        return rng.sample(range(n), k)
+    groups = bank.strata(config.stratify_by)
+    # sort so a seeded draw does not depend on dict insertion order
+    keys = sorted(groups, key=lambda v: (v is None, v or ""))
+    quotas = _allocate([len(groups[v]) for v in keys], k)
+    chosen = []
+    for value, quota in zip(keys, quotas):
+        if quota:
+            chosen.extend(rng.sample(groups[value], quota))
+    rng.shuffle(chosen)
+    return chosen
+
+
+def option_orders(config, count, rng):
+    """One display->original option permutation per question, or None when not shuffling."""
+    if not config.shuffle_options:
+        return None
+    orders = []
+    for _ in range(count):
+        order = [0, 1, 2, 3]
+        rng.shuffle(order)
+        orders.append(order)
+    return orders
+
+
+def present(question, order):
+    """Reorder a bank.question() dict's options for display."""
+    if order is not None:
+        question["options"] = [question["options"][o] for o in order]
+    return question
+
+
+def remap_mask(mask, order):
+    """Translate a mask over displayed option positions into original positions."""
+    if order is None:
+        return mask
+    original = 0
+    for shown, orig in enumerate(order):
+        if mask & (1 << shown):
+            original |= 1 << orig
+    return original
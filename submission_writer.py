@@ -0,0 +1,229 @@
+# submission_writer.py
+"""Single background writer that group-commits quiz submissions.
+
+Request handlers hand over a graded submission and block until the batch
+containing it is committed. One transaction (and one fsync) then covers up
+to batch_size submissions, so a cohort whose timers expire together no
+longer queues up behind SQLite's write lock one commit at a time.
+"""
+import os
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+
+
+class SubmissionError(RuntimeError):
+    """A submission could not be written; wraps the underlying database error."""
+
+
+class _Ticket:
+    __slots__ = ("item", "result", "error", "_done")
+
+    def __init__(self, item):
+        self.item = item
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def wait(self, timeout):
+        if not self._done.wait(timeout):
+            raise SubmissionError(f"submission not acknowledged within {timeout}s")
+        if self.error is not None:
+            raise SubmissionError(str(self.error)) from self.error
+        return self.result
+
+
+class GroupCommitWriter:
+    """Batches write_fn(cursor, item) calls into shared transactions.
+
+    Each item runs inside its own SAVEPOINT so one failing submission does
+    not take the rest of its batch down with it. With enabled=False, or when
+    the queue is full, write() falls back to writing inline on a connection
+    obtained from the caller.
+
+    on_commit(item, result), if given, is called for each item that made it
+    into a committed transaction, in commit order, after the COMMIT. Any
+    exception raised by write_fn fails only its own submission; the caller
+    gets it back as a SubmissionError.
+    """
+
+    _STOP = object()
+
+    def __init__(self, connect, write_fn, batch_size=64, max_wait=0.0, max_queue=5000,
+                 enabled=True, ack_timeout=30, on_commit=None):
+        self.connect = connect
+        self.write_fn = write_fn
+        self.on_commit = on_commit
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.enabled = enabled
+        self.ack_timeout = ack_timeout
+        self._lock = threading.Lock()
+        self._reset()
+        atexit.register(self.close)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._thread = None
+        self.batches = 0
+        self.items = 0
+        self.max_batch = 0
+        self.commit_seconds = 0.0
+        self.max_depth = 0
+        self.queue_full = 0
+        self.sync_writes = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        if os.getpid() != self._pid:
+            self._reset()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="submission-writer", daemon=True)
+            self._thread.start()
+
+    def write(self, item, fallback_connect):
+        """Persist item and return write_fn's result once it is durable.
+
+        fallback_connect is only called on the synchronous path, so callers
+        do not hold a writer connection while waiting for their batch.
+        """
+        if self.enabled:
+            ticket = _Ticket(item)
+            with self._lock:
+                self._ensure_started()
+                try:
+                    self._queue.put_nowait(ticket)
+                except queue.Full:
+                    self.queue_full += 1
+                    ticket = None
+                else:
+                    self.max_depth = max(self.max_depth, self._queue.qsize())
+            if ticket is not None:
+                return ticket.wait(self.ack_timeout)
+        # synchronous path: disabled, or backpressure shed this request
+        with self._lock:
+            self.sync_writes += 1
+        fallback_conn = fallback_connect()
+        try:
+            result = self.write_fn(fallback_conn.cursor(), item)
+            fallback_conn.commit()
+        except Exception as e:
+            self._rollback(fallback_conn)
+            raise SubmissionError(str(e)) from e
+        self._notify(item, result)
+        return result
+
+    def _notify(self, item, result):
+        if self.on_commit is None:
+            return
+        try:
+            self.on_commit(item, result)
+        except Exception:
+            # the submission is already durable; a failed notification must not undo that
+            pass
+
+    def _run(self):
+        conn = self.connect()
+        # explicit BEGIN/SAVEPOINT control; FULL makes each group commit durable
+        conn.isolation_level = None
+        if isinstance(conn, sqlite3.Connection):
+            conn.execute("PRAGMA synchronous=FULL;")
+        try:
+            while True:
+                first = self._queue.get()
+                if first is self._STOP:
+                    return
+                batch = [first]
+                stop = False
+                deadline = time.monotonic() + self.max_wait
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        ticket = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if ticket is self._STOP:
+                        stop = True
+                        break
+                    batch.append(ticket)
+                self._commit_batch(conn, batch)
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _commit_batch(self, conn, batch):
+        started = time.perf_counter()
+        cur = conn.cursor()
+        committed = False
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            for ticket in batch:
+                cur.execute("SAVEPOINT submission")
+                try:
+                    ticket.result = self.write_fn(cur, ticket.item)
+                except Exception as e:
+                    # a driver error or a bug in write_fn fails this submission, not the batch
+                    cur.execute("ROLLBACK TO submission")
+                    ticket.error = e
+                cur.execute("RELEASE submission")
+            cur.execute("COMMIT")
+            committed = True
+        except Exception as e:
+            for ticket in batch:
+                if ticket.error is None:
+                    ticket.error = e
+        finally:
+            # whatever happened, no transaction is left open and no request is left waiting
+            if not committed:
+                self._rollback(conn)
+                for ticket in batch:
+                    if ticket.error is None:
+                        ticket.error = SubmissionError("batch was not committed")
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.max_batch = max(self.max_batch, len(batch))
+                self.commit_seconds += elapsed
+                self.failed += sum(1 for t in batch if t.error is not None)
+            for ticket in batch:
+                if ticket.error is None:
+                    self._notify(ticket.item, ticket.result)
+                ticket._done.set()
+
+    @staticmethod
+    def _rollback(conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            # a broken connection has no transaction left to roll back
+            pass
+
+    def close(self, timeout=5):
+        thread = self._thread
+        if thread is not None and thread.is_alive() and os.getpid() == self._pid:
+            self._queue.put(self._STOP)
+            thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "queue_depth": self._queue.qsize(),
+                "queue_depth_max": self.max_depth,
+                "queue_capacity": self.max_queue,
+                "queue_full": self.queue_full,
+                "sync_writes": self.sync_writes,
+                "batches": self.batches,
+                "items": self.items,
+                "batch_size_avg": round(self.items / self.batches, 2) if self.batches else 0,
+                "batch_size_max": self.max_batch,
+                "commit_seconds_total": round(self.commit_seconds, 6),
+                "failed": self.failed,
+            }
@@ -0,0 +1,165 @@
+# tests/conftest.py
+"""Shared fixtures: the app imported against a throwaway database, and helpers to seed it.
+
+app.py reads its configuration from the environment when it is imported,
+so the environment is set here, before any test module imports it. Job
+workers are off; tests run queued jobs themselves with quiz.run_jobs().
+"""
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TMP_DIR = tempfile.mkdtemp(prefix="quiz-tests-")
+os.environ.update({
+    "QUIZ_DB_BACKEND": "sqlite",
+    "QUIZ_DB_PATH": os.path.join(TMP_DIR, "quiz.db"),
+    "QUIZ_JOB_SPOOL": os.path.join(TMP_DIR, "job_spool"),
+    "QUIZ_JOB_WORKERS": "0",
+    "DB_POOL_WRITERS": "4",  # the fixtures hold one while requests take their own
+    "QUIZ_SESSION_STORE": "sqlite",
+    "QUIZ_SESSION_SWEEP_SECONDS": "0",
+    "TRAINER_PASSWORD": "trainer-test",
+    "FLASK_SECRET": "test-secret",
+})
+# the tracked database is the schema before versioned migrations (user_version 0)
+BASELINE_DB = os.path.join(ROOT, "quiz.db")
+
+import app as quiz_app  # noqa: E402
+from init_db import answer_mask  # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    quiz_app.submission_writer.close()
+    shutil.rmtree(TMP_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def app():
+    """The app module on an emptied database, with cold caches."""
+    conn = quiz_app.db_writer_pool.acquire()
+    try:
+        tables = [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+        for table in tables:
+            conn.execute(f"DELETE FROM {table}")
+        conn.commit()
+    finally:
+        quiz_app.db_writer_pool.release(conn)
+    for cache in (quiz_app.question_banks, quiz_app.dashboard_cache, quiz_app.item_analysis):
+        cache.clear()
+    quiz_app.quiz_sessions._entries.clear()
+    return quiz_app
+
+
+@pytest.fixture
+def conn(app):
+    """A pooled writer connection, returned to the pool after the test."""
+    c = app.db_writer_pool.acquire()
+    yield c
+    app.db_writer_pool.release(c)
+
+
+@pytest.fixture
+def client(app):
+    return app.app.test_client()
+
+
+@pytest.fixture
+def trainer(app):
+    """A test client logged in as the trainer."""
+    c = app.app.test_client()
+    with c.session_transaction() as s:
+        s["trainer_authenticated"] = True
+    return c
+
+
+class QuizHelper:
+    """Seeds tests, questions and trainees, and drives the trainee quiz routes."""
+
+    def __init__(self, app, conn):
+        self.app = app
+        self.repo = app.repo
+        self.conn = conn
+
+    def test(self, code="ABC123", keys=("1", "2", "3", "4", "1;2"), duration=10, **settings):
+        """Create a test with one question per answer key; settings are repo.update_test columns."""
+        test_id = self.repo.create_test(self.conn, code, f"Test {code}", "", duration)
+        if settings:
+            self.repo.update_test(self.conn, test_id, settings)
+        self.questions(test_id, keys)
+        return test_id
+
+    def questions(self, test_id, keys, topics=None):
+        rows = [(test_id, f"Question {i} of {test_id}", "A", "B", "C", "D", key, 1 if ";" in key else 0,
+                 topics[i] if topics else None, None, answer_mask(key)) for i, key in enumerate(keys)]
+        self.repo.insert_questions(self.conn.cursor(), rows)
+        self.conn.commit()
+        self.app.question_banks.invalidate(test_id)
+
+    def trainee(self, emp_id, name=None):
+        return self.repo.add_trainee(self.conn, emp_id, name or f"Trainee {emp_id}")
+
+    def count(self, table, where="1 = 1", params=()):
+        return self.conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {where}", params).fetchone()[0]
+
+    # ---------------- Trainee routes
+    def start(self, client, code, emp_id):
+        """Log in at the landing page and start (or resume) the quiz; returns the quiz page response."""
+        client.post(f"/exam/{code}", data={"emp_id": emp_id})
+        return client.get(f"/quiz/start/{code}")
+
+    def session(self, client):
+        """The server-side quiz session behind the client's cookie, or None."""
+        with client.session_transaction() as s:
+            sid = s.get("quiz_sid")
+        return self.app.quiz_sessions.get(sid)
+
+    def answers(self, sq, correct=True):
+        """Form data answering every question of the session, right or (with correct=False) wrong.
+
+        Answers are given in displayed option positions, as the browser sends them.
+        """
+        form = {}
+        orders = sq.get("option_orders") or [None] * len(sq["question_ids"])
+        for qid, order in zip(sq["question_ids"], orders):
+            key = self.conn.execute("SELECT correct_mask FROM questions WHERE id = ?", (qid,)).fetchone()[0]
+            mask = key if correct else (~key & 0b1111)
+            original = [o for o in range(4) if mask >> o & 1]
+            shown = [order.index(o) if order else o for o in original]
+            form[f"q_{qid}"] = [str(p + 1) for p in shown]
+        return form
+
+    def submit(self, client, code, form):
+        return client.post(f"/quiz/submit/{code}", data=form)
+
+    def take(self, client, code, emp_id, correct=True):
+        """Start and submit a quiz; returns the submit response."""
+        self.start(client, code, emp_id)
+        return self.submit(client, code, self.answers(self.session(client), correct))
+
+    # ---------------- Background jobs
+    def run_jobs(self):
+        """Run every runnable queued job to completion in this thread; returns how many ran."""
+        runner = self.app.job_runner
+        conn = self.app.db_writer_pool.open_connection()
+        ran = 0
+        try:
+            while True:
+                job = runner._claim(conn, "pytest")
+                if job is None:
+                    return ran
+                runner._execute(conn, job)
+                ran += 1
+        finally:
+            conn.close()
+
+
+@pytest.fixture
+def quiz(app, conn):
+    return QuizHelper(app, conn)
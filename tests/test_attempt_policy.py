@@ -0,0 +1,63 @@
+# tests/test_attempt_policy.py
+from datetime import datetime, timedelta
+
+from attempt_policy import AttemptPolicy
+
+
+def test_refusal_by_attempt_count_and_cooldown():
+    now = datetime(2025, 1, 1, 12, 0)
+    last = {"attempt_no": 2, "started_at": (now - timedelta(minutes=30)).isoformat(),
+            "submitted_at": (now - timedelta(minutes=20)).isoformat()}
+    assert AttemptPolicy().refusal(None, now) is None
+    assert AttemptPolicy().refusal(last, now) is None
+    assert "2 attempts" in AttemptPolicy(max_attempts=2).refusal(last, now)
+    assert AttemptPolicy(max_attempts=3).refusal(last, now) is None
+    assert AttemptPolicy(cooldown_minutes=30).refusal(last, now) == "You can retake this test in 11 minutes."
+    assert AttemptPolicy(cooldown_minutes=15).refusal(last, now) is None
+    # an attempt that was never submitted cools down from its start
+    assert AttemptPolicy(cooldown_minutes=45).refusal(dict(last, submitted_at=None), now) is not None
+
+
+def test_describe():
+    assert AttemptPolicy().describe() == ""
+    assert AttemptPolicy(max_attempts=1).describe() == "1 attempt allowed"
+    assert AttemptPolicy(max_attempts=3, cooldown_minutes=10, score_policy="latest").describe() == \
+        "3 attempts allowed, 10 min between attempts, your latest score counts"
+
+
+def test_max_attempts_is_enforced_at_quiz_start(quiz, client, conn):
+    quiz.test("POL001", max_attempts=1)
+    quiz.trainee("E1")
+    quiz.take(client, "POL001", "E1")
+    resp = quiz.start(client, "POL001", "E1")
+    assert resp.status_code == 302
+    assert quiz.count("attempts") == 1 and quiz.count("results") == 1
+
+
+def test_cooldown_is_enforced_at_quiz_start(quiz, client):
+    quiz.test("POL002", cooldown_minutes=60)
+    quiz.trainee("E1")
+    quiz.take(client, "POL002", "E1")
+    assert quiz.start(client, "POL002", "E1").status_code == 302
+    assert quiz.count("attempts") == 1
+
+
+def test_each_submission_claims_its_ledger_row(quiz, client, conn):
+    test_id = quiz.test("POL003", max_attempts=3)
+    trainee_id = quiz.trainee("E1")
+    quiz.take(client, "POL003", "E1")
+    quiz.take(client, "POL003", "E1")
+    rows = conn.execute("SELECT a.attempt_no, a.submitted_at IS NOT NULL, a.result_id = r.id "
+                        "FROM attempts a JOIN results r ON r.id = a.result_id "
+                        "WHERE a.test_id = ? AND a.trainee_id = ? ORDER BY a.attempt_no",
+                        (test_id, trainee_id)).fetchall()
+    assert [tuple(r) for r in rows] == [(1, 1, 1), (2, 1, 1)]
+
+
+def test_a_started_but_unsubmitted_quiz_counts_as_an_attempt(quiz, client, app):
+    quiz.test("POL004", max_attempts=1)
+    quiz.trainee("E1")
+    quiz.start(client, "POL004", "E1")
+    # the session is lost (new browser); starting again is a second attempt
+    fresh = app.app.test_client()
+    assert quiz.start(fresh, "POL004", "E1").status_code == 302
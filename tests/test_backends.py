@@ -0,0 +1,305 @@
+# tests/test_backends.py
+"""The shared Repository SQL on each backend.
+
+- sqlite: the real thing.
+- fake-postgres: PostgresRepository over PgConnection over a stand-in for
+  a psycopg connection that runs on SQLite. It takes the translated
+  statements the way psycopg does (%s placeholders, %% for a literal %) and
+  checks every placeholder gets exactly one parameter, so the qmark
+  translation is exercised without a server.
+- postgres: a real server, when psycopg is installed and
+  QUIZ_TEST_DATABASE_URL points at a database the tests may wipe.
+"""
+import os
+import re
+import sqlite3
+
+import pytest
+
+import repository
+from enrolment import enrol_trainees, iter_pasted_ids
+from init_db import answer_mask
+from repository import DuplicateError, PgConnection, PgRow, PostgresRepository, SQLiteRepository, _pg_sql
+
+PG_URL = os.environ.get("QUIZ_TEST_DATABASE_URL", "")
+
+
+# ---------------- Translation
+def test_placeholders_outside_literals_identifiers_and_comments():
+    sql = """SELECT ?, 'it''s ?', "we?rd" -- really?
+             FROM t /* why? */ WHERE a = ?"""
+    assert _pg_sql(sql, True) == """SELECT %s, 'it''s ?', "we?rd" -- really?
+             FROM t /* why? */ WHERE a = %s"""
+
+
+def test_every_percent_is_doubled_when_parameters_are_bound():
+    assert _pg_sql("SELECT '100%' /* 5% */, x % 2 FROM t WHERE a LIKE ? ESCAPE '\\'", True) == \
+        "SELECT '100%%' /* 5%% */, x %% 2 FROM t WHERE a LIKE %s ESCAPE '\\'"
+    assert _pg_sql("SELECT '100%' FROM t", False) == "SELECT '100%' FROM t"
+    assert _pg_sql("  begin immediate", True) == "BEGIN"
+
+
+def test_unterminated_tokens_do_not_swallow_the_statement():
+    assert _pg_sql("SELECT ? /* open", True) == "SELECT %s /* open"
+    assert _pg_sql("SELECT ?, 'open", True) == "SELECT %s, 'open"
+
+
+# ---------------- A psycopg stand-in over SQLite
+_PSYCOPG_MARKERS = re.compile(r"%.")
+
+
+class FakeTransactionStatus:
+    IDLE = 0
+    INTRANS = 2
+
+
+class FakeInfo:
+    def __init__(self, db):
+        self._db = db
+
+    @property
+    def transaction_status(self):
+        return FakeTransactionStatus.INTRANS if self._db.in_transaction else FakeTransactionStatus.IDLE
+
+
+class FakeCopy:
+    def __init__(self, cursor, statement):
+        table, columns = re.fullmatch(r"COPY (\w+) \(([^)]*)\) FROM STDIN", statement).groups()
+        self._cursor = cursor
+        self._insert = f"INSERT INTO {table} ({columns}) VALUES ({', '.join('?' for _ in columns.split(','))})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def write_row(self, row):
+        self._cursor.execute(self._insert, tuple(row))
+
+
+class FakePgCursor:
+    def __init__(self, db):
+        self._cur = db.cursor()
+
+    @staticmethod
+    def _qmark(query, params):
+        """psycopg's reading of a statement: %s is a parameter, %% a literal %, any other % an error."""
+        markers = _PSYCOPG_MARKERS.findall(query)
+        assert all(m in ("%s", "%%") for m in markers), f"stray % in {query!r}"
+        assert markers.count("%s") == len(params), f"{len(params)} parameters for {query!r}"
+        return _PSYCOPG_MARKERS.sub(lambda m: "?" if m.group() == "%s" else "%", query)
+
+    def execute(self, query, params=None):
+        if params is None:
+            self._cur.execute(query)
+        else:
+            self._cur.execute(self._qmark(query, params), params)
+        return self
+
+    def executemany(self, query, params_seq):
+        params_seq = list(params_seq)
+        if params_seq:
+            self._cur.executemany(self._qmark(query, params_seq[0]), params_seq)
+
+    def copy(self, statement):
+        return FakeCopy(self._cur, statement)
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    def _row(self, values):
+        return PgRow(values, {d[0]: i for i, d in enumerate(self._cur.description)})
+
+    def fetchone(self):
+        row = self._cur.fetchone()
+        return None if row is None else self._row(row)
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cur.fetchall()]
+
+    def fetchmany(self, size=1):
+        return [self._row(r) for r in self._cur.fetchmany(size)]
+
+    def close(self):
+        self._cur.close()
+
+
+class FakePgDriverConnection:
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.create_function("pg_advisory_xact_lock", 1, lambda key: None)
+        self.info = FakeInfo(self._db)
+
+    def cursor(self):
+        return FakePgCursor(self._db)
+
+    def commit(self):
+        self._db.commit()
+
+    def rollback(self):
+        self._db.rollback()
+
+    def close(self):
+        self._db.close()
+
+    @property
+    def autocommit(self):
+        return self._db.isolation_level is None
+
+    @autocommit.setter
+    def autocommit(self, value):
+        self._db.isolation_level = None if value else ""
+
+
+@pytest.fixture(params=[
+    "sqlite",
+    "fake-postgres",
+    pytest.param("postgres", marks=pytest.mark.skipif(
+        repository.psycopg is None or not PG_URL, reason="needs psycopg and QUIZ_TEST_DATABASE_URL")),
+])
+def backend(request, tmp_path, monkeypatch):
+    """(repository, writer connection) on an empty, migrated database."""
+    if request.param == "postgres":
+        repo = PostgresRepository(PG_URL, writers=1, readers=1)
+        repo.migrate()
+        conn = repo.writer_pool.open_connection()
+        tables = [r[0] for r in conn.execute(
+            "SELECT table_name FROM information_schema.tables "
+            "WHERE table_schema = current_schema() AND table_name <> 'schema_version'").fetchall()]
+        conn.execute(f"TRUNCATE {', '.join(tables)} RESTART IDENTITY CASCADE")
+        conn.commit()
+    else:
+        path = str(tmp_path / "backend.db")
+        sqlite_repo = SQLiteRepository(path, writers=1, readers=1)
+        sqlite_repo.migrate()
+        if request.param == "sqlite":
+            repo, conn = sqlite_repo, sqlite_repo.writer_pool.open_connection()
+        else:
+            # the SQLite schema, reached through the Postgres code path
+            monkeypatch.setattr(repository, "TransactionStatus", FakeTransactionStatus, raising=False)
+            repo = PostgresRepository.__new__(PostgresRepository)
+            repo.errors = (sqlite3.Error,)
+            repo.integrity_errors = (sqlite3.IntegrityError,)
+            conn = PgConnection(FakePgDriverConnection(path))
+    yield repo, conn
+    conn.rollback()
+    conn.close()
+
+
+def seed(repo, conn, code="BK0001", keys=("1", "2", "1;2")):
+    test_id = repo.create_test(conn, code, "Backend test", "", 10)
+    repo.insert_questions(conn.cursor(), [
+        (test_id, f"Question {i}", "A", "B", "C", "D", key, 1 if ";" in key else 0, None, None, answer_mask(key))
+        for i, key in enumerate(keys)])
+    conn.commit()
+    return test_id, [q["id"] for q in repo.list_questions(conn, test_id)]
+
+
+def submit(repo, conn, test_id, question_ids, trainee, score, attempted_at, session_key=None):
+    cur = conn.cursor()
+    keys = {q["id"]: answer_mask(q["correct"]) for q in repo.list_questions(conn, test_id)}
+    # the first `score` questions right, the rest answered with option 4, which no key uses
+    sub = {"test_id": test_id, "attempted_at": attempted_at, "score": score, "total": len(question_ids),
+           "trainee_id": trainee["id"], "trainee_emp_id": trainee["emp_id"], "trainee_name": trainee["name"],
+           "answers": [(qid, keys[qid] if i < score else 0b1000, 1 if i < score else 0)
+                       for i, qid in enumerate(question_ids)],
+           "question_results": [(qid, i < score) for i, qid in enumerate(question_ids)],
+           "session_key": session_key}
+    result_id = repo.record_submission(cur, sub)
+    conn.commit()
+    return result_id
+
+
+# ---------------- Shared SQL
+def test_tests_and_questions(backend):
+    repo, conn = backend
+    test_id, question_ids = seed(repo, conn)
+    with pytest.raises(DuplicateError):
+        repo.create_test(conn, "BK0001", "Again", "", 10)
+    assert repo.get_test_by_code(conn, "BK0001")["id"] == test_id
+    version = repo.dashboard_version(conn, test_id)
+    repo.update_test(conn, test_id, {"name": "100% renamed", "max_attempts": 2})
+    assert repo.get_test(conn, test_id)["name"] == "100% renamed"
+    assert [q["correct"] for q in repo.list_questions(conn, test_id)] == ["1", "2", "1;2"]
+    assert repo.delete_questions(conn, question_ids[:1]) == ([test_id], 1)
+    assert repo.dashboard_version(conn, test_id) == version + 2
+
+
+def test_trainees_roster_and_paging(backend):
+    repo, conn = backend
+    repo.add_trainee(conn, "AB_1", "Under Score")
+    with pytest.raises(DuplicateError):
+        repo.add_trainee(conn, "AB_1", "Again")
+    assert repo.find_trainee(conn, "ab_1")["name"] == "Under Score"
+    repo.upsert_trainees(conn.cursor(), [("AB_1", "Renamed", "2025-01-02"), ("ABX1", "Other", "2025-01-01"),
+                                         ("CD1", "Third", "2025-01-01")])
+    conn.commit()
+    assert repo.find_trainee(conn, "AB_1")["name"] == "Renamed"
+    # the escaped _ matches only a literal underscore
+    assert [r["emp_id"] for r in repo.trainees_page(conn, None, "%ab\\_%", 10)] == ["AB_1"]
+    first = repo.trainees_page(conn, None, None, 2)
+    rest = repo.trainees_page(conn, (first[-1]["created_at"] or "", first[-1]["id"]), None, 10)
+    assert len(first) + len(rest) == 3
+
+
+def test_submissions_stats_and_rollups(backend):
+    repo, conn = backend
+    test_id, question_ids = seed(repo, conn)
+    one = repo.get_trainee(conn, repo.add_trainee(conn, "E1", "One"))
+    two = repo.get_trainee(conn, repo.add_trainee(conn, "E2", "Two"))
+    repo.reserve_attempt(conn, test_id, one["id"], 1, "key-1", "2025-01-01T09:00:00")
+    with pytest.raises(DuplicateError):
+        repo.reserve_attempt(conn, test_id, one["id"], 1, "key-x", "2025-01-01T09:00:00")
+    assert submit(repo, conn, test_id, question_ids, one, 3, "2025-01-01T10:00:00", "key-1") is not None
+    assert submit(repo, conn, test_id, question_ids, one, 3, "2025-01-01T10:00:01", "key-1") is None
+    submit(repo, conn, test_id, question_ids, two, 1, "2025-01-01T11:00:00")
+
+    stats = repo.test_stats(conn, test_id)
+    assert (stats["participants"], stats["bucket_100"], stats["bucket_below50"]) == (2, 1, 1)
+    assert [(q["attempts"], q["correct"]) for q in repo.question_stats(conn, test_id)] == [(2, 2), (2, 1), (2, 1)]
+    assert repo.last_attempt(conn, test_id, one["id"])["submitted_at"] == "2025-01-01T10:00:00"
+    page = repo.attempts_page(conn, test_id, None, "%e1%", 10)
+    assert [(r["emp_id"], r["score"]) for r in page] == [("E1", 3)]
+    newest = repo.attempts_page(conn, test_id, None, None, 1)
+    assert [r["emp_id"] for r in repo.attempts_page(conn, test_id, (newest[0]["attempted_at"], newest[0]["id"]),
+                                                     None, 10)] == ["E1"]
+    assert [r["emp_id"] for r in repo.leaderboard(conn, 10)] == ["E1", "E2"]
+    totals, rank, tests = repo.trainee_progress(conn, two["id"])
+    assert (totals["points"], rank, len(tests)) == (1, 2, 1)
+
+    repo.delete_test(conn, test_id)
+    assert repo.get_test(conn, test_id) is None
+    assert repo.leaderboard(conn, 10) == []
+
+
+def test_enrolment(backend):
+    repo, conn = backend
+    test_id, question_ids = seed(repo, conn)
+    one = repo.get_trainee(conn, repo.add_trainee(conn, "E1", "One"))
+    repo.add_trainee(conn, "E2", "Two")
+    assert repo.enrolment_check(conn, test_id, one["id"]) == (False, False)
+    report = enrol_trainees(conn, test_id, iter_pasted_ids("e1 E2 NOPE"), enrol=repo.enrol_trainees)
+    assert (report.enrolled, len(report.unknown)) == (2, 1)
+    assert repo.enrolment_check(conn, test_id, one["id"]) == (True, True)
+    submit(repo, conn, test_id, question_ids, one, 2, "2025-01-01T10:00:00")
+    assert tuple(repo.enrolment_counts(conn, test_id)) == (2, 1)
+    missing = repo.enrolment_page(conn, test_id, None, None, 10, missing_only=True)
+    assert [r["emp_id"] for r in missing] == ["E2"]
+    assert repo.unenrol_trainees(conn, test_id, [one["id"]]) == 1
+    assert tuple(repo.enrolment_counts(conn, test_id)) == (1, 0)
+    assert repo.unenrol_trainees(conn, test_id) == 1
+    assert tuple(repo.enrolment_counts(conn, test_id)) == (0, 0)
+
+
+def test_job_queue_lock(backend):
+    repo, conn = backend
+    cur = conn.cursor()
+    repo.lock_job_queue(cur)
+    conn.commit()
@@ -0,0 +1,122 @@
+# tests/test_dashboard.py
+"""Cached dashboard payloads: ETag revalidation, gzip and the live event stream."""
+import json
+
+import pytest
+
+from dashboard_cache import DashboardCache
+from live_updates import RESYNC, LivePublisher, sse_frame
+
+
+@pytest.fixture
+def test_id(quiz):
+    test_id = quiz.test("DASH01", max_attempts=10)
+    quiz.trainee("E1")
+    return test_id
+
+
+def test_payload_comes_from_the_aggregates(app, quiz, client, conn, test_id):
+    quiz.take(client, "DASH01", "E1")
+    quiz.take(client, "DASH01", "E1", correct=False)
+    data = json.loads(app.dashboard_payload(conn, test_id).body)
+    assert data["participation"]["values"][0] == 2
+    assert data["result_dist"]["values"] == [1, 0, 0, 1]
+    assert data["question_analysis"]["correct"] == [1] * 5
+    assert data["question_analysis"]["wrong"] == [1] * 5
+
+
+def test_payload_is_cached_per_version(app, conn, test_id):
+    first = app.dashboard_payload(conn, test_id)
+    assert app.dashboard_payload(conn, test_id) is first
+    app.repo.update_test(conn, test_id, {"total_trainees": 30})
+    second = app.dashboard_payload(conn, test_id)
+    assert second is not first and second.version == first.version + 1
+    assert json.loads(second.body)["participation"]["values"] == [0, 30]
+
+
+def test_matching_etag_gets_a_304(quiz, client, trainer, test_id):
+    url = f"/trainer/results/{test_id}/dashboard.json"
+    resp = trainer.get(url)
+    etag = resp.headers["ETag"]
+    assert resp.status_code == 200 and etag.startswith('W/"')
+    again = trainer.get(url, headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.data == b""
+    # a submission bumps the version, so the old tag no longer matches
+    quiz.take(client, "DASH01", "E1")
+    fresh = trainer.get(url, headers={"If-None-Match": etag})
+    assert fresh.status_code == 200 and fresh.headers["ETag"] != etag
+    assert trainer.get("/trainer/results/999999/dashboard.json").status_code == 404
+
+
+def test_test_deleted_after_its_version_was_read(app, trainer, conn, test_id, monkeypatch):
+    version = app.repo.dashboard_version(conn, test_id)
+    app.repo.delete_test(conn, test_id)
+    assert app.dashboard_payload(conn, test_id, version) is None
+    assert app.dashboard_payload(conn, test_id) is None
+    # the routes see the version, then lose the test before the payload is built
+    monkeypatch.setattr(app.repo, "dashboard_version", lambda conn, test_id: version)
+    resp = trainer.get(f"/trainer/results/{test_id}")
+    assert resp.status_code == 302 and resp.headers["Location"].endswith("/trainer")
+    assert trainer.get(f"/trainer/results/{test_id}/dashboard.json").status_code == 404
+
+
+def test_large_payloads_are_gzipped(quiz, trainer):
+    test_id = quiz.test("DASH02", keys=["1"] * 40)
+    resp = trainer.get(f"/trainer/results/{test_id}/dashboard.json", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert resp.data[:2] == b"\x1f\x8b"
+
+
+def test_items_json_revalidates(trainer, test_id):
+    url = f"/trainer/results/{test_id}/items.json"
+    resp = trainer.get(url)
+    assert resp.status_code == 200 and resp.get_json()["test_id"] == test_id
+    assert trainer.get(url, headers={"If-None-Match": resp.headers["ETag"]}).status_code == 304
+
+
+def test_cache_evicts_stale_versions():
+    cache = DashboardCache(max_entries=2)
+    cache.put(1, 1, {"a": 1})
+    assert cache.get(1, 1) is not None and cache.get(1, 2) is None
+    cache.put(2, 1, {})
+    cache.put(3, 1, {})
+    assert cache.get(1, 1) is None
+    assert cache.stats()["entries"] == 2
+
+
+# ---------------- Live updates
+def test_publisher_fans_out_and_resyncs_slow_streams():
+    live = LivePublisher(max_pending=2)
+    fast, slow, other = live.subscribe(1), live.subscribe(1), live.subscribe(2)
+    assert live.publish(1, "attempt", {"n": 1}) == 2
+    assert fast.get(0) == sse_frame("attempt", {"n": 1})
+    live.publish(1, "attempt", {"n": 2})
+    live.publish(1, "attempt", {"n": 3})
+    assert slow.get(0) == RESYNC
+    assert slow.get(0) is None
+    assert other.get(0) is None
+    live.unsubscribe(fast)
+    live.unsubscribe(slow)
+    assert live.stats()["subscribers"] == 1
+
+
+def test_live_stream_starts_with_a_sync_frame(app, trainer, conn, test_id):
+    resp = trainer.get(f"/trainer/results/{test_id}/live")
+    assert resp.mimetype == "text/event-stream"
+    first = next(resp.response)
+    assert first.startswith(b"retry: 5000\n\nevent: sync\n")
+    assert f'"version":{app.repo.dashboard_version(conn, test_id)}'.encode() in first
+    resp.close()
+    assert trainer.get("/trainer/results/999999/live").status_code == 404
+
+
+def test_submission_is_published_to_viewers(app, quiz, client, test_id):
+    sub = app.live_updates.subscribe(test_id)
+    try:
+        quiz.take(client, "DASH01", "E1")
+        frame = sub.get(5)
+    finally:
+        app.live_updates.unsubscribe(sub)
+    assert frame.startswith("event: attempt\n")
+    data = json.loads(frame.split("data: ", 1)[1])
+    assert data["attempt"]["score"] == 5 and data["version"] == app.repo.dashboard_version(quiz.conn, test_id)
@@ -0,0 +1,65 @@
+# tests/test_db_pool.py
+import sqlite3
+
+import pytest
+
+from db_pool import ConnectionPool, PoolTimeout
+from init_db import migrate_locked
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "pool.db")
+    migrate_locked(path)
+    return path
+
+
+def test_connections_are_reused(db_path):
+    pool = ConnectionPool(db_path, size=2)
+    first = pool.acquire()
+    pool.release(first)
+    assert pool.acquire() is first
+    stats = pool.stats()
+    assert stats["open"] == 1 and stats["checkouts"] == 2 and stats["in_use"] == 1
+
+
+def test_connections_are_configured_once(db_path):
+    conn = ConnectionPool(db_path).acquire()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert isinstance(conn.execute("SELECT 1").fetchone(), sqlite3.Row)
+
+
+def test_exhausted_pool_times_out(db_path):
+    pool = ConnectionPool(db_path, size=1, checkout_timeout=0.05)
+    pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_release_rolls_back_an_open_transaction(db_path):
+    pool = ConnectionPool(db_path, size=1)
+    conn = pool.acquire()
+    conn.execute("INSERT INTO trainees (emp_id, name) VALUES ('E1', 'One')")
+    pool.release(conn)
+    conn = pool.acquire()
+    assert conn.execute("SELECT COUNT(*) FROM trainees").fetchone()[0] == 0
+
+
+def test_readonly_pool_cannot_write(db_path):
+    conn = ConnectionPool(db_path, readonly=True).acquire()
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("INSERT INTO trainees (emp_id, name) VALUES ('E1', 'One')")
+
+
+def test_broken_idle_connection_is_replaced(db_path):
+    pool = ConnectionPool(db_path, size=1, health_check_interval=0)
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.close()
+    replacement = pool.acquire()
+    assert replacement is not conn
+    assert replacement.execute("SELECT 1").fetchone()[0] == 1
+    assert pool.stats()["replaced"] == 1
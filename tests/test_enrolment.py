@@ -0,0 +1,111 @@
+# tests/test_enrolment.py
+import io
+import json
+
+import pytest
+
+from enrolment import enrol_trainees, iter_file_ids, iter_pasted_ids
+
+
+@pytest.fixture
+def test_id(quiz):
+    test_id = quiz.test("ENR001")
+    for emp_id in ("E1", "E2", "E3"):
+        quiz.trainee(emp_id)
+    return test_id
+
+
+def enrolled(conn, test_id):
+    return sorted(r[0] for r in conn.execute(
+        "SELECT t.emp_id FROM test_enrolments e JOIN trainees t ON t.id = e.trainee_id WHERE e.test_id = ?",
+        (test_id,)))
+
+
+def test_pasted_ids():
+    assert list(iter_pasted_ids("E1, E2;E3\n\n  E4 ")) == [(1, "E1"), (1, "E2"), (1, "E3"), (3, "E4")]
+
+
+def test_file_ids():
+    assert list(iter_file_ids(io.BytesIO(b"emp_id,name\nE1,One\n,blank\nE2\n"))) == [(2, "E1"), (4, "E2")]
+    jsonl = b'{"emp_id": "E1"}\n\nnot json\n'
+    assert list(iter_file_ids(io.BytesIO(jsonl), "jsonl")) == [(1, "E1"), (3, None)]
+
+
+def test_enrol_reports_each_outcome(conn, test_id):
+    report = enrol_trainees(conn, test_id, iter_pasted_ids("e1 E2 E2 NOPE E-4"), batch_size=2)
+    assert (report.rows, report.enrolled, report.already) == (5, 2, 1)
+    assert report.unknown == [(1, "NOPE")] and (report.unknown_count, report.rejected) == (1, 2)
+    assert report.errors == [(1, "Employee ID 'E-4' must be alphanumeric")]
+    assert enrolled(conn, test_id) == ["E1", "E2"]
+    again = enrol_trainees(conn, test_id, iter_pasted_ids("E1 E3"))
+    assert (again.enrolled, again.already) == (1, 1)
+    assert "Not registered: NOPE" in report.error_messages()
+
+
+def test_unknown_ids_are_counted_but_only_the_first_kept(conn, test_id):
+    report = enrol_trainees(conn, test_id, iter_pasted_ids(" ".join(f"X{i}" for i in range(50)) + " E1"),
+                            batch_size=7, max_errors=3)
+    assert report.unknown == [(1, "X0"), (1, "X1"), (1, "X2")]
+    assert (report.unknown_count, report.rejected, report.enrolled) == (50, 50, 1)
+    assert report.error_messages()[-1] == "Not registered: X0, X1, X2 and 47 more"
+
+
+def test_open_test_admits_every_trainee(quiz, client, test_id):
+    assert quiz.start(client, "ENR001", "E3").status_code == 200
+
+
+def test_enrolment_restricts_entry(quiz, client, conn, test_id):
+    enrol_trainees(conn, test_id, iter_pasted_ids("E1"))
+    resp = client.post("/exam/ENR001", data={"emp_id": "E2"})
+    assert b"not enrolled" in resp.data
+    assert quiz.start(client, "ENR001", "E1").status_code == 200
+
+
+def test_dashboard_counts_enrolled_participants(app, quiz, client, conn, test_id):
+    app.repo.update_test(conn, test_id, {"total_trainees": 50})
+    enrol_trainees(conn, test_id, iter_pasted_ids("E1 E2"))
+    quiz.take(client, "ENR001", "E1")
+    data = json.loads(app.dashboard_payload(conn, test_id).body)
+    assert data["participation"]["values"] == [1, 1]
+    assert (data["test"]["enrolled"], data["test"]["total_trainees"]) == (2, 2)
+
+
+def test_enrolment_counters_follow_every_change(app, quiz, client, conn, test_id):
+    enrol_trainees(conn, test_id, iter_pasted_ids("E1 E2 E3"))
+    enrol_trainees(conn, test_id, iter_pasted_ids("E1"))
+    quiz.take(client, "ENR001", "E1")
+    quiz.take(client, "ENR001", "E2")
+    assert app.repo.enrolment_counts(conn, test_id) == (3, 2)
+    one, two = (app.repo.find_trainee(conn, emp_id)["id"] for emp_id in ("E1", "E2"))
+    assert app.repo.unenrol_trainees(conn, test_id, [one]) == 1
+    assert app.repo.enrolment_counts(conn, test_id) == (2, 1)
+    app.repo.delete_trainee(conn, two)
+    assert app.repo.enrolment_counts(conn, test_id) == (1, 0)
+    app.rebuild_stats(conn, test_id)
+    assert app.repo.enrolment_counts(conn, test_id) == (1, 0)
+    app.repo.unenrol_trainees(conn, test_id)
+    assert app.repo.enrolment_counts(conn, test_id) == (0, 0)
+
+
+def test_enrolment_pages(quiz, client, trainer, conn, test_id):
+    resp = trainer.post(f"/trainer/enrolments/{test_id}/add", data={"emp_ids": "E1\nE2\nE3"})
+    assert resp.status_code == 302
+    quiz.take(client, "ENR001", "E2")
+    missing = trainer.get(f"/trainer/enrolments/{test_id}.json?show=missing").get_json()["items"]
+    assert sorted(i["emp_id"] for i in missing) == ["E1", "E3"]
+    everyone = trainer.get(f"/trainer/enrolments/{test_id}.json?limit=2").get_json()
+    assert len(everyone["items"]) == 2 and everyone["next_cursor"]
+    assert trainer.get(f"/trainer/enrolments/{test_id}").status_code == 200
+
+
+def test_unenrol_all_reopens_the_test(quiz, client, trainer, conn, test_id):
+    enrol_trainees(conn, test_id, iter_pasted_ids("E1"))
+    trainer.post(f"/trainer/enrolments/{test_id}/remove", data={"all": "1"})
+    assert enrolled(conn, test_id) == []
+    assert quiz.start(client, "ENR001", "E3").status_code == 200
+
+
+def test_roster_file_upload(trainer, conn, test_id):
+    upload = (io.BytesIO(b"emp_id,name\nE1,One\nE3,Three\n"), "cohort.csv")
+    trainer.post(f"/trainer/enrolments/{test_id}/add", data={"roster_file": upload})
+    assert enrolled(conn, test_id) == ["E1", "E3"]
@@ -0,0 +1,73 @@
+# tests/test_export.py
+import csv
+import io
+
+import pytest
+
+from result_export import export_rows, stream_csv, xlsxwriter
+
+
+@pytest.fixture
+def test_id(quiz, client):
+    test_id = quiz.test("EXP001", keys=("1", "2", "1;2"), max_attempts=5)
+    quiz.trainee("E1")
+    quiz.trainee("E2")
+    quiz.take(client, "EXP001", "E1")
+    quiz.take(client, "EXP001", "E2", correct=False)
+    return test_id
+
+
+def rows(resp):
+    return list(csv.reader(io.StringIO(resp.get_data(as_text=True))))
+
+
+def test_long_layout_has_a_row_per_answer(trainer, test_id):
+    resp = trainer.get(f"/trainer/results/{test_id}/export?format=csv&layout=long")
+    assert resp.mimetype == "text/csv"
+    assert "EXP001_attempts_long.csv" in resp.headers["Content-Disposition"]
+    body = rows(resp)
+    assert body[0][-4:] == ["Question ID", "Question", "Selected", "Correct"]
+    assert len(body) == 1 + 2 * 3
+    assert {r[1] for r in body[1:]} == {"E1", "E2"}
+    assert [r[-1] for r in body[1:4]] == ["1", "1", "1"]
+    assert "1;2" in [r[-2] for r in body[1:4]]
+
+
+def test_wide_layout_has_a_row_per_attempt(trainer, test_id):
+    body = rows(trainer.get(f"/trainer/results/{test_id}/export?layout=wide"))
+    assert len(body) == 3 and len(body[0]) == 7 + 3
+    assert [r[4] for r in body[1:]] == ["3", "0"]
+    assert body[2][7:] == ["0", "0", "0"]
+
+
+def test_date_filter(trainer, test_id):
+    assert len(rows(trainer.get(f"/trainer/results/{test_id}/export?from=2000-01-01"))) == 7
+    assert len(rows(trainer.get(f"/trainer/results/{test_id}/export?to=2000-01-01"))) == 1
+    assert trainer.get(f"/trainer/results/{test_id}/export?from=yesterday").status_code == 400
+
+
+def test_bad_arguments(trainer, test_id):
+    assert trainer.get(f"/trainer/results/{test_id}/export?format=pdf").status_code == 400
+    assert trainer.get(f"/trainer/results/{test_id}/export?layout=tall").status_code == 400
+    assert trainer.get("/trainer/results/999999/export").status_code == 404
+
+
+def test_attempt_without_answers_still_exports(app, conn):
+    test_id = app.repo.create_test(conn, "EXP002", "Empty", "", 10)
+    conn.execute("INSERT INTO results (test_id, trainee_emp_id, trainee_name, score, total, attempted_at) "
+                 "VALUES (?, 'X', 'X', 0, 0, '2025-01-01T00:00:00')", (test_id,))
+    conn.commit()
+    out = list(export_rows(conn, test_id, "long"))
+    assert out[1][-4:] == ["", "", "", ""] and out[1][6] == ""
+
+
+def test_csv_streams_in_chunks():
+    chunks = list(stream_csv(([i] for i in range(5)), flush_every=2))
+    assert chunks == ["0\r\n1\r\n", "2\r\n3\r\n", "4\r\n"]
+
+
+@pytest.mark.skipif(xlsxwriter is None, reason="xlsxwriter not installed")
+def test_xlsx_export(trainer, test_id):
+    resp = trainer.get(f"/trainer/results/{test_id}/export?format=xlsx")
+    assert resp.status_code == 200
+    assert resp.data[:2] == b"PK"
@@ -0,0 +1,74 @@
+# tests/test_item_analysis.py
+from item_analysis import ItemAnalysisCache, ItemStats, build_item_stats
+
+
+def stats_for(attempts, keys=(1, 2)):
+    questions = [{"id": i + 1, "question_text": f"Q{i + 1}", "correct_mask": k} for i, k in enumerate(keys)]
+    stats = ItemStats(1, 1, questions, "python")
+    for answers in attempts:
+        rows = [(i + 1, mask, 1 if mask == keys[i] else 0) for i, mask in enumerate(answers)]
+        stats.add_attempt(sum(ok for _, _, ok in rows), len(keys), rows)
+    return stats
+
+
+def test_difficulty_options_and_blanks():
+    data = stats_for([(1, 2), (1, 0), (4, 2), (1, 1)]).to_dict()
+    first, second = data["items"]
+    assert first["p"] == 0.75 and first["options"] == [0.75, 0.0, 0.25, 0.0]
+    assert second["p"] == 0.5 and second["blank"] == 0.25
+    assert first["key"] == [0] and second["key"] == [1]
+    assert data["attempts"] == 4 and data["mean_score"] == 1.25
+
+
+def test_flags_wait_for_enough_attempts():
+    few = stats_for([(2, 2)] * 3).to_dict()
+    assert few["items"][0]["flags"] == []
+    many = stats_for([(2, 2)] * 10).to_dict()
+    assert "too hard" in many["items"][0]["flags"]
+    assert "distractor outdraws key" in many["items"][0]["flags"]
+    assert "too easy" in many["items"][1]["flags"]
+
+
+def test_reliability_needs_enough_attempts():
+    consistent = [(1, 2)] * 2 + [(2, 1)] * 2 + [(1, 1), (2, 2)]
+    assert stats_for(consistent).to_dict()["alpha"] is None
+    alpha = stats_for(consistent * 2).to_dict()["alpha"]
+    assert alpha is not None and alpha <= 1.0
+
+
+def test_reliability_is_capped_at_one():
+    # two questions drawn from a bank of three per attempt: the sampled estimate overshoots
+    questions = [{"id": i, "question_text": f"Q{i}", "correct_mask": 1} for i in (1, 2, 3)]
+    stats = ItemStats(1, 1, questions, "python")
+    for right, shown in [((1, 2), (1, 2)), ((), (2, 3)), ((3, 1), (3, 1)), ((), (1, 3))] * 3:
+        rows = [(qid, 1 if qid in right else 2, 1 if qid in right else 0) for qid in shown]
+        stats.add_attempt(len(right), 2, rows)
+    assert stats.to_dict()["alpha"] == 1.0
+
+
+def test_discrimination_sign():
+    # trainees who get Q1 right also get Q2 right
+    agree = stats_for([(1, 2)] * 5 + [(2, 1)] * 5 + [(1, 1)] * 2).to_dict()
+    assert agree["items"][0]["discrimination"] > 0
+    # and here they get it wrong
+    disagree = stats_for([(1, 1)] * 5 + [(2, 2)] * 5).to_dict()
+    assert disagree["items"][0]["discrimination"] < 0
+
+
+def test_incremental_cache_matches_a_full_build(app, quiz, client, conn):
+    test_id = quiz.test("ITEM01", max_attempts=10)
+    quiz.trainee("E1")
+    quiz.take(client, "ITEM01", "E1")
+    cache = app.item_analysis
+    before = cache.get(conn, test_id, app.repo.dashboard_version(conn, test_id))
+    assert before["attempts"] == 1
+    quiz.take(client, "ITEM01", "E1", correct=False)
+    quiz.take(client, "ITEM01", "E1")
+    increments = cache.stats()["increments"]
+    after = cache.get(conn, test_id, app.repo.dashboard_version(conn, test_id))
+    assert increments == 2 and after["attempts"] == 3
+    assert after == build_item_stats(conn, test_id).to_dict()
+
+
+def test_missing_test(app, conn):
+    assert ItemAnalysisCache().get(conn, 999999, 0) is None
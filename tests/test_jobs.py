@@ -0,0 +1,156 @@
+# tests/test_jobs.py
+"""The jobs table runner, driven synchronously with _claim/_execute/_sweep."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from jobs import JobFailed, JobRunner
+
+
+@pytest.fixture
+def runner(app):
+    runner = JobRunner(app.db_writer_pool.open_connection, workers=0, max_attempts=2, stale_seconds=60)
+    runner.cleaned = []
+    runner.register("ok", lambda ctx: {"echo": ctx.params["value"]}, cleanup=runner.cleaned.append)
+    runner.register("fail", _fail_permanently)
+    runner.register("flaky", _raise)
+    runner.register("stoppable", _stop_when_asked, cancellable=True)
+    return runner
+
+
+def _fail_permanently(ctx):
+    raise JobFailed("bad input", {"line": 3})
+
+
+def _raise(ctx):
+    raise RuntimeError("transient")
+
+
+def _stop_when_asked(ctx):
+    ctx.check_cancelled()
+    return "finished"
+
+
+def run_next(runner, conn):
+    job = runner._claim(conn, "pytest")
+    if job is not None:
+        runner._execute(conn, job)
+    return job
+
+
+def test_success_records_result_and_cleans_up(runner, conn):
+    job_id = runner.submit(conn, "ok", {"value": 7})
+    run_next(runner, conn)
+    job = runner.get(conn, job_id)
+    assert (job["status"], job["result"], job["percent"]) == ("done", {"echo": 7}, 100.0)
+    assert runner.cleaned == [{"value": 7}]
+    with pytest.raises(ValueError):
+        runner.submit(conn, "nope", {})
+
+
+def test_permanent_failure_is_not_retried(runner, conn):
+    job_id = runner.submit(conn, "fail", {})
+    run_next(runner, conn)
+    job = runner.get(conn, job_id)
+    assert (job["status"], job["error"], job["result"], job["attempts"]) == ("failed", "bad input", {"line": 3}, 1)
+
+
+def test_transient_failure_backs_off_then_fails(runner, conn):
+    job_id = runner.submit(conn, "flaky", {})
+    run_next(runner, conn)
+    job = runner.get(conn, job_id)
+    assert job["status"] == "queued" and job["run_after"] > datetime.utcnow().isoformat()
+    assert run_next(runner, conn) is None  # still backing off
+    conn.execute("UPDATE jobs SET run_after = ? WHERE id = ?", (datetime.utcnow().isoformat(), job_id))
+    conn.commit()
+    run_next(runner, conn)
+    assert runner.get(conn, job_id)["status"] == "failed"
+    ok, _ = runner.retry(conn, job_id)
+    assert ok and runner.get(conn, job_id)["attempts"] == 0
+
+
+def test_cancel(runner, conn):
+    queued = runner.submit(conn, "ok", {"value": 1})
+    assert runner.cancel(conn, queued) == (True, "Job cancelled.")
+    assert runner.get(conn, queued)["status"] == "cancelled" and runner.cleaned == [{"value": 1}]
+    assert runner.cancel(conn, queued)[0] is False
+    assert runner.cancel(conn, 999999) == (False, "Job not found.")
+
+    stoppable = runner.submit(conn, "stoppable", {})
+    job = runner._claim(conn, "pytest")
+    assert runner.cancel(conn, stoppable)[0] is True
+    runner._execute(conn, job)
+    assert runner.get(conn, stoppable)["status"] == "cancelled"
+
+
+def test_a_lane_runs_one_job_at_a_time(runner, conn):
+    first = runner.submit(conn, "ok", {"value": 1}, lane="test:1")
+    runner.submit(conn, "ok", {"value": 2}, lane="test:1")
+    other = runner.submit(conn, "ok", {"value": 3}, lane="test:2")
+    claimed = runner._claim(conn, "pytest")
+    assert claimed["id"] == first
+    # the second job of test:1 waits for the first; test:2 is free
+    assert runner._claim(conn, "pytest")["id"] == other
+    assert runner._claim(conn, "pytest") is None
+
+
+def test_stale_job_is_requeued(runner, conn):
+    job_id = runner.submit(conn, "ok", {"value": 1})
+    runner._claim(conn, "dead-worker")
+    conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?",
+                 ((datetime.utcnow() - timedelta(minutes=5)).isoformat(), job_id))
+    conn.commit()
+    runner._sweep(conn)
+    job = runner.get(conn, job_id)
+    assert (job["status"], job["error"], job["worker"]) == ("queued", "worker stopped responding", None)
+    # a second stale run uses up max_attempts=2
+    runner._claim(conn, "dead-worker")
+    conn.execute("UPDATE jobs SET heartbeat_at = '2000-01-01' WHERE id = ?", (job_id,))
+    conn.commit()
+    runner._sweep(conn)
+    assert runner.get(conn, job_id)["status"] == "failed"
+    assert runner.cleaned == [{"value": 1}]
+
+
+def test_sweep_spares_a_long_job_of_this_process(app, runner, conn):
+    def sweep_midway(ctx):
+        # a long import: progress stays in memory, so heartbeat_at goes stale
+        other = app.db_writer_pool.open_connection()
+        try:
+            other.execute("UPDATE jobs SET heartbeat_at = '2000-01-01' WHERE id = ?", (ctx.job_id,))
+            other.commit()
+            runner._sweep(other)
+            runner._heartbeat(other, [ctx.job_id])
+            return tuple(other.execute("SELECT status, heartbeat_at > '2000-01-01' FROM jobs WHERE id = ?",
+                                       (ctx.job_id,)).fetchone())
+        finally:
+            other.close()
+
+    runner.register("long", sweep_midway)
+    job_id = runner.submit(conn, "long", {})
+    run_next(runner, conn)
+    job = runner.get(conn, job_id)
+    assert (job["status"], job["result"]) == ("done", ["running", 1])
+    assert runner._running == set()
+
+
+def test_sweep_forgets_old_finished_jobs(runner, conn):
+    job_id = runner.submit(conn, "ok", {"value": 1})
+    run_next(runner, conn)
+    conn.execute("UPDATE jobs SET finished_at = '2000-01-01' WHERE id = ?", (job_id,))
+    conn.commit()
+    runner._sweep(conn)
+    assert runner.get(conn, job_id) is None
+
+
+def test_delete_test_runs_as_a_job(quiz, client, trainer, conn):
+    test_id = quiz.test("JOBDEL")
+    quiz.trainee("E1")
+    quiz.take(client, "JOBDEL", "E1")
+    assert trainer.post(f"/trainer/delete/{test_id}").status_code == 302
+    assert quiz.run_jobs() == 1
+    items = trainer.get(f"/trainer/jobs.json?test_id={test_id}").get_json()["items"]
+    assert [(j["kind"], j["status"], j["result"]) for j in items] == [("delete_test", "done", {"attempts_deleted": 1})]
+    assert quiz.count("tests") == 0 and quiz.count("results") == 0
+    assert trainer.get(f"/trainer/jobs/{items[0]['id']}").get_json()["status"] == "done"
+    assert trainer.get("/trainer/jobs/999999").status_code == 404
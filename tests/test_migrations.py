@@ -0,0 +1,149 @@
+# tests/test_migrations.py
+import json
+import shutil
+import sqlite3
+
+import pytest
+
+import init_db
+from conftest import BASELINE_DB
+from init_db import MIGRATIONS, answer_mask, mask_answer, migrate_locked, migrate_schema, schema_version
+from repository import SQLiteRepository
+
+LATEST = MIGRATIONS[-1][0]
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    """A copy of the tracked pre-migration database (user_version 0, results.raw_answers JSON)."""
+    path = tmp_path / "baseline.db"
+    shutil.copy(BASELINE_DB, path)
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+def columns(conn, table):
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def test_answer_mask_round_trip():
+    assert answer_mask("1;3") == 0b101
+    assert answer_mask("4, 2") == 0b1010
+    assert answer_mask("") == 0
+    assert answer_mask("5;x") == 0
+    assert mask_answer(0b1001) == "1;4"
+    assert all(answer_mask(mask_answer(m)) == m for m in range(16))
+
+
+def test_migrations_are_numbered_in_order():
+    assert [m[0] for m in MIGRATIONS] == list(range(1, LATEST + 1))
+
+
+def test_baseline_database_migrates_to_latest(baseline):
+    assert schema_version(baseline) == 0
+    raw = dict(baseline.execute("SELECT id, raw_answers FROM results"))
+    keys = dict(baseline.execute("SELECT id, correct FROM questions"))
+
+    assert migrate_schema(baseline) == LATEST
+    assert schema_version(baseline) == LATEST
+    assert "raw_answers" not in columns(baseline, "results")
+    for column in ("question_count", "dashboard_version", "max_attempts", "score_policy"):
+        assert column in columns(baseline, "tests")
+
+    answers = baseline.execute(
+        "SELECT result_id, question_id, selected_mask, is_correct FROM result_answers").fetchall()
+    assert len(answers) == sum(len(json.loads(r)) for r in raw.values())
+    for result_id, qid, mask, ok in answers:
+        assert mask == answer_mask(json.loads(raw[result_id])[str(qid)])
+        assert ok == (1 if mask and mask == answer_mask(keys[qid]) else 0)
+    # each result's stored score agrees with its converted answers
+    for result_id, score in baseline.execute("SELECT id, score FROM results"):
+        assert score == sum(ok for rid, _, _, ok in answers if rid == result_id)
+    # pre-ledger attempts were numbered into the attempts ledger
+    assert baseline.execute("SELECT attempt_no FROM attempts ORDER BY attempt_no").fetchall() == [(1,), (2,)]
+    assert baseline.execute("PRAGMA foreign_key_check").fetchall() == []
+
+
+def test_migration_counts_existing_results_into_the_dashboard(baseline):
+    migrate_schema(baseline)
+    # the baseline's two attempts at test 1 scored 5/5 and 3/5
+    assert baseline.execute("""
+        SELECT test_id, participants, bucket_100, bucket_75plus, bucket_50to75, bucket_below50 FROM test_stats
+    """).fetchall() == [(1, 2, 1, 0, 1, 0)]
+    expected = baseline.execute("""
+        SELECT question_id, COUNT(*), SUM(is_correct) FROM result_answers
+        WHERE selected_mask <> 0 GROUP BY question_id
+    """).fetchall()
+    assert expected and baseline.execute(
+        "SELECT question_id, attempts, correct FROM question_stats ORDER BY question_id").fetchall() == expected
+
+
+def test_migration_rolls_up_existing_attempts(baseline):
+    migrate_schema(baseline)
+    progress = baseline.execute("""
+        SELECT trainee_id, test_id, attempts, best_score, best_pct, latest_score, latest_pct, score_sum, total_sum
+        FROM trainee_test_stats
+    """).fetchall()
+    assert progress == [(1, 1, 2, 5, 100.0, 3, 60.0, 8, 10)]
+    assert baseline.execute("SELECT trainee_id, tests_taken, attempts, points FROM trainee_stats").fetchall() == [
+        (1, 1, 2, 5)]
+
+
+def test_unreadable_raw_answers_are_skipped(baseline, capsys):
+    for raw in ("not json", "[1, 2]", '{"x": "1", "2": "2"}', '{"3": {"pick": 1}}'):
+        baseline.execute("INSERT INTO results (test_id, attempted_at, score, total, raw_answers) "
+                         "VALUES (1, '2025-10-29T00:00:00', 0, 15, ?)", (raw,))
+    baseline.commit()
+    migrate_schema(baseline)
+    assert "Skipped 4 unreadable raw_answers entries" in capsys.readouterr().err
+    mixed = baseline.execute("SELECT id FROM results ORDER BY id").fetchall()[-2][0]
+    assert baseline.execute("SELECT question_id, selected_mask FROM result_answers WHERE result_id = ?",
+                            (mixed,)).fetchall() == [(2, 0b10)]
+
+
+def test_older_sqlite_is_refused_at_startup(baseline, tmp_path, monkeypatch):
+    monkeypatch.setattr(init_db.sqlite3, "sqlite_version_info", (3, 34, 1))
+    with pytest.raises(RuntimeError, match="3.35"):
+        migrate_schema(baseline)
+    assert schema_version(baseline) == 0
+    with pytest.raises(RuntimeError, match="3.35"):
+        SQLiteRepository(str(tmp_path / "old.db"), writers=1, readers=1)
+
+
+def test_enrolment_counters_are_backfilled(baseline):
+    for target, _, apply in MIGRATIONS:
+        if target < 15:
+            apply(baseline)
+    baseline.execute("PRAGMA user_version = 14")
+    # trainee 1 attempted test 1 in the baseline; trainee 99 never did
+    baseline.executemany("INSERT INTO test_enrolments (test_id, trainee_id, enrolled_at) VALUES (1, ?, '2025-11-01')",
+                         [(1,), (99,)])
+    baseline.commit()
+    migrate_schema(baseline)
+    assert baseline.execute("SELECT enrolled, enrolled_participants FROM test_stats WHERE test_id = 1").fetchone() == (
+        2, 1)
+
+
+def test_migrating_again_is_a_no_op(baseline):
+    migrate_schema(baseline)
+    before = baseline.execute("SELECT COUNT(*) FROM result_answers").fetchone()[0]
+    assert migrate_schema(baseline) == LATEST
+    assert baseline.execute("SELECT COUNT(*) FROM result_answers").fetchone()[0] == before
+
+
+def test_empty_database_gets_the_full_schema(tmp_path):
+    path = str(tmp_path / "fresh.db")
+    assert migrate_locked(path) == LATEST
+    conn = sqlite3.connect(path)
+    tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.close()
+    assert {"tests", "questions", "trainees", "results", "result_answers", "question_stats", "test_stats",
+            "quiz_sessions", "trainee_test_stats", "trainee_stats", "attempts", "jobs",
+            "test_enrolments"} <= tables
+
+
+def test_migrate_locked_skips_an_up_to_date_database(tmp_path):
+    path = str(tmp_path / "fresh.db")
+    migrate_locked(path)
+    assert migrate_locked(path) == LATEST
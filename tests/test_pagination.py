@@ -0,0 +1,64 @@
+# tests/test_pagination.py
+import pytest
+
+
+@pytest.fixture
+def trainees(quiz, conn):
+    ids = [quiz.trainee(f"E{i:03d}", f"Name {i}") for i in range(12)]
+    # identical timestamps force the id tiebreak of the (created_at, id) key
+    conn.execute("UPDATE trainees SET created_at = '2025-01-01T00:00:00' WHERE id IN (?, ?, ?)", ids[3:6])
+    conn.commit()
+    return ids
+
+
+def walk(client, url):
+    """Follow next_cursor to the end; returns every item and the page count."""
+    items, pages, cursor = [], 0, None
+    while True:
+        resp = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        body = resp.get_json()
+        items += body["items"]
+        pages += 1
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return items, pages
+
+
+def test_cursor_round_trip(app):
+    token = app.encode_cursor("2025-01-01T00:00:00", 42)
+    assert app.decode_cursor(token) == ["2025-01-01T00:00:00", 42]
+    assert app.decode_cursor("") is None
+    assert app.decode_cursor("!!not-base64!!") is None
+    assert app.decode_cursor(app.encode_cursor(1, 2, 3)) is None
+
+
+def test_like_pattern_escapes_wildcards(app):
+    assert app.like_pattern("A_b%") == "%a\\_b\\%%"
+
+
+def test_trainee_pages_cover_everyone_once(trainer, trainees):
+    items, pages = walk(trainer, "/trainer/trainees.json?limit=5")
+    assert pages == 3
+    assert sorted(i["id"] for i in items) == sorted(trainees)
+
+
+def test_trainee_search(trainer, trainees):
+    items, _ = walk(trainer, "/trainer/trainees.json?limit=2&q=name 1")
+    assert sorted(i["emp_id"] for i in items) == ["E001", "E010", "E011"]
+
+
+def test_bad_cursor_starts_from_the_top(trainer, trainees):
+    first = trainer.get("/trainer/trainees.json?limit=3").get_json()
+    again = trainer.get("/trainer/trainees.json?limit=3&cursor=garbage").get_json()
+    assert first == again
+
+
+def test_attempt_pages(quiz, client, trainer):
+    test_id = quiz.test("PAGE01", max_attempts=10)
+    quiz.trainee("E1")
+    for _ in range(5):
+        quiz.take(client, "PAGE01", "E1")
+    items, pages = walk(trainer, f"/trainer/results/{test_id}/attempts.json?limit=2")
+    assert pages == 3 and len({i["id"] for i in items}) == 5
+    assert [i["attempted_at"] for i in items] == sorted((i["attempted_at"] for i in items), reverse=True)
+    assert trainer.get(f"/trainer/results/{test_id}").status_code == 200
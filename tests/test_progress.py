@@ -0,0 +1,75 @@
+# tests/test_progress.py
+"""Trainee progress rollups (trainee_test_stats / trainee_stats) and the leaderboards built on them."""
+import pytest
+
+
+def rollups(conn):
+    return ([tuple(r) for r in conn.execute("SELECT * FROM trainee_test_stats ORDER BY trainee_id, test_id")],
+            [tuple(r) for r in conn.execute("SELECT * FROM trainee_stats ORDER BY trainee_id")])
+
+
+@pytest.fixture
+def seeded(quiz, client):
+    """Two tests; E1 improves on T1, E2 gets worse, E3 only takes T2."""
+    one = quiz.test("PROG01", keys=("1", "2"), max_attempts=5)
+    two = quiz.test("PROG02", keys=("1", "2", "3"), max_attempts=5)
+    for emp_id in ("E1", "E2", "E3"):
+        quiz.trainee(emp_id)
+    quiz.take(client, "PROG01", "E1", correct=False)
+    quiz.take(client, "PROG01", "E1")
+    quiz.take(client, "PROG01", "E2")
+    quiz.take(client, "PROG01", "E2", correct=False)
+    quiz.take(client, "PROG02", "E1")
+    quiz.take(client, "PROG02", "E3")
+    return one, two
+
+
+def test_rollups_follow_each_attempt(app, conn, seeded):
+    one, _ = seeded
+    e1 = app.repo.find_trainee(conn, "E1")["id"]
+    row = conn.execute("SELECT * FROM trainee_test_stats WHERE trainee_id = ? AND test_id = ?", (e1, one)).fetchone()
+    assert (row["attempts"], row["best_score"], row["latest_score"], row["score_sum"]) == (2, 2, 2, 2)
+    totals = conn.execute("SELECT * FROM trainee_stats WHERE trainee_id = ?", (e1,)).fetchone()
+    assert (totals["tests_taken"], totals["attempts"], totals["points"]) == (2, 3, 5)
+
+
+def test_incremental_rollups_match_a_rebuild(app, conn, seeded):
+    incremental = rollups(conn)
+    app.rebuild_stats(conn)
+    assert rollups(conn) == incremental
+
+
+def test_overall_leaderboard(trainer, seeded):
+    items = trainer.get("/trainer/leaderboard.json").get_json()["items"]
+    assert [(i["emp_id"], i["points"], i["rank"]) for i in items] == [("E1", 5, 1), ("E3", 3, 2), ("E2", 2, 3)]
+    assert trainer.get("/trainer/leaderboard").status_code == 200
+
+
+def test_score_policy_changes_the_ranking(app, trainer, conn, seeded):
+    one, _ = seeded
+    body = trainer.get(f"/trainer/leaderboard.json?test_id={one}").get_json()
+    assert body["score_policy"] == "best"
+    assert [i["emp_id"] for i in body["items"]] == ["E1", "E2"]
+    app.repo.update_test(conn, one, {"score_policy": "latest"})
+    body = trainer.get(f"/trainer/leaderboard.json?test_id={one}").get_json()
+    assert [(i["emp_id"], i["latest_pct"]) for i in body["items"]] == [("E1", 100.0), ("E2", 0.0)]
+    # E2's points now count their latest (zero) score on PROG01
+    overall = {i["emp_id"]: i["points"] for i in trainer.get("/trainer/leaderboard.json").get_json()["items"]}
+    assert overall == {"E1": 5, "E2": 0, "E3": 3}
+    assert trainer.get("/trainer/leaderboard.json?test_id=999999").status_code == 404
+
+
+def test_profile_page(app, trainer, conn, seeded):
+    e1 = app.repo.find_trainee(conn, "E1")["id"]
+    totals, rank, tests = app.repo.trainee_progress(conn, e1)
+    assert rank == 1 and len(tests) == 2
+    resp = trainer.get(f"/trainer/trainees/{e1}")
+    assert resp.status_code == 200 and b"PROG01" in resp.data
+    assert trainer.get("/trainer/trainees/999999").status_code == 302
+
+
+def test_deleting_a_trainee_drops_their_rollups(app, conn, seeded):
+    e1 = app.repo.find_trainee(conn, "E1")["id"]
+    app.repo.delete_trainee(conn, e1)
+    assert conn.execute("SELECT COUNT(*) FROM trainee_stats WHERE trainee_id = ?", (e1,)).fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM results WHERE trainee_emp_id = 'E1'").fetchone()[0] == 3
@@ -0,0 +1,37 @@
+# tests/test_query_plans.py
+import shutil
+import sqlite3
+
+import pytest
+
+from conftest import BASELINE_DB
+from init_db import HOT_QUERIES, check_query_plans, migrate_schema
+
+
+@pytest.fixture
+def migrated(tmp_path):
+    path = tmp_path / "plans.db"
+    shutil.copy(BASELINE_DB, path)
+    conn = sqlite3.connect(path)
+    migrate_schema(conn)
+    yield conn
+    conn.close()
+
+
+def test_every_hot_query_uses_its_index(migrated):
+    plans = check_query_plans(migrated)
+    assert set(plans) == {name for name, *_ in HOT_QUERIES}
+
+
+def test_app_database_passes_the_plan_checks(app):
+    conn = sqlite3.connect(app.DB_PATH)
+    try:
+        check_query_plans(conn)
+    finally:
+        conn.close()
+
+
+def test_a_dropped_index_is_reported(migrated):
+    migrated.execute("DROP INDEX idx_trainee_stats_points")
+    with pytest.raises(AssertionError, match="overall leaderboard"):
+        check_query_plans(migrated)
@@ -0,0 +1,108 @@
+# tests/test_question_import.py
+import io
+
+import pytest
+
+from question_import import import_questions, parse_question_row
+
+HEADER = "Question,Option1,Option2,Option3,Option4,Correct,Topic,Difficulty\n"
+
+
+def csv_bytes(*rows, header=True):
+    return io.BytesIO(((HEADER if header else "") + "".join(r + "\n" for r in rows)).encode())
+
+
+@pytest.fixture
+def test_id(quiz):
+    return quiz.test("IMP001", keys=())
+
+
+def stored(conn, test_id):
+    return conn.execute("SELECT question_text, correct, correct_mask, is_multiple, topic, difficulty "
+                        "FROM questions WHERE test_id = ? ORDER BY id", (test_id,)).fetchall()
+
+
+def test_parse_question_row_normalizes_the_key():
+    text, opts, correct, multiple, topic, difficulty = parse_question_row(
+        ["Q", "a", "b", "c", "d", "3, 1", "Maths", " Hard "])
+    assert (text, opts, correct, multiple, topic, difficulty) == ("Q", ["a", "b", "c", "d"], "1;3", 1, "Maths", "hard")
+    with pytest.raises(ValueError, match="Invalid correct index"):
+        parse_question_row(["Q", "a", "b", "c", "d", "5"])
+    with pytest.raises(ValueError, match="6 columns"):
+        parse_question_row(["Q", "a", "b"])
+
+
+def test_valid_file_is_imported_in_chunks(conn, test_id):
+    rows = [f"Q{i},a,b,c,d,{i % 4 + 1},T{i % 2},easy" for i in range(25)]
+    chunks = []
+    report = import_questions(conn, test_id, csv_bytes(*rows), chunk_size=10, on_chunk=lambda: chunks.append(1))
+    assert report.ok and report.rows == 25 and report.inserted == 25
+    assert len(chunks) == 3
+    questions = stored(conn, test_id)
+    assert len(questions) == 25
+    assert questions[1]["correct"] == "2" and questions[1]["correct_mask"] == 0b10
+    assert questions[1]["topic"] == "T1" and questions[1]["difficulty"] == "easy"
+
+
+def test_bad_rows_are_reported_by_line_and_nothing_is_written(conn, test_id):
+    report = import_questions(conn, test_id, csv_bytes("Q1,a,b,c,d,1", "Q2,a,b,c,d,9", "Q3,a,,c,d,1", "Q4,a,b,c,d,2"))
+    assert not report.ok
+    assert [line for line, _ in report.errors] == [3, 4]
+    assert report.inserted == 0
+    assert stored(conn, test_id) == []
+
+
+def test_empty_file_is_an_error(conn, test_id):
+    report = import_questions(conn, test_id, csv_bytes())
+    assert report.errors and "empty" in report.errors[0][1]
+
+
+def test_non_utf8_file_is_an_error(conn, test_id):
+    report = import_questions(conn, test_id, io.BytesIO(b"Q1,a,b,c,d,1\n\xff\xfe,a,b,c,d,1\n"))
+    assert report.errors and "Unreadable" in report.errors[0][1]
+    assert stored(conn, test_id) == []
+
+
+def test_skip_duplicates_within_the_file_and_the_test(conn, test_id):
+    import_questions(conn, test_id, csv_bytes("Q1,a,b,c,d,1"))
+    report = import_questions(conn, test_id, csv_bytes("Q1,a,b,c,d,1", "Q2,a,b,c,d,2", "Q2,a,b,c,d,2"),
+                              skip_duplicates=True)
+    assert report.inserted == 1 and report.skipped == 2
+    assert [q["question_text"] for q in stored(conn, test_id)] == ["Q1", "Q2"]
+
+
+def test_dry_run_validates_without_writing(conn, test_id):
+    report = import_questions(conn, test_id, csv_bytes("Q1,a,b,c,d,1"), dry_run=True)
+    assert report.ok and report.inserted == 1
+    assert stored(conn, test_id) == []
+
+
+def test_raising_from_on_chunk_rolls_the_import_back(conn, test_id):
+    def stop():
+        raise RuntimeError("cancelled")
+
+    with pytest.raises(RuntimeError):
+        import_questions(conn, test_id, csv_bytes(*[f"Q{i},a,b,c,d,1" for i in range(5)]), chunk_size=2,
+                         on_chunk=stop)
+    assert stored(conn, test_id) == []
+
+
+def test_upload_route_imports_through_a_background_job(app, quiz, trainer, conn, test_id):
+    resp = trainer.post(f"/trainer/upload/{test_id}", data={
+        "csv_file": (csv_bytes("Q1,a,b,c,d,1", "Q2,a,b,c,d,2;3"), "bank.csv")})
+    assert resp.status_code == 302 and "/trainer/jobs" in resp.headers["Location"]
+    assert quiz.run_jobs() == 1
+    job = app.job_runner.recent(conn, test_id)[0]
+    assert job["status"] == "done" and job["result"]["inserted"] == 2
+    assert len(stored(conn, test_id)) == 2
+    assert app.question_banks.get(conn, test_id).correct_mask(
+        conn.execute("SELECT id FROM questions WHERE question_text = 'Q2'").fetchone()[0]) == 0b110
+
+
+def test_failed_upload_job_keeps_the_errors(app, quiz, trainer, conn, test_id):
+    trainer.post(f"/trainer/upload/{test_id}", data={"csv_file": (csv_bytes("Q1,a,b,c,d,7"), "bank.csv")})
+    quiz.run_jobs()
+    job = app.job_runner.recent(conn, test_id)[0]
+    assert job["status"] == "failed"
+    assert job["result"]["errors"] == ["Line 2: Invalid correct index '7' for question 'Q1'"]
+    assert stored(conn, test_id) == []
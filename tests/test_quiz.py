@@ -0,0 +1,186 @@
+# tests/test_quiz.py
+"""The trainee flow: server-side sessions, bitmask grading and exactly-once submission."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from quiz_sessions import MemorySessionStore, SQLiteSessionStore
+from submission_writer import SubmissionError
+
+
+@pytest.fixture
+def test_id(quiz):
+    test_id = quiz.test("QUIZ01")
+    quiz.trainee("E1")
+    return test_id
+
+
+def results(conn):
+    return [tuple(r) for r in conn.execute("SELECT score, total, trainee_emp_id FROM results")]
+
+
+# ---------------- Session stores
+def test_memory_store_claims_once_and_expires():
+    store = MemorySessionStore(sweep_interval=0)
+    sid = store.create({"a": 1}, ttl_seconds=60)
+    assert store.get(sid) == {"a": 1}
+    assert store.claim(sid) == {"a": 1}
+    assert store.claim(sid) is None and store.get(sid) is None
+    expired = store.create({"b": 2}, ttl_seconds=-1)
+    assert store.get(expired) is None
+    store.create({"c": 3}, ttl_seconds=-1)
+    assert store.sweep() == 1
+
+
+def test_sqlite_store_is_shared_across_processes(app):
+    # two stores on one database stand in for two worker processes
+    one = SQLiteSessionStore(app.db_writer_pool, app.db_reader_pool, sweep_interval=0)
+    two = SQLiteSessionStore(app.db_writer_pool, app.db_reader_pool, sweep_interval=0)
+    sid = one.create({"quiz": 1}, ttl_seconds=60)
+    assert two.get(sid) == {"quiz": 1}
+    assert two.claim(sid) == {"quiz": 1}
+    assert one.claim(sid) is None
+    one.create({"quiz": 2}, ttl_seconds=-1)
+    assert two.sweep() == 1
+
+
+# ---------------- Quiz start
+def test_cookie_only_carries_the_session_id(app, quiz, client, test_id):
+    resp = quiz.start(client, "QUIZ01", "e1")  # Employee IDs match case-insensitively
+    assert resp.status_code == 200
+    with client.session_transaction() as s:
+        assert set(s) - {"_flashes"} == {"trainee", "quiz_sid"}
+    sq = quiz.session(client)
+    assert sq["test_id"] == test_id and len(sq["question_ids"]) == 5
+    assert sq["trainee"]["emp_id"] == "E1"
+
+
+def test_refresh_resumes_the_same_questions(quiz, client, test_id):
+    quiz.start(client, "QUIZ01", "E1")
+    first = quiz.session(client)
+    resp = client.get("/quiz/start/QUIZ01")
+    assert resp.status_code == 200
+    assert quiz.session(client) == first
+    assert quiz.count("attempts") == 1
+
+
+def test_unregistered_trainee_is_turned_away(quiz, client, test_id):
+    resp = client.post("/exam/QUIZ01", data={"emp_id": "NOPE"})
+    assert b"Employee ID not registered" in resp.data
+    assert client.get("/quiz/start/QUIZ01").status_code == 302
+
+
+# ---------------- Grading
+def test_all_correct_scores_full_marks(quiz, client, conn, test_id):
+    resp = quiz.take(client, "QUIZ01", "E1")
+    assert resp.status_code == 200 and b"5" in resp.data
+    assert results(conn) == [(5, 5, "E1")]
+    masks = conn.execute("SELECT ra.selected_mask, q.correct_mask, ra.is_correct FROM result_answers ra "
+                         "JOIN questions q ON q.id = ra.question_id").fetchall()
+    assert all(selected == key and ok == 1 for selected, key, ok in masks)
+
+
+def test_partial_multiple_answer_is_wrong(quiz, client, conn, test_id):
+    quiz.start(client, "QUIZ01", "E1")
+    sq = quiz.session(client)
+    form = quiz.answers(sq)
+    multi = conn.execute("SELECT id FROM questions WHERE correct = '1;2'").fetchone()[0]
+    form[f"q_{multi}"] = ["1"]
+    quiz.submit(client, "QUIZ01", form)
+    assert results(conn) == [(4, 5, "E1")]
+    assert tuple(conn.execute("SELECT selected_mask, is_correct FROM result_answers WHERE question_id = ?",
+                              (multi,)).fetchone()) == (0b1, 0)
+
+
+def test_shuffled_options_are_graded_in_bank_order(quiz, client, conn):
+    quiz.test("SHUF01", shuffle_options=1)
+    quiz.trainee("E1")
+    quiz.start(client, "SHUF01", "E1")
+    sq = quiz.session(client)
+    assert len(sq["option_orders"]) == 5
+    quiz.submit(client, "SHUF01", quiz.answers(sq))
+    assert results(conn) == [(5, 5, "E1")]
+
+
+def test_wrong_answers_score_zero(quiz, client, conn, test_id):
+    quiz.take(client, "QUIZ01", "E1", correct=False)
+    assert results(conn) == [(0, 5, "E1")]
+
+
+def test_empty_submission_before_the_deadline_is_refused(quiz, client, conn, test_id):
+    quiz.start(client, "QUIZ01", "E1")
+    resp = quiz.submit(client, "QUIZ01", {})
+    assert resp.status_code == 302 and "/quiz/start/QUIZ01" in resp.headers["Location"]
+    assert results(conn) == []
+    assert quiz.session(client) is not None
+
+
+def test_empty_submission_after_the_deadline_is_recorded(quiz, client, conn, test_id):
+    quiz.start(client, "QUIZ01", "E1")
+    # within SUBMIT_GRACE_SECONDS of the deadline the session is still claimable
+    quiz.session(client)["deadline"] = (datetime.utcnow() - timedelta(seconds=1)).isoformat()
+    assert quiz.submit(client, "QUIZ01", {}).status_code == 200
+    assert results(conn) == [(0, 5, "E1")]
+
+
+def test_empty_auto_submit_is_recorded(quiz, client, conn, test_id):
+    quiz.start(client, "QUIZ01", "E1")
+    assert quiz.submit(client, "QUIZ01", {"auto_submitted": "1"}).status_code == 200
+    assert results(conn) == [(0, 5, "E1")]
+
+
+def test_expired_session_is_rejected(app, quiz, client, conn, test_id):
+    quiz.start(client, "QUIZ01", "E1")
+    form = quiz.answers(quiz.session(client))
+    conn.execute("UPDATE quiz_sessions SET expires_at = ?", ((datetime.utcnow() - timedelta(seconds=1)).isoformat(),))
+    conn.commit()
+    app.quiz_sessions._entries.clear()
+    resp = quiz.submit(client, "QUIZ01", form)
+    assert resp.status_code == 302
+    assert results(conn) == []
+
+
+# ---------------- Exactly once
+def test_double_submit_records_one_attempt(quiz, client, conn, test_id):
+    quiz.start(client, "QUIZ01", "E1")
+    form = quiz.answers(quiz.session(client))
+    assert quiz.submit(client, "QUIZ01", form).status_code == 200
+    resp = quiz.submit(client, "QUIZ01", form)
+    assert resp.status_code == 302
+    assert len(results(conn)) == 1
+
+
+def test_replayed_submission_records_nothing(app, quiz, client, conn, test_id):
+    quiz.start(client, "QUIZ01", "E1")
+    sq = quiz.session(client)
+    quiz.submit(client, "QUIZ01", quiz.answers(sq))
+    version = app.repo.dashboard_version(conn, test_id)
+    stats = tuple(app.repo.test_stats(conn, test_id))
+    # the same attempt replayed past claim(), e.g. from another worker's memory store
+    replay = {"test_id": test_id, "attempted_at": datetime.utcnow().isoformat(), "score": 5, "total": 5,
+              "trainee_id": sq["trainee"]["id"], "trainee_emp_id": "E1", "trainee_name": "Trainee E1",
+              "answers": [], "question_results": [], "session_key": sq["session_key"]}
+    assert app.submission_writer.write(replay, app.db_writer_pool.open_connection) is None
+    assert len(results(conn)) == 1
+    assert app.repo.dashboard_version(conn, test_id) == version
+    assert tuple(app.repo.test_stats(conn, test_id)) == stats
+    assert quiz.count("result_answers") == 5
+
+
+def test_failed_write_gives_the_session_back(app, quiz, client, conn, test_id, monkeypatch):
+    quiz.start(client, "QUIZ01", "E1")
+    sq = quiz.session(client)
+    form = quiz.answers(sq)
+
+    def fail(item, fallback_connect):
+        raise SubmissionError("database is locked")
+
+    with monkeypatch.context() as m:
+        m.setattr(app.submission_writer, "write", fail)
+        resp = quiz.submit(client, "QUIZ01", form)
+    assert resp.status_code == 302 and "/quiz/start/QUIZ01" in resp.headers["Location"]
+    assert quiz.session(client) == sq
+    # the same attempt goes through on the second try
+    assert quiz.submit(client, "QUIZ01", form).status_code == 200
+    assert results(conn) == [(5, 5, "E1")]
+    assert quiz.count("attempts") == 1
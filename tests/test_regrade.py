@@ -0,0 +1,105 @@
+# tests/test_regrade.py
+import pytest
+
+from regrade import _grade_python, regrade_question, regrade_test
+
+
+def aggregates(conn, test_id):
+    """Every aggregate a regrade has to keep in step, as plain tuples."""
+    queries = [
+        ("SELECT id, score FROM results WHERE test_id = ? ORDER BY id", (test_id,)),
+        ("SELECT * FROM test_stats WHERE test_id = ?", (test_id,)),
+        ("SELECT question_id, attempts, correct FROM question_stats WHERE test_id = ? ORDER BY question_id", (test_id,)),
+        ("SELECT * FROM trainee_test_stats WHERE test_id = ? ORDER BY trainee_id", (test_id,)),
+        ("SELECT * FROM trainee_stats ORDER BY trainee_id", ()),
+    ]
+    return [[tuple(r) for r in conn.execute(sql, params)] for sql, params in queries]
+
+
+@pytest.fixture
+def test_id(quiz, client):
+    test_id = quiz.test("RG0001", keys=("1", "2", "3"))
+    for emp_id, correct in (("E1", True), ("E2", False), ("E3", True)):
+        quiz.trainee(emp_id)
+        quiz.take(client, "RG0001", emp_id, correct)
+    return test_id
+
+
+def test_python_grading():
+    correct, scores = _grade_python(2, [0, 0, 1], [1, 2, 0], [1, 4, 0])
+    # an unanswered question (mask 0) is never correct, even against a 0 key
+    assert correct == [1, 0, 0] and scores == [1, 0]
+
+
+def test_regrade_test_rescores_after_a_key_fix(quiz, conn, test_id):
+    conn.execute("UPDATE questions SET correct_mask = 4, correct = '3' WHERE test_id = ? AND correct = '1'",
+                 (test_id,))
+    conn.commit()
+    report = regrade_test(conn, test_id)
+    assert (report.attempts, report.answers) == (3, 9)
+    assert (report.changed_answers, report.changed_scores) == (2, 2)
+    scores = [r[0] for r in conn.execute("SELECT score FROM results ORDER BY id")]
+    assert scores == [2, 0, 2]
+    assert regrade_test(conn, test_id).changed_answers == 0
+
+
+def test_key_edit_regrades_in_a_background_job(app, quiz, trainer, conn, test_id):
+    question_id = conn.execute("SELECT id FROM questions WHERE test_id = ? AND correct = '2'", (test_id,)).fetchone()[0]
+    resp = trainer.post(f"/trainer/question/edit/{question_id}", data={
+        "question_text": "Edited", "option1": "A", "option2": "B", "option3": "C", "option4": "D",
+        "correct": "2;3", "topic": "", "difficulty": ""})
+    assert resp.status_code == 302
+    version = app.repo.dashboard_version(conn, test_id)
+    assert quiz.run_jobs() == 1
+    job = conn.execute("SELECT status, result FROM jobs").fetchone()
+    assert job["status"] == "done"
+    assert app.repo.dashboard_version(conn, test_id) > version
+    assert [r[0] for r in conn.execute("SELECT score FROM results ORDER BY id")] == [2, 0, 2]
+
+    # the incremental deltas agree with recomputing everything from scratch
+    incremental = aggregates(conn, test_id)
+    app.rebuild_stats(conn)
+    assert aggregates(conn, test_id) == incremental
+
+
+def test_submission_graded_against_a_stale_bank_keeps_the_committed_key(app, quiz, client, conn, test_id):
+    quiz.trainee("E4")
+    quiz.start(client, "RG0001", "E4")
+    form = quiz.answers(quiz.session(client))
+    # the key changes behind the cached bank, as it does for another worker process
+    conn.execute("UPDATE questions SET correct_mask = 4, correct = '3' WHERE test_id = ? AND correct = '1'",
+                 (test_id,))
+    conn.commit()
+    resp = quiz.submit(client, "RG0001", form)
+    # the bank would have given 3; the writer regraded against the committed key
+    assert b"<strong>2</strong> / <strong>3</strong>" in resp.data
+    assert [r[0] for r in conn.execute("SELECT score FROM results ORDER BY id")] == [3, 0, 3, 2]
+    incremental = aggregates(conn, test_id)
+    app.rebuild_stats(conn)
+    assert aggregates(conn, test_id) == incremental
+
+
+def test_regrade_picks_up_attempts_committed_after_its_snapshot(app, quiz, client, conn, test_id, monkeypatch):
+    question_id = conn.execute("SELECT id FROM questions WHERE test_id = ? AND correct = '2'", (test_id,)).fetchone()[0]
+    conn.execute("UPDATE questions SET correct_mask = 6, correct = '2;3' WHERE id = ?", (question_id,))
+    conn.commit()
+    quiz.trainee("E4")
+    # E4 is graded against the bank cached before the edit and written without the in-transaction check
+    monkeypatch.setattr(app.repo, "regrade_submission", lambda cur, sub: None)
+
+    def late_attempt(processed, total):
+        if processed == 1:
+            quiz.take(client, "RG0001", "E4")
+
+    read_conn, write_conn = app.db_reader_pool.open_connection(), app.db_writer_pool.open_connection()
+    write_conn.isolation_level = None
+    try:
+        regrade_question(read_conn, write_conn, test_id, question_id, 6, app.apply_regrade_chunk, chunk_size=1,
+                         progress=late_attempt)
+    finally:
+        read_conn.close()
+        write_conn.close()
+    assert [r[0] for r in conn.execute("SELECT score FROM results ORDER BY id")] == [2, 0, 2, 3]
+    incremental = aggregates(conn, test_id)
+    app.rebuild_stats(conn)
+    assert aggregates(conn, test_id) == incremental
@@ -0,0 +1,67 @@
+# tests/test_repository.py
+import pytest
+
+from repository import DuplicateError, Repository, SQLiteRepository, open_repository, score_bucket
+
+
+def test_score_buckets():
+    assert [score_bucket(s, 4) for s in (4, 3, 2, 1)] == ["100", "75plus", "50to75", "below50"]
+    assert score_bucket(0, 0) == "below50"
+
+
+def test_a_backend_must_implement_migrate():
+    class NoMigrate(Repository):
+        backend = "none"
+
+    with pytest.raises(TypeError):
+        NoMigrate()
+
+
+def test_duplicate_test_code(app, conn):
+    app.repo.create_test(conn, "DUP001", "One", "", 10)
+    with pytest.raises(DuplicateError):
+        app.repo.create_test(conn, "DUP001", "Two", "", 10)
+    # the failed insert left the connection usable
+    assert app.repo.test_code_exists(conn, "DUP001")
+
+
+def test_duplicate_trainee_and_case_insensitive_lookup(app, conn):
+    trainee_id = app.repo.add_trainee(conn, "AbC1", "Someone")
+    with pytest.raises(DuplicateError):
+        app.repo.add_trainee(conn, "AbC1", "Someone Else")
+    assert app.repo.find_trainee(conn, "abc1")["id"] == trainee_id
+    assert app.repo.find_trainee(conn, "ABC1")["id"] == trainee_id
+
+
+def test_update_test_refuses_unknown_columns(app, conn):
+    test_id = app.repo.create_test(conn, "UPD001", "One", "", 10)
+    version = app.repo.dashboard_version(conn, test_id)
+    with pytest.raises(ValueError):
+        app.repo.update_test(conn, test_id, {"id": 5})
+    app.repo.update_test(conn, test_id, {"name": "Renamed"})
+    assert app.repo.get_test(conn, test_id)["name"] == "Renamed"
+    assert app.repo.dashboard_version(conn, test_id) == version + 1
+
+
+def test_delete_questions_reports_the_affected_tests(quiz, app, conn):
+    test_id = quiz.test("DELQ01", keys=("1", "2"))
+    ids = [q["id"] for q in app.repo.list_questions(conn, test_id)]
+    assert app.repo.delete_questions(conn, ids[:1]) == ([test_id], 1)
+    assert [q["id"] for q in app.repo.list_questions(conn, test_id)] == ids[1:]
+
+
+def test_delete_test_cascades(quiz, app, client, conn):
+    test_id = quiz.test("DELT01")
+    quiz.trainee("E1")
+    quiz.take(client, "DELT01", "E1")
+    app.repo.delete_test(conn, test_id)
+    for table in ("questions", "results", "result_answers", "attempts", "test_stats", "question_stats",
+                  "trainee_test_stats", "trainee_stats"):
+        assert quiz.count(table) == 0, table
+
+
+def test_open_repository(tmp_path):
+    repo = open_repository("sqlite", str(tmp_path / "r.db"), writers=1, readers=1)
+    assert isinstance(repo, SQLiteRepository) and repo.backend == "sqlite"
+    with pytest.raises(ValueError):
+        open_repository("oracle", str(tmp_path / "r.db"))
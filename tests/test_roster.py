@@ -0,0 +1,79 @@
+# tests/test_roster.py
+import io
+import json
+
+from roster import export_roster, import_roster, roster_format
+
+
+def roster(text):
+    return io.BytesIO(text.encode())
+
+
+def names(conn):
+    return dict(conn.execute("SELECT emp_id, name FROM trainees").fetchall())
+
+
+def test_roster_format_from_extension():
+    assert roster_format("cohort.JSONL") == "jsonl"
+    assert roster_format("cohort.ndjson") == "jsonl"
+    assert roster_format("cohort.csv") == "csv"
+    assert roster_format("cohort.csv", "jsonl") == "jsonl"
+
+
+def test_csv_import_inserts_and_renames(app, conn):
+    import_roster(conn, roster("emp_id,name\nE1,One\nE2,Two\n"))
+    report = import_roster(conn, roster("E2,Two Renamed\nE3,Three\n"), batch_size=1)
+    assert (report.rows, report.inserted, report.updated) == (2, 1, 1)
+    assert names(conn) == {"E1": "One", "E2": "Two Renamed", "E3": "Three"}
+
+
+def test_emp_id_case_does_not_duplicate_trainees(app, conn):
+    app.repo.add_trainee(conn, "AbC1", "Mixed")
+    report = import_roster(conn, roster("abc1,Lower\nE9,Nine\ne9,Nine Again\n"))
+    assert (report.inserted, report.updated) == (1, 2)
+    assert names(conn) == {"AbC1": "Lower", "E9": "Nine Again"}
+
+
+def test_invalid_rows_are_skipped_and_reported(app, conn):
+    report = import_roster(conn, roster("E1,One\nE-2,Dash\nE3\nE4,\nE5,Five\n"))
+    assert report.inserted == 2
+    assert [line for line, _ in report.errors] == [2, 3, 4]
+    assert names(conn) == {"E1": "One", "E5": "Five"}
+
+
+def test_jsonl_import(app, conn):
+    report = import_roster(conn, roster('{"emp_id": "J1", "name": "Jay"}\nnot json\n\n{"emp_id": "J2"}\n'), "jsonl")
+    assert report.inserted == 1
+    assert report.errors == [(2, "Invalid JSON object"), (4, "Both Employee ID and name are required")]
+
+
+def test_non_utf8_roster_is_reported(app, conn):
+    report = import_roster(conn, io.BytesIO(b"E1,One\n\xff,x\n"))
+    assert report.errors and "UTF-8" in report.errors[-1][1]
+
+
+def test_export_streams_the_roster(app, conn):
+    import_roster(conn, roster("E1,One\nE2,\"Two, Jr\"\n"))
+    csv_text = "".join(export_roster(conn, "csv", batch_size=1))
+    lines = csv_text.splitlines()
+    assert lines[0] == "emp_id,name,created_at"
+    assert lines[2].startswith('E2,"Two, Jr",')
+    records = [json.loads(line) for line in "".join(export_roster(conn, "jsonl")).splitlines()]
+    assert [r["emp_id"] for r in records] == ["E1", "E2"]
+
+
+def test_export_imports_back_unchanged(app, conn):
+    import_roster(conn, roster("E1,One\nE2,Two\n"))
+    exported = "".join(export_roster(conn, "jsonl"))
+    report = import_roster(conn, roster(exported), "jsonl")
+    assert (report.inserted, report.updated, report.errors) == (0, 2, [])
+
+
+def test_import_and_export_routes(app, trainer, conn):
+    resp = trainer.post("/trainer/trainees/import", data={"roster_file": (roster("E1,One\nE2,Two\n"), "r.csv")})
+    assert resp.status_code == 302
+    assert names(conn) == {"E1": "One", "E2": "Two"}
+    resp = trainer.get("/trainer/trainees/export?format=jsonl")
+    assert resp.mimetype == "application/x-ndjson"
+    assert len(resp.get_data(as_text=True).splitlines()) == 2
+    assert trainer.get("/trainer/trainees/export?format=xml").status_code == 400
@@ -0,0 +1,83 @@
+# tests/test_sampling.py
+import random
+
+import pytest
+
+from question_cache import QuestionBank
+from sampling import SamplingConfig, _allocate, draw_positions, draw_rng, option_orders, present, remap_mask
+
+
+def bank(topics):
+    rows = [{"id": i + 1, "question_text": f"Q{i}", "option1": "a", "option2": "b", "option3": "c", "option4": "d",
+             "correct_mask": 1, "is_multiple": 0, "topic": topic, "difficulty": None}
+            for i, topic in enumerate(topics)]
+    return QuestionBank(1, rows)
+
+
+def test_allocate_is_proportional_and_capped():
+    assert _allocate([6, 3, 1], 5) == [3, 2, 0] or sum(_allocate([6, 3, 1], 5)) == 5
+    assert _allocate([6, 3, 1], 10) == [6, 3, 1]
+    quotas = _allocate([1, 1, 8], 4)
+    assert sum(quotas) == 4 and quotas[2] >= 3
+
+
+def test_plain_draw_picks_distinct_questions():
+    b = bank([None] * 20)
+    positions = draw_positions(b, SamplingConfig(question_count=7), random.Random(1))
+    assert len(positions) == len(set(positions)) == 7
+    assert len(draw_positions(b, SamplingConfig(question_count=50), random.Random(1))) == 20
+
+
+def test_stratified_draw_follows_the_topic_shares():
+    b = bank(["a"] * 10 + ["b"] * 5 + ["c"] * 5)
+    positions = draw_positions(b, SamplingConfig(question_count=8, stratify_by="topic"), random.Random(3))
+    topics = [b.topics[i] for i in positions]
+    assert (topics.count("a"), topics.count("b"), topics.count("c")) == (4, 2, 2)
+
+
+def test_seeded_draw_is_stable_per_trainee():
+    config = SamplingConfig(question_count=5, shuffle_options=True, seeded_draw=True)
+    b = bank([None] * 30)
+
+    def draw(trainee_id):
+        rng = draw_rng(config, 1, trainee_id)
+        positions = draw_positions(b, config, rng)
+        return positions, option_orders(config, len(positions), rng)
+
+    assert draw(7) == draw(7)
+    assert draw(7) != draw(8)
+
+
+def test_option_orders_only_when_shuffling():
+    assert option_orders(SamplingConfig(), 3, random.Random()) is None
+    orders = option_orders(SamplingConfig(shuffle_options=True), 3, random.Random(0))
+    assert len(orders) == 3 and all(sorted(o) == [0, 1, 2, 3] for o in orders)
+
+
+@pytest.mark.parametrize("order", [[0, 1, 2, 3], [3, 2, 1, 0], [2, 0, 3, 1]])
+def test_remap_mask_inverts_the_displayed_order(order):
+    question = present({"options": ["A", "B", "C", "D"]}, order)
+    for shown in range(4):
+        # ticking the displayed option selects the bank option at order[shown]
+        assert remap_mask(1 << shown, order) == 1 << order[shown]
+        assert question["options"][shown] == "ABCD"[order[shown]]
+    assert remap_mask(0b0101, None) == 0b0101
+
+
+def test_from_test_falls_back_to_defaults():
+    config = SamplingConfig.from_test({"question_count": None, "stratify_by": "colour", "shuffle_options": None,
+                                       "seeded_draw": 1})
+    assert (config.question_count, config.stratify_by, config.shuffle_options, config.seeded_draw) == (5, None, False, True)
+
+
+def test_quiz_uses_the_test_sampling_settings(quiz, client):
+    test_id = quiz.test("SAMP01", keys=["1"] * 12, question_count=3, seeded_draw=1)
+    quiz.trainee("E1")
+    quiz.start(client, "SAMP01", "E1")
+    first = quiz.session(client)["question_ids"]
+    assert len(first) == 3
+    quiz.submit(client, "SAMP01", quiz.answers(quiz.session(client)))
+    # a seeded draw gives the same trainee the same questions on the next attempt
+    quiz.start(client, "SAMP01", "E1")
+    assert quiz.session(client)["question_ids"] == first
+    assert quiz.session(client)["test_id"] == test_id
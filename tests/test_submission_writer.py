@@ -0,0 +1,156 @@
+# tests/test_submission_writer.py
+import time
+import sqlite3
+import threading
+
+import pytest
+
+from submission_writer import GroupCommitWriter, SubmissionError
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "writer.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, value INTEGER UNIQUE)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def connect_to(path):
+    return lambda: sqlite3.connect(path, check_same_thread=False)
+
+
+def insert_value(cur, item):
+    return cur.execute("INSERT INTO items (value) VALUES (?) RETURNING id", (item,)).fetchone()[0]
+
+
+def stored(path):
+    conn = sqlite3.connect(path)
+    try:
+        return sorted(r[0] for r in conn.execute("SELECT value FROM items"))
+    finally:
+        conn.close()
+
+
+def write_concurrently(writer, items, fallback):
+    results, errors = {}, {}
+
+    def submit(item):
+        try:
+            results[item] = writer.write(item, fallback)
+        except SubmissionError as e:
+            errors[item] = e
+
+    threads = [threading.Thread(target=submit, args=(item,)) for item in items]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+
+def test_queued_submissions_share_one_commit(db_path):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_first(cur, item):
+        if item == 0:
+            started.set()
+            release.wait(5)
+        return insert_value(cur, item)
+
+    writer = GroupCommitWriter(connect_to(db_path), slow_first, batch_size=64)
+    first, _, _ = write_concurrently(writer, [0], connect_to(db_path))
+    assert started.wait(5)
+    # nine more arrive while the first batch is still open
+    rest, _, _ = write_concurrently(writer, range(1, 10), connect_to(db_path))
+    deadline = time.monotonic() + 5
+    while writer._queue.qsize() < 9 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in first + rest:
+        t.join(5)
+    writer.close()
+
+    assert stored(db_path) == list(range(10))
+    stats = writer.stats()
+    assert stats["items"] == 10 and stats["batches"] == 2 and stats["batch_size_max"] == 9
+
+
+def test_a_failing_submission_does_not_sink_its_batch(db_path):
+    committed = []
+    writer = GroupCommitWriter(connect_to(db_path), insert_value,
+                               on_commit=lambda item, result: committed.append(item))
+    writer.write(1, connect_to(db_path))
+    # the UNIQUE constraint rejects a second 1
+    with pytest.raises(SubmissionError):
+        writer.write(1, connect_to(db_path))
+    assert writer.write(2, connect_to(db_path)) is not None
+    writer.close()
+    assert stored(db_path) == [1, 2]
+    assert committed == [1, 2]
+    assert writer.stats()["failed"] == 1
+
+
+def test_disabled_writer_writes_inline(db_path):
+    fallbacks = []
+
+    def fallback():
+        conn = sqlite3.connect(db_path)
+        fallbacks.append(conn)
+        return conn
+
+    writer = GroupCommitWriter(connect_to(db_path), insert_value, enabled=False)
+    assert writer.write(7, fallback) == 1
+    assert stored(db_path) == [7]
+    assert len(fallbacks) == 1 and writer.stats()["sync_writes"] == 1
+    with pytest.raises(SubmissionError):
+        writer.write(7, fallback)
+    assert writer.stats()["sync_writes"] == 2
+
+
+def test_any_exception_fails_only_its_own_submission(db_path):
+    def buggy(cur, item):
+        if item == 2:
+            raise KeyError("not a driver error")
+        return insert_value(cur, item)
+
+    writer = GroupCommitWriter(connect_to(db_path), buggy)
+    threads, results, errors = write_concurrently(writer, [1, 2, 3], connect_to(db_path))
+    for t in threads:
+        t.join(5)
+    assert not any(t.is_alive() for t in threads)
+    assert sorted(results) == [1, 3] and list(errors) == [2]
+    # the writer thread survived and keeps committing
+    assert writer.write(4, connect_to(db_path)) is not None
+    writer.close()
+    assert stored(db_path) == [1, 3, 4]
+
+    inline = GroupCommitWriter(connect_to(db_path), buggy, enabled=False)
+    with pytest.raises(SubmissionError):
+        inline.write(2, connect_to(db_path))
+
+
+def test_failed_commit_rolls_back_and_releases_everyone(db_path):
+    class FailingCommit(sqlite3.Connection):
+        def cursor(self, *args):
+            return FailingCursor(self)
+
+    class FailingCursor(sqlite3.Cursor):
+        def execute(self, sql, *args):
+            if sql == "COMMIT":
+                raise RuntimeError("disk went away")
+            return super().execute(sql, *args)
+
+    connections = []
+
+    def connect():
+        conn = sqlite3.connect(db_path, check_same_thread=False, factory=FailingCommit)
+        connections.append(conn)
+        return conn
+
+    writer = GroupCommitWriter(connect, insert_value, ack_timeout=5)
+    with pytest.raises(SubmissionError, match="disk went away"):
+        writer.write(1, connect_to(db_path))
+    assert not connections[0].in_transaction
+    writer.close()
+    assert stored(db_path) == []
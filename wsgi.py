@@ -0,0 +1,100 @@
+# wsgi.py
+"""Production entry point.
+
+    python wsgi.py
+
+Migrates the database (SQLite or, with QUIZ_DB_BACKEND=postgres, the
+server database) once, then serves app:app with gunicorn (pre-fork
+workers, each running gthread request threads) when it is installed, or
+with waitress (one process, a thread pool) otherwise, e.g. on Windows.
+Configured through the environment:
+
+- QUIZ_SERVER: "gunicorn" or "waitress" (default: gunicorn if importable)
+- QUIZ_BIND: host:port to listen on (default 0.0.0.0:8000)
+- QUIZ_WORKERS: gunicorn worker processes (default: CPU count)
+- QUIZ_THREADS: request threads per worker (default 8); every open live
+  results stream holds one
+- QUIZ_TIMEOUT: seconds before gunicorn restarts a silent worker (default 60)
+
+Workers are forked before the app is imported, so each builds its own
+connection pools and background threads. Running gunicorn directly
+(`gunicorn -k gthread -w 4 --threads 8 app:app`) also works; each worker
+then checks the schema version itself under the same migration lock
+(a pg_advisory_lock on PostgreSQL).
+"""
+import os
+import sys
+
+from init_db import DB_PATH
+from repository import open_repository
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # not available on Windows; waitress is used instead
+    BaseApplication = None
+
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
+
+def server_options():
+    host, _, port = os.environ.get("QUIZ_BIND", "0.0.0.0:8000").rpartition(":")
+    return {
+        "server": os.environ.get("QUIZ_SERVER") or ("gunicorn" if BaseApplication is not None else "waitress"),
+        "host": host or "0.0.0.0",
+        "port": int(port),
+        "workers": int(os.environ.get("QUIZ_WORKERS", str(os.cpu_count() or 1))),
+        "threads": int(os.environ.get("QUIZ_THREADS", "8")),
+        "timeout": int(os.environ.get("QUIZ_TIMEOUT", "60")),
+    }
+
+
+if BaseApplication is not None:
+    class QuizApplication(BaseApplication):
+        """gunicorn configured from server_options(); the app is loaded in each worker."""
+
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            self.cfg.set("bind", f"{self.options['host']}:{self.options['port']}")
+            self.cfg.set("workers", self.options["workers"])
+            self.cfg.set("threads", self.options["threads"])
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("timeout", self.options["timeout"])
+            # never preload: the pools and writer threads must be created after the fork
+            self.cfg.set("preload_app", False)
+
+        def load(self):
+            from app import app
+            return app
+
+
+def main():
+    options = server_options()
+    # no pools are opened here; the forked workers build their own
+    repo = open_repository(os.environ.get("QUIZ_DB_BACKEND", "sqlite"), DB_PATH,
+                           os.environ.get("QUIZ_DATABASE_URL", ""))
+    version = repo.migrate(verbose=True)
+    print(f"Schema at version {version}; serving on {options['host']}:{options['port']} with {options['server']}.")
+    # the workers find the schema current; skip even the version check on import
+    os.environ["QUIZ_MIGRATE_ON_IMPORT"] = "0"
+
+    if options["server"] == "gunicorn":
+        if BaseApplication is None:
+            sys.exit("QUIZ_SERVER=gunicorn but gunicorn is not installed (pip install gunicorn).")
+        QuizApplication(options).run()
+    elif options["server"] == "waitress":
+        if waitress is None:
+            sys.exit("QUIZ_SERVER=waitress but waitress is not installed (pip install waitress).")
+        from app import app
+        waitress.serve(app, host=options["host"], port=options["port"], threads=options["threads"])
+    else:
+        sys.exit(f"Unknown QUIZ_SERVER {options['server']!r}; use gunicorn or waitress.")
+
+
+if __name__ == "__main__":
+    main()